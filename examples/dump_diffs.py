@@ -21,9 +21,9 @@ def process_file(base, diff, out):
 
         ms = Memscrimper(src_fileobj=fin, ref_filename=base, load=load, load_ref_data=load_ref_data)
         with open(dst, 'wb') as fout:
-            for page_num in ms.changed_pages:
-                page_bytes = ms.read_meta_page_num(page_num)
-                fout.write(page_bytes)
+            # batches of changed pages in address order, diffs applied to zero pages
+            for pages in ms.iter_changed_pages(order='address', meta=True):
+                fout.writelines(view for _, _, view in pages)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
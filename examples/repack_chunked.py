@@ -0,0 +1,35 @@
+#! /usr/bin/env python3
+
+"""
+Script to re-pack .compress files into the chunked container, so random reads
+of archived dumps only inflate the chunks they touch instead of the whole body.
+"""
+
+import argparse
+import os
+import os.path
+
+from memscrimper_parser.repack import ChunkedRepacker
+
+def process_file(repacker, src, out):
+    dst = os.path.join(out, os.path.basename(src))
+    print(f"repacking {src} to {dst}")
+    stats = repacker.repack(src, dst)
+    print(f"{stats['chunks']} chunks, {stats['body_size']} body bytes in {stats['file_size']} bytes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("src", nargs="+", help="compressed memory file(s)")
+    parser.add_argument("--out", help="output directory", default="chunked/")
+    parser.add_argument("--chunk-size", type=int, default=ChunkedRepacker.CHUNK_SIZE,
+                        help="decompressed bytes per chunk")
+    parser.add_argument("--inner", default=None,
+                        help="recompress with this inner method (gzip, bzip2, zip7, zstd, lz4, noinner)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+
+    inner = args.inner.encode() if args.inner is not None else None
+    repacker = ChunkedRepacker(chunk_size=args.chunk_size, inner=inner)
+    for src in args.src:
+        process_file(repacker, src, args.out)
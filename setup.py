@@ -9,6 +9,8 @@ setup(name='memscrimper-parser',
       author='Adam Pridgen',
       author_email='adam.pridgen.phd@gmail.com',
       install_requires=[],
+      extras_require={'numpy': ['numpy'], 'zstd': ['zstandard'], 'lz4': ['lz4'],
+                      'volatility': ['volatility3']},
       packages=find_packages('src'),
       package_dir={'': 'src'},
       dependency_links=[],
@@ -0,0 +1,121 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAVE_NUMPY = np is not None
+
+
+class Accel(object):
+    """Optional NumPy decoders, callers fall back to the pure Python parsers when disabled."""
+    ENABLED = HAVE_NUMPY
+    # below this many items the per-call NumPy overhead outweighs the Python loop
+    MIN_ITEMS = 64
+    # skipping walks log(n) times over the entries, it only beats the Python walk on long lists
+    MIN_SKIP_ITEMS = 1 << 19
+
+    @classmethod
+    def disable(cls):
+        Accel.ENABLED = False
+
+    @classmethod
+    def enable(cls):
+        Accel.ENABLED = HAVE_NUMPY
+
+    @classmethod
+    def use_for(cls, num_items: int, min_items: int = None) -> bool:
+        return cls.ENABLED and num_items >= (cls.MIN_ITEMS if min_items is None else min_items)
+
+    @classmethod
+    def _pagenr_positions(cls, buf, num_pagenrs: int):
+        """Returns (positions, widths, consumed) of num_pagenrs delta coded entries in buf."""
+        size = len(buf)
+        widths = np.where(buf & 0x80, 1, 4).astype(np.int64)
+
+        # entry starts depend on every width before them, so resolve them by
+        # pointer doubling: jumps[i] is where i lands after `filled` entries
+        jumps = np.empty(size + 1, dtype=np.int64)
+        jumps[:size] = np.minimum(np.arange(size, dtype=np.int64) + widths, size)
+        jumps[size] = size
+        positions = np.zeros(num_pagenrs, dtype=np.int64)
+        filled = 1
+        while filled < num_pagenrs:
+            cnt = min(filled, num_pagenrs - filled)
+            positions[filled:filled + cnt] = jumps[positions[:cnt]]
+            filled += cnt
+            if filled < num_pagenrs:
+                jumps = jumps[jumps]
+
+        last = int(positions[-1])
+        if last >= size or last + int(widths[last]) > size:
+            raise Exception("Invalid number of bytes for {} pagenrs, got {}".format(num_pagenrs, size))
+        return positions, widths, last + int(widths[last])
+
+    @classmethod
+    def skip_pagenr_list(cls, data, num_pagenrs: int) -> int:
+        """Returns the byte count of num_pagenrs delta coded entries in data without decoding them."""
+        if num_pagenrs == 0:
+            return 0
+        _, _, consumed = cls._pagenr_positions(np.frombuffer(data, dtype=np.uint8), num_pagenrs)
+        return consumed
+
+    @classmethod
+    def decode_pagenr_list(cls, data, num_pagenrs: int) -> (int, list):
+        """Decodes num_pagenrs delta coded entries (1 byte with the high bit set, else
+        4 bytes big endian) from data, which must not hold more than the entries.
+        Returns the consumed byte count and the page numbers."""
+        if num_pagenrs == 0:
+            return 0, []
+        buf = np.frombuffer(data, dtype=np.uint8)
+        size = len(buf)
+        positions, widths, consumed = cls._pagenr_positions(buf, num_pagenrs)
+
+        padded = np.zeros(size + 3, dtype=np.int64)
+        padded[:size] = buf
+        first = padded[positions]
+        long_values = (first << 24) | (padded[positions + 1] << 16) | (padded[positions + 2] << 8) | \
+                      padded[positions + 3]
+        values = np.where(first & 0x80, first & 0x7F, long_values)
+        pagenrs = np.cumsum(values + 1) - 1
+        return consumed, pagenrs.tolist()
+
+    # odd multipliers for page_fingerprints, fixed so fingerprints are comparable between runs
+    _FP_MULTIPLIERS = {}
+
+    @classmethod
+    def _multipliers(cls, num_words: int):
+        mults = cls._FP_MULTIPLIERS.get(num_words, None)
+        if mults is None:
+            rng = np.random.default_rng(0x6d656d73)
+            mults = rng.integers(0, 1 << 63, size=num_words, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+            cls._FP_MULTIPLIERS[num_words] = mults
+        return mults
+
+    @classmethod
+    def page_fingerprints(cls, data, page_size: int) -> list:
+        """64 bit fingerprints of the whole pages in data, a multiply-add over the page's
+        64 bit words.  Equal pages have equal fingerprints, callers verify matches."""
+        words = np.frombuffer(data, dtype=np.uint64, count=(len(data) // page_size) * (page_size // 8))
+        words = words.reshape(-1, page_size // 8)
+        return (words * cls._multipliers(page_size // 8)).sum(axis=1, dtype=np.uint64).tolist()
+
+    @classmethod
+    def changed_pages(cls, ref, target, page_size: int) -> list:
+        """Indexes of the pages that differ between two equally sized page aligned buffers."""
+        a = np.frombuffer(ref, dtype=np.uint64).reshape(-1, page_size // 8)
+        b = np.frombuffer(target, dtype=np.uint64).reshape(-1, page_size // 8)
+        return np.flatnonzero((a != b).any(axis=1)).tolist()
+
+    @classmethod
+    def diff_runs(cls, old, new, merge_gap: int, limit: int = None) -> list:
+        """[start, end) runs of differing bytes, runs less than merge_gap bytes apart are joined.
+        Returns None when more than limit bytes differ."""
+        idx = np.flatnonzero(np.frombuffer(old, dtype=np.uint8) != np.frombuffer(new, dtype=np.uint8))
+        if limit is not None and len(idx) > limit:
+            return None
+        if len(idx) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(idx) > merge_gap)
+        starts = idx[np.concatenate(([0], breaks + 1))]
+        ends = idx[np.concatenate((breaks, [len(idx) - 1]))] + 1
+        return list(zip(starts.tolist(), ends.tolist()))
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .interface import Memscrimper
+import asyncio
+import threading
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class AsyncMemscrimper(object):
+    """asyncio front end for a Memscrimper.
+
+    Loading, decompression and file reads run on a bounded thread pool, by
+    default one pool shared by every instance so hundreds of open dumps do not
+    mean hundreds of pools.  A Memscrimper is not thread safe (shared file
+    positions and page caches), so the calls for one instance are serialized
+    with an asyncio lock before they reach the pool, waiting requests do not
+    hold a worker while different dumps proceed in parallel.  Concurrent
+    requests for the same page or range share a single read, each caller
+    gets its own read only views of the shared buffer.
+
+        async with AsyncMemscrimper(src_filename=..., ref_filename=...) as ms:
+            page = await ms.read_page(10)
+    """
+    name = 'AsyncMemscrimper'
+    MAX_WORKERS = 8
+    _shared_executor = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, executor=None, **kwargs):
+        self.kwargs = kwargs
+        self.executor = executor
+        self.ms = None
+        self._lock = None
+        self._inflight = {}
+
+    @classmethod
+    def shared_executor(cls) -> ThreadPoolExecutor:
+        with cls._shared_lock:
+            if cls._shared_executor is None:
+                cls._shared_executor = ThreadPoolExecutor(max_workers=cls.MAX_WORKERS,
+                                                          thread_name_prefix=cls.name)
+            return cls._shared_executor
+
+    @classmethod
+    async def open(cls, executor=None, **kwargs) -> 'AsyncMemscrimper':
+        ams = cls(executor=executor, **kwargs)
+        await ams.load()
+        return ams
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        executor = self.executor or self.shared_executor()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        lock = self._lock
+        await lock.acquire()
+        try:
+            fut = loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+        except BaseException:
+            lock.release()
+            raise
+        # released when the worker is done with the Memscrimper, not when a cancelled caller gives up
+        fut.add_done_callback(lambda f: lock.release())
+        return await asyncio.shield(fut)
+
+    async def _shared(self, key, fn, *args, **kwargs):
+        """Runs fn once for all concurrent callers asking for key."""
+        fut = self._inflight.get(key, None)
+        if fut is None:
+            fut = asyncio.ensure_future(self._run(fn, *args, **kwargs))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        # a cancelled caller must not cancel the read the others wait on
+        return await asyncio.shield(fut)
+
+    async def load(self) -> 'AsyncMemscrimper':
+        if self.ms is None:
+            kwargs = dict(self.kwargs)
+            kwargs.setdefault('load', True)
+            self.ms = await self._run(Memscrimper, **kwargs)
+        return self
+
+    async def read_page(self, page_num=None, offset=None) -> bytes:
+        if page_num is None and offset is not None:
+            page_num = offset // self.ms.page_size
+        return await self._shared(('page', page_num), self.ms.read_page, page_num=page_num)
+
+    async def read_meta_page_num(self, pagenr) -> bytes:
+        return await self._shared(('meta', pagenr), self.ms.read_meta_page_num, pagenr)
+
+    async def vol_read(self, address: int, length: int, pad: bool = False) -> bytes:
+        return await self._shared(('vol', address, length, pad), self.ms.vol_read, address, length, pad)
+
+    async def read_pages(self, page_nums, out=None) -> list:
+        # results are views into one buffer, only identical requests without a caller buffer are shared
+        page_nums = tuple(page_nums)
+        if out is not None:
+            return await self._run(self.ms.read_pages, page_nums, out=out)
+        views = await self._shared(('pages', page_nums), self.ms.read_pages, page_nums)
+        return [view.toreadonly() for view in views]
+
+    async def read_range(self, first_page, count, out=None) -> list:
+        if out is not None:
+            return await self._run(self.ms.read_range, first_page, count, out=out)
+        views = await self._shared(('range', first_page, count), self.ms.read_range, first_page, count)
+        return [view.toreadonly() for view in views]
+
+    async def read_to_target(self, target_filename=None, target_fileobj=None, use_buffer=True, workers=None):
+        return await self._run(self.ms.read_to_target, target_filename=target_filename,
+                               target_fileobj=target_fileobj, use_buffer=use_buffer, workers=workers)
+
+    async def changed_pages(self) -> set:
+        return set(await self._shared(('changed',), lambda: self.ms.changed_pages))
+
+    async def close(self) -> None:
+        if self.ms is not None:
+            ms = self.ms
+            self.ms = None
+            await self._run(ms.destroy)
+
+    async def __aenter__(self) -> 'AsyncMemscrimper':
+        return await self.load()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
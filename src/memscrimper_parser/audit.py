@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class AuditReport(object):
+    """Outcome of a streaming audit.
+
+    results holds (pagenr, offset, am, sm, ok) tuples like audit_decompression,
+    but only for mismatched pages and with the auditor's digest; ranges holds
+    [first, last, ok] page ranges covering everything audited.
+    """
+
+    def __init__(self, digest=None):
+        self.ok = True
+        self.pages = 0
+        self.bytes = 0
+        self.results = []
+        self.ranges = []
+        self.digest = digest
+        self.reconstructed_digest = None
+        self.actual_digest = None
+
+    def add_range(self, first, last, ok) -> None:
+        if self.ranges and self.ranges[-1][2] == ok and self.ranges[-1][1] == first - 1:
+            self.ranges[-1][1] = last
+        else:
+            self.ranges.append([first, last, ok])
+
+
+class StreamingAuditor(object):
+    """Verifies the reconstruction against the actual image in large page batches.
+
+    Batches are compared directly as buffers; per-page digests are only
+    computed, on a thread pool (hashlib releases the GIL), for batches that
+    differ.  With whole_image set both images are also digested as a whole,
+    each on its own ordered worker thread.
+    """
+    name = 'StreamingAuditor'
+    BATCH_PAGES = 1024
+
+    def __init__(self, body, batch_pages=None, workers=4, digest='md5', whole_image=False, fail_fast=False,
+                 debug=False):
+        self.body = body
+        self.page_size = body.page_size
+        self.batch_pages = batch_pages or self.BATCH_PAGES
+        self.workers = max(workers or 1, 1)
+        self.digest = digest
+        self.whole_image = whole_image
+        self.fail_fast = fail_fast
+        self.debug = debug
+
+    def _page_result(self, pagenr, page, act_page) -> tuple:
+        offset = pagenr * self.page_size
+        sm = hashlib.new(self.digest, page).hexdigest() if page is not None else None
+        am = hashlib.new(self.digest, act_page).hexdigest() if act_page is not None else None
+        return (pagenr, offset, am, sm, am == sm)
+
+    def _compare_pages(self, executor, first_page, count, rec, act) -> list:
+        ps = self.page_size
+        jobs = [(first_page + i, rec[i * ps:(i + 1) * ps], act[i * ps:(i + 1) * ps]) for i in range(count)]
+        return list(executor.map(lambda job: self._page_result(*job), jobs))
+
+    def run(self, act_fileobj, target_fileobj=None) -> AuditReport:
+        report = AuditReport(digest=self.digest if self.whole_image else None)
+        ps = self.page_size
+        num_pages = self.body.num_pages
+        rec_hash = hashlib.new(self.digest) if self.whole_image else None
+        act_hash = hashlib.new(self.digest) if self.whole_image else None
+        act_fileobj.seek(0)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                ThreadPoolExecutor(max_workers=1) as rec_digester, \
+                ThreadPoolExecutor(max_workers=1) as act_digester:
+            for first_page in range(0, num_pages, self.batch_pages):
+                count = min(self.batch_pages, num_pages - first_page)
+                # fresh buffers per batch, queued digest updates may still hold the last ones
+                rec = bytearray(count * ps)
+                act = bytearray(count * ps)
+                rec_len = self.body._fill_range(first_page, count, memoryview(rec))
+                act_len = act_fileobj.readinto(act) or 0
+                rec_view = memoryview(rec)[:rec_len]
+                act_view = memoryview(act)[:act_len]
+
+                if rec_hash is not None:
+                    rec_digester.submit(rec_hash.update, rec_view)
+                    act_digester.submit(act_hash.update, act_view)
+                if target_fileobj is not None:
+                    target_fileobj.write(rec_view)
+
+                # bytearray equality is a memcmp, memoryviews compare item by item
+                ok = rec_len == act_len and rec == act
+                report.pages += count
+                report.bytes += rec_len
+                if ok:
+                    report.add_range(first_page, first_page + count - 1, True)
+                    continue
+
+                report.ok = False
+                for result in self._compare_pages(executor, first_page, count, rec_view, act_view):
+                    report.add_range(result[0], result[0], result[-1])
+                    if result[-1]:
+                        continue
+                    if self.debug:
+                        mp_logger.debug("{} pagenr: {} offset: {} md5 actual:{} != src:{}".format(
+                            self.name, *result[:4]))
+                    report.results.append(result)
+                    if self.fail_fast:
+                        break
+                if self.fail_fast:
+                    break
+
+        if self.whole_image:
+            report.reconstructed_digest = rec_hash.hexdigest()
+            report.actual_digest = act_hash.hexdigest()
+            report.ok = report.ok and report.reconstructed_digest == report.actual_digest
+        return report
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+import threading
+
+
+class PageCache(object):
+    """Unbounded page cache, what page_data and src_page_data have always been.
+
+    Subclasses bound the cache to max_bytes of page data.  All policies count
+    hits, misses and evictions; membership tests do not count.
+    """
+    POLICY = 'unbounded'
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pages = OrderedDict()
+
+    @classmethod
+    def create(cls, policy=None, max_bytes=None) -> 'PageCache':
+        if policy is None:
+            policy = cls.POLICY if max_bytes is None else LRUPageCache.POLICY
+        policies = {c.POLICY: c for c in (PageCache, LRUPageCache, ClockPageCache)}
+        if policy not in policies:
+            raise Exception("{} is not a valid cache policy, expected one of {}".format(policy, sorted(policies)))
+        return policies[policy](max_bytes=max_bytes)
+
+    def get(self, key, default=None):
+        page = self._lookup(key)
+        if page is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return page
+
+    def _lookup(self, key):
+        return self._pages.get(key, None)
+
+    def put(self, key, page) -> None:
+        if page is None:
+            return
+        old = self._pages.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._store(key, page)
+        self.size += len(page)
+        self._evict()
+
+    def _store(self, key, page) -> None:
+        self._pages[key] = page
+
+    def _evict(self) -> None:
+        pass
+
+    def _drop(self, key) -> None:
+        page = self._pages.pop(key)
+        self.size -= len(page)
+        self.evictions += 1
+
+    def __getitem__(self, key):
+        page = self.get(key)
+        if page is None:
+            raise KeyError(key)
+        return page
+
+    def __setitem__(self, key, page) -> None:
+        self.put(key, page)
+
+    def __contains__(self, key) -> bool:
+        return key in self._pages
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def clear(self) -> None:
+        self._pages.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            'policy': self.POLICY,
+            'max_bytes': self.max_bytes,
+            'bytes': self.size,
+            'pages': len(self._pages),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class LRUPageCache(PageCache):
+    """Evicts the least recently used pages once max_bytes is exceeded."""
+    POLICY = 'lru'
+
+    def _lookup(self, key):
+        page = self._pages.get(key, None)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        while self.size > self.max_bytes and len(self._pages) > 0:
+            self._drop(next(iter(self._pages)))
+
+
+class ClockPageCache(PageCache):
+    """CLOCK (second chance) eviction: hits only set a reference bit, so lookups
+    do not reorder the cache the way LRU does."""
+    POLICY = 'clock'
+
+    def __init__(self, max_bytes=None):
+        super(ClockPageCache, self).__init__(max_bytes=max_bytes)
+        self._referenced = set()
+
+    def _lookup(self, key):
+        page = self._pages.get(key, None)
+        if page is not None:
+            self._referenced.add(key)
+        return page
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        while self.size > self.max_bytes and len(self._pages) > 0:
+            key = next(iter(self._pages))
+            if key in self._referenced:
+                # second chance, the hand moves past it
+                self._referenced.discard(key)
+                self._pages.move_to_end(key)
+            else:
+                self._drop(key)
+
+    def _drop(self, key) -> None:
+        super(ClockPageCache, self)._drop(key)
+        self._referenced.discard(key)
+
+    def clear(self) -> None:
+        super(ClockPageCache, self).clear()
+        self._referenced.clear()
+
+
+class LockedPageCache(object):
+    """Serializes access to a cache shared between threads, e.g. one reference
+    image's page cache used by many dumps (see refstore.ReferenceStore)."""
+
+    def __init__(self, cache: PageCache):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    @property
+    def POLICY(self) -> str:
+        return self.cache.POLICY
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.cache.get(key, default)
+
+    def put(self, key, page) -> None:
+        with self._lock:
+            self.cache.put(key, page)
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self.cache[key]
+
+    def __setitem__(self, key, page) -> None:
+        self.put(key, page)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self.cache
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.cache)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self.cache.stats()
@@ -1,19 +1,45 @@
 from io import BytesIO, IOBase
+from bisect import bisect_right
+from collections import OrderedDict
 import gzip
+import struct
 import bz2
+import lzma
+import zlib
 import enum
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+HAVE_ZSTD = zstandard is not None
+HAVE_LZ4 = lz4_frame is not None
+
+mp_logger = logging.getLogger(__name__)
 
 class Compression(enum.Enum):
     ZIP7 = 0
     GZIP = 1
     BZIP2 = 2
     NOINNER = 3
+    ZSTD = 4
+    LZ4 = 5
 
 class NoInnerBase(object):
     NAME = 'NoInner'
+    MAGIC = None
     @classmethod
-    def _decompress(cls, data: bytes) -> bytes:
-        return data
+    def _decompress(cls, fileobj) -> bytes:
+        if hasattr(fileobj, 'read'):
+            return fileobj.read()
+        return fileobj
 
     @classmethod
     def _compress(cls, data: bytes) -> bytes:
@@ -48,9 +74,33 @@ class NoInnerBase(object):
             return decompressed_data[offset:]
         return None
 
+    @classmethod
+    def new_compressor(cls):
+        return StoredCompressor()
+
+    @classmethod
+    def new_decompressor(cls):
+        # None means the body is stored as is and can be read in place
+        return None
+
+    @classmethod
+    def copy_decompressor(cls, decompressor):
+        # None means the decompressor state can not be checkpointed
+        return None
+
+    @classmethod
+    def inflate(cls, decompressor, data: bytes, max_length: int) -> (bytes, bytes):
+        out = decompressor.decompress(data, max_length)
+        return out, b''
+
+    @classmethod
+    def open_stream(cls, fileobj: IOBase, offset: int=0, span: int=None):
+        return SeekableBody(cls, fileobj, offset=offset, span=span)
+
 
 class Gzip(NoInnerBase):
     NAME = 'Gzip'
+    MAGIC = b'\x1f\x8b'
     @classmethod
     def _compress(cls, data) -> bytes:
         fo = cls.get_fileobj(b'')
@@ -68,8 +118,26 @@ class Gzip(NoInnerBase):
         decompressed_data = cf.read()
         return decompressed_data
 
+    @classmethod
+    def new_compressor(cls):
+        return zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    @classmethod
+    def new_decompressor(cls):
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    @classmethod
+    def copy_decompressor(cls, decompressor):
+        return decompressor.copy()
+
+    @classmethod
+    def inflate(cls, decompressor, data: bytes, max_length: int) -> (bytes, bytes):
+        out = decompressor.decompress(data, max_length)
+        return out, decompressor.unconsumed_tail
+
 class Bzip2(NoInnerBase):
     NAME = 'Bzip2'
+    MAGIC = b'BZh'
     @classmethod
     def _compress(cls, data) -> bytes:
         fo = cls.get_fileobj(b'')
@@ -87,12 +155,529 @@ class Bzip2(NoInnerBase):
         decompressed_data = cf.read()
         return decompressed_data
 
+    @classmethod
+    def new_compressor(cls):
+        return bz2.BZ2Compressor(9)
+
+    @classmethod
+    def new_decompressor(cls):
+        # bzip2 state can not be copied, so only stream starts get checkpoints
+        return bz2.BZ2Decompressor()
+
 class Zip7(NoInnerBase):
     NAME = 'Zip7'
+    MAGIC = b'\xfd7zXZ\x00'
+    PRESET = 6
+    @classmethod
+    def _compress(cls, data) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=cls.PRESET)
+
+    @classmethod
+    def _decompress(cls, fileobj) -> bytes:
+        # FORMAT_AUTO also takes the legacy .lzma (alone) container
+        cf = lzma.LZMAFile(fileobj, mode="rb", format=lzma.FORMAT_AUTO)
+        decompressed_data = cf.read()
+        return decompressed_data
+
+    @classmethod
+    def new_compressor(cls):
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=cls.PRESET)
+
+    @classmethod
+    def new_decompressor(cls):
+        # lzma state can not be copied, so only stream starts get checkpoints
+        return lzma.LZMADecompressor(format=lzma.FORMAT_AUTO)
+
+
+class StoredCompressor(object):
+    """compress() / flush() interface of zlib.compressobj for bodies stored as is."""
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class FrameCompressor(object):
+    """Gives lz4 frame compressors, which need begin() before the first block,
+    the compress() / flush() interface of zlib.compressobj."""
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.started = False
+
+    def _begin(self) -> bytes:
+        if self.started:
+            return b''
+        self.started = True
+        return self.compressor.begin()
+
+    def compress(self, data: bytes) -> bytes:
+        header = self._begin()
+        return header + self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        header = self._begin()
+        return header + self.compressor.flush()
+
+
+class BufferedDecompressor(object):
+    """Gives decompressors whose decompress() returns all output at once the
+    decompress(data, max_length) / eof / unused_data interface of LZMADecompressor."""
+    def __init__(self, decompressor):
+        self.decompressor = decompressor
+        self.pending = b''
+
+    @property
+    def eof(self) -> bool:
+        return self.decompressor.eof and not self.pending
+
+    @property
+    def unused_data(self) -> bytes:
+        return self.decompressor.unused_data
+
+    def decompress(self, data: bytes, max_length: int=-1) -> bytes:
+        if data:
+            self.pending += self.decompressor.decompress(data)
+        if max_length < 0 or max_length >= len(self.pending):
+            out, self.pending = self.pending, b''
+        else:
+            out, self.pending = self.pending[:max_length], self.pending[max_length:]
+        return out
+
+
+class Zstd(NoInnerBase):
+    NAME = 'Zstd'
+    MAGIC = b'\x28\xb5\x2f\xfd'
+    LEVEL = 9
+    @classmethod
+    def _compress(cls, data) -> bytes:
+        return zstandard.ZstdCompressor(level=cls.LEVEL).compress(data)
+
+    @classmethod
+    def _decompress(cls, fileobj) -> bytes:
+        if not hasattr(fileobj, 'read'):
+            fileobj = cls.get_fileobj(fileobj)
+        cf = zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+        decompressed_data = cf.readall()
+        return decompressed_data
+
+    @classmethod
+    def new_compressor(cls):
+        return zstandard.ZstdCompressor(level=cls.LEVEL).compressobj()
+
+    @classmethod
+    def new_decompressor(cls):
+        # one frame per decompressor, the next frame starts a new checkpoint
+        return BufferedDecompressor(zstandard.ZstdDecompressor().decompressobj())
+
+
+class Lz4(NoInnerBase):
+    NAME = 'Lz4'
+    MAGIC = b'\x04\x22\x4d\x18'
+    LEVEL = 0
     @classmethod
     def _compress(cls, data) -> bytes:
-        raise Exception("Not supported")
+        return lz4_frame.compress(data, compression_level=cls.LEVEL)
 
     @classmethod
     def _decompress(cls, fileobj) -> bytes:
-        raise Exception("Not supported")
+        data = fileobj.read() if hasattr(fileobj, 'read') else fileobj
+        # lz4_frame.decompress stops after the first frame
+        pieces = []
+        while data:
+            decompressor = lz4_frame.LZ4FrameDecompressor()
+            pieces.append(decompressor.decompress(data))
+            if not decompressor.eof:
+                raise Exception("Truncated lz4 frame")
+            data = decompressor.unused_data
+        return b''.join(pieces)
+
+    @classmethod
+    def new_compressor(cls):
+        return FrameCompressor(lz4_frame.LZ4FrameCompressor(compression_level=cls.LEVEL))
+
+    @classmethod
+    def new_decompressor(cls):
+        return lz4_frame.LZ4FrameDecompressor()
+
+
+class SeekableBody(object):
+    """Random access to an inner compressed body without inflating all of it.
+
+    A single pass over the compressed stream records checkpoints (zran style):
+    the compressed offset and a copy of the decompressor state every `span`
+    decompressed bytes, plus the start of every gzip member, bzip2 / xz stream
+    or zstd / lz4 frame.
+    Reads restore the nearest checkpoint and inflate only the chunks they
+    touch.  Slicing, len(), seek(), tell() and read() behave like the bytes /
+    BytesIO objects the sections and MemscrimperBody use otherwise.
+
+    Only gzip decompressors can be copied (about 40 KiB each), so at most
+    max_checkpoints copies are kept: the spacing doubles and every other copy
+    is dropped whenever the index grows past it.  bzip2, xz, zstd and lz4
+    bodies only get checkpoints at stream or frame starts, a single stream
+    body has no random access (random_access is False, a warning is logged)
+    and every read inflates it from the start; repack.ChunkedRepacker turns
+    such dumps into seekable ones.
+    """
+    SPAN = 1 << 20
+    READ_SIZE = 1 << 16
+    MAX_CHUNKS = 8
+    MAX_CHECKPOINTS = 256
+
+    def __init__(self, compression_cls, fileobj: IOBase, offset: int=0, span: int=None, max_chunks: int=None,
+                 index: bool=True, max_checkpoints: int=None):
+        self.compression_cls = compression_cls
+        self.fileobj = fileobj
+        self.offset = offset
+        self.span = span or self.SPAN
+        self.max_chunks = max_chunks or self.MAX_CHUNKS
+        self.max_checkpoints = max_checkpoints or self.MAX_CHECKPOINTS
+        self.position = 0
+        # (uncompressed offset, compressed offset, decompressor state or None for a stream start)
+        self.checkpoints = []
+        self.checkpoint_offsets = []
+        # decompressor copies are taken every checkpoint_span bytes, a multiple of span
+        self.checkpoint_span = self.span
+        self.num_states = 0
+        self.chunks = OrderedDict()
+        self.direct = compression_cls.new_decompressor() is None
+        # index=False skips the indexing pass for callers that only use iter_pieces()
+        self.size = self._build_index() if index else None
+
+    def _add_checkpoint(self, uoffset, coffset, state):
+        self.checkpoints.append((uoffset, coffset, state))
+        self.checkpoint_offsets.append(uoffset)
+        if state is not None:
+            self.num_states += 1
+            if self.num_states > self.max_checkpoints:
+                self._thin_checkpoints()
+
+    def _thin_checkpoints(self):
+        """Doubles the checkpoint spacing, dropping every other decompressor copy."""
+        self.checkpoint_span *= 2
+        self.checkpoints = [c for c in self.checkpoints if c[2] is None or c[0] % self.checkpoint_span == 0]
+        self.checkpoint_offsets = [c[0] for c in self.checkpoints]
+        self.num_states = sum(1 for c in self.checkpoints if c[2] is not None)
+
+    @property
+    def random_access(self) -> bool:
+        return self.direct or len(self.checkpoints) > 1 or self.size <= self.span
+
+    def _build_index(self) -> int:
+        if self.direct:
+            self.fileobj.seek(0, 2)
+            return max(self.fileobj.tell() - self.offset, 0)
+        self._add_checkpoint(0, 0, None)
+        size = 0
+        for uoffset, data in self._inflate_from(0, 0, None, record=True):
+            size = uoffset + len(data)
+        if len(self.checkpoints) == 1 and size > self.span:
+            mp_logger.warning("{} body of {} bytes is a single stream without checkpoints, every read inflates "
+                              "it from the start; repack it with ChunkedRepacker for random access".format(
+                                  self.compression_cls.NAME, size))
+        return size
+
+    def iter_pieces(self):
+        """Yields (uoffset, data) over the whole body in one pass; pieces never straddle a chunk."""
+        if not self.direct:
+            yield from self._inflate_from(0, 0, None)
+            return
+        self.fileobj.seek(self.offset)
+        uoffset = 0
+        while True:
+            data = self.fileobj.read(self.span)
+            if not data:
+                return
+            yield uoffset, data
+            uoffset += len(data)
+
+    def _inflate_from(self, uoffset, coffset, state, record=False):
+        """Yields (uoffset, data) from a checkpoint; pieces never straddle a chunk."""
+        cls = self.compression_cls
+        decompressor = cls.new_decompressor() if state is None else cls.copy_decompressor(state)
+        self.fileobj.seek(self.offset + coffset)
+        fed = coffset
+        pending = b''
+        limited = False
+        while True:
+            if not pending and not limited:
+                pending = self.fileobj.read(self.READ_SIZE)
+                if not pending:
+                    return
+                fed += len(pending)
+            limit = self.span - uoffset % self.span
+            data, pending = cls.inflate(decompressor, pending, limit)
+            limited = len(data) == limit
+            if data:
+                yield uoffset, data
+                uoffset += len(data)
+
+            if decompressor.eof:
+                # lz4 reports None rather than b'' when nothing follows the frame
+                coffset = fed - len(decompressor.unused_data or b'')
+                self.fileobj.seek(self.offset + coffset)
+                magic = self.fileobj.read(len(cls.MAGIC))
+                if magic != cls.MAGIC:
+                    return
+                self.fileobj.seek(self.offset + coffset)
+                decompressor = cls.new_decompressor()
+                fed = coffset
+                pending = b''
+                limited = False
+                if record:
+                    self._add_checkpoint(uoffset, coffset, None)
+            elif record and limited and uoffset % self.checkpoint_span == 0:
+                state = cls.copy_decompressor(decompressor)
+                if state is not None:
+                    self._add_checkpoint(uoffset, fed - len(pending), state)
+
+    def _chunk(self, index: int) -> bytes:
+        chunk = self.chunks.get(index, None)
+        if chunk is not None:
+            self.chunks.move_to_end(index)
+            return chunk
+
+        chunk = self._inflate_chunk(index)
+        self.chunks[index] = chunk
+        if len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def _inflate_chunk(self, index: int) -> bytes:
+        start = index * self.span
+        end = start + self.span
+        i = bisect_right(self.checkpoint_offsets, start) - 1
+        uoffset, coffset, state = self.checkpoints[i]
+        pieces = []
+        for piece_offset, data in self._inflate_from(uoffset, coffset, state):
+            if piece_offset >= end:
+                break
+            if piece_offset >= start:
+                pieces.append(data)
+        return b''.join(pieces)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        if size <= 0 or offset >= self.size:
+            return b''
+        size = min(size, self.size - offset)
+        if self.direct:
+            self.fileobj.seek(self.offset + offset)
+            return self.fileobj.read(size)
+
+        first = offset // self.span
+        last = (offset + size - 1) // self.span
+        pieces = []
+        for index in range(first, last + 1):
+            chunk = self._chunk(index)
+            lo = max(offset - index * self.span, 0)
+            hi = min(offset + size - index * self.span, self.span)
+            pieces.append(chunk[lo:hi])
+        return pieces[0] if len(pieces) == 1 else b''.join(pieces)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                raise ValueError("Only contiguous slices are supported")
+            return self.read_at(start, stop - start)
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("index out of range")
+        return self.read_at(key, 1)[0]
+
+    def seek(self, offset: int, whence: int=0) -> int:
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position {}".format(offset))
+        self.position = offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int=-1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        data = self.read_at(self.position, size)
+        self.position += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+
+class DeferredBody(SeekableBody):
+    """Body that is decompressed on its first read, for opens served from a sidecar index.
+
+    Reference and distinct pages never read the body, so an open and those
+    reads cost nothing; the first interdedup source page or diff patch
+    inflates it whole, or indexes it as a SeekableBody when streaming.
+    The SeekableBody members used by callers load the body and defer to it.
+    A pickled body drops its file and reopens it by name when first read.
+    """
+
+    def __init__(self, compression_cls, fileobj: IOBase, offset: int=0, streaming: bool=False):
+        self.compression_cls = compression_cls
+        self.fileobj = fileobj
+        self.filename = getattr(fileobj, 'name', None)
+        self.offset = offset
+        self.streaming = streaming
+        self.position = 0
+        self.body = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if not isinstance(self.fileobj, BytesIO):
+            if not isinstance(self.filename, str):
+                raise Exception("Unable to pickle a deferred body without a file name")
+            state['fileobj'] = None
+            if isinstance(self.body, SeekableBody):
+                state['body'] = None
+        return state
+
+    def _load(self):
+        if self.body is None:
+            if self.fileobj is None:
+                self.fileobj = open(self.filename, 'rb')
+            if self.streaming:
+                self.body = self.compression_cls.open_stream(self.fileobj, offset=self.offset)
+            else:
+                self.fileobj.seek(self.offset)
+                self.body = self.compression_cls.decompress(self.fileobj, offset=0) or b''
+        return self.body
+
+    @property
+    def size(self) -> int:
+        return len(self._load())
+
+    @property
+    def random_access(self) -> bool:
+        body = self._load()
+        return body.random_access if isinstance(body, SeekableBody) else True
+
+    def iter_pieces(self):
+        body = self._load()
+        if isinstance(body, SeekableBody):
+            yield from body.iter_pieces()
+        elif body:
+            yield 0, body
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        body = self._load()
+        if isinstance(body, SeekableBody):
+            return body.read_at(offset, size)
+        return body[offset:offset + size]
+
+
+class ChunkedBody(SeekableBody):
+    """Body of a chunked container, see repack.ChunkedRepacker.
+
+    The decompressed body is cut into chunk_size pieces that are compressed
+    on their own with the inner method, so opening reads only the preamble
+    and the chunk offset table and a read inflates just the chunks it
+    touches.
+
+    The decompressed offsets of the body sections are recorded as well, so a
+    lazy MemscrimperBody finds each section without walking the one before.
+
+    Layout at the body offset (little endian, offsets relative to it):
+        magic, chunk size, decompressed body size, number of chunks,
+        table offset, number of sections, MAX_SECTIONS section offsets,
+        the chunks, then (number of chunks + 1) chunk offsets.
+    """
+    MAGIC = b"MSCHUNK\x00"
+    MAX_SECTIONS = 4
+    PREAMBLE = struct.Struct("<8sIQIQI{}Q".format(MAX_SECTIONS))
+    OFFSET = struct.Struct("<Q")
+    CHUNK_SIZE = 1 << 16
+    MAX_CHUNKS = 64
+
+    def __init__(self, compression_cls, fileobj: IOBase, offset: int=0, max_chunks: int=None):
+        self.chunk_offsets = None
+        self.section_offsets = []
+        super(ChunkedBody, self).__init__(compression_cls, fileobj, offset=offset, max_chunks=max_chunks)
+
+    def _build_index(self) -> int:
+        # chunks are decompressed whole, even for noinner
+        self.direct = False
+        self.fileobj.seek(self.offset)
+        magic, self.span, size, num_chunks, table_offset, num_sections, *sections = self.PREAMBLE.unpack(
+            self.fileobj.read(self.PREAMBLE.size))
+        if magic != self.MAGIC:
+            raise Exception("Wrong magic bytes for a chunked body: {}".format(repr(magic)))
+        self.section_offsets = sections[:num_sections]
+        self.fileobj.seek(self.offset + table_offset)
+        table = self.fileobj.read(self.OFFSET.size * (num_chunks + 1))
+        if len(table) != self.OFFSET.size * (num_chunks + 1):
+            raise Exception("Chunk offset table is truncated")
+        self.chunk_offsets = [v for v, in self.OFFSET.iter_unpack(table)]
+        return size
+
+    def _inflate_chunk(self, index: int) -> bytes:
+        cls = self.compression_cls
+        start = self.chunk_offsets[index]
+        self.fileobj.seek(self.offset + start)
+        chunk = cls._decompress(cls.get_fileobj(self.fileobj.read(self.chunk_offsets[index + 1] - start)))
+        if len(chunk) != min(self.span, self.size - index * self.span):
+            raise Exception("Chunk {} inflated to {} bytes".format(index, len(chunk)))
+        return chunk
+
+    @classmethod
+    def write(cls, compression_cls, pieces, fileobj: IOBase, chunk_size: int=None) -> (int, int):
+        """Writes a chunked body from the (uoffset, data) pieces at the current position of fileobj,
+        pieces must not straddle chunk_size boundaries (SeekableBody.iter_pieces with span=chunk_size).
+        Returns the decompressed size and the number of chunks, see write_section_offsets."""
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        base = fileobj.tell()
+        fileobj.write(b'\x00' * cls.PREAMBLE.size)
+        offsets = [cls.PREAMBLE.size]
+        buffered = []
+        size = 0
+
+        def flush():
+            fileobj.write(compression_cls._compress(b''.join(buffered)))
+            offsets.append(fileobj.tell() - base)
+            buffered.clear()
+
+        for uoffset, data in pieces:
+            if uoffset != size:
+                raise Exception("Body piece at {} does not follow {}".format(uoffset, size))
+            buffered.append(data)
+            size += len(data)
+            if size % chunk_size == 0:
+                flush()
+        if buffered:
+            flush()
+
+        num_chunks = len(offsets) - 1
+        table_offset = fileobj.tell() - base
+        fileobj.write(b''.join(cls.OFFSET.pack(v) for v in offsets))
+        end = fileobj.tell()
+        fileobj.seek(base)
+        fileobj.write(cls.PREAMBLE.pack(cls.MAGIC, chunk_size, size, num_chunks, table_offset,
+                                        0, *([0] * cls.MAX_SECTIONS)))
+        fileobj.seek(end)
+        return size, num_chunks
+
+    @classmethod
+    def write_section_offsets(cls, fileobj: IOBase, base: int, section_offsets) -> None:
+        """Records the section offsets in the chunked body at base, fileobj opened for update."""
+        section_offsets = sorted(section_offsets)
+        if len(section_offsets) > cls.MAX_SECTIONS:
+            raise Exception("{} sections do not fit the chunked body preamble".format(len(section_offsets)))
+        fileobj.seek(base)
+        fields = cls.PREAMBLE.unpack(fileobj.read(cls.PREAMBLE.size))
+        padded = section_offsets + [0] * (cls.MAX_SECTIONS - len(section_offsets))
+        fileobj.seek(base)
+        fileobj.write(cls.PREAMBLE.pack(*fields[:5], len(section_offsets), *padded))
@@ -0,0 +1,196 @@
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from .interface import Memscrimper
+from .pagemap import PageMap
+import mmap
+import os
+import struct
+import sys
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+def _collect_runs(task) -> tuple:
+    """Worker side: parses one dump and returns its changed (non reference) page map runs."""
+    filename, ms_kwargs = task
+    ms = Memscrimper(src_filename=filename, load=True, lazy=True, **ms_kwargs)
+    try:
+        starts = array('Q')
+        ends = array('Q')
+        kinds = array('B')
+        for first, last, kind, _ in ms.runs():
+            if kind == PageMap.REFERENCE:
+                continue
+            starts.append(first)
+            ends.append(last)
+            kinds.append(kind)
+        return filename, ms.page_size, bytes(ms.reference), starts, ends, kinds
+    finally:
+        ms.msh.destroy()
+
+
+class CrossDumpIndex(object):
+    """Inverted index over many dumps of one base image: page -> dumps that changed it.
+
+    For every dump the index keeps the runs of its page map that do not map
+    straight to the reference (distinct remaps, diffs and interdedup pages)
+    as sorted, disjoint [first, last] runs with their kind.  The runs of all
+    dumps are stored back to back in one file that is opened with mmap, so a
+    range query is one bisect per dump over the mapped arrays and never
+    touches a dump body.
+
+    Layout (native byte order, recorded in the header):
+        magic, version, byte order, page size, number of dumps, then the
+        dump names and reference names, and 8-byte aligned arrays: per dump
+        run bounds, run starts, ends and kinds (bytes).
+    """
+    name = 'CrossDumpIndex'
+    MAGIC = b"MSXIDX\x00"
+    VERSION = 1
+    SUFFIX = '.msxidx'
+    PREAMBLE = struct.Struct("<7sHBIQ")
+    NAME = struct.Struct("<II")
+
+    def __init__(self):
+        self.filename = None
+        self.page_size = None
+        self.dumps = []
+        self.references = []
+        self.bounds = None
+        self.starts = None
+        self.ends = None
+        self.kinds = None
+        self._mmap = None
+
+    @classmethod
+    def build(cls, filenames, index_filename, workers=None, **ms_kwargs) -> 'CrossDumpIndex':
+        """Parses the dumps on a process pool (workers=1 parses in process) and writes the index."""
+        tasks = [(filename, ms_kwargs) for filename in filenames]
+        if workers == 1:
+            results = [_collect_runs(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_collect_runs, tasks, chunksize=max(len(tasks) // 64, 1)))
+        cls.write(index_filename, results)
+        return cls.open(index_filename)
+
+    @classmethod
+    def write(cls, index_filename, results) -> str:
+        """results holds (filename, page_size, reference, starts, ends, kinds) per dump."""
+        page_sizes = set(r[1] for r in results)
+        if len(page_sizes) > 1:
+            raise Exception("Dumps with different page sizes can not share an index: {}".format(page_sizes))
+        references = set(r[2] for r in results)
+        if len(references) > 1:
+            mp_logger.debug("{} dumps use {} different references".format(cls.name, len(references)))
+
+        bounds = array('Q', [0])
+        starts = array('Q')
+        ends = array('Q')
+        kinds = array('B')
+        for _, _, _, s, e, k in results:
+            starts.extend(s)
+            ends.extend(e)
+            kinds.extend(k)
+            bounds.append(len(starts))
+
+        page_size = page_sizes.pop() if page_sizes else 0
+        out = bytearray(cls.PREAMBLE.pack(cls.MAGIC, cls.VERSION, sys.byteorder == 'little', page_size,
+                                          len(results)))
+        for filename, _, reference, _, _, _ in results:
+            name = os.fsencode(filename)
+            out += cls.NAME.pack(len(name), len(reference))
+            out += name + reference
+        for part in (bounds, starts, ends, kinds):
+            # the arrays are cast in place when mapped, keep them 8-byte aligned
+            out += b'\x00' * (-len(out) % 8)
+            out += part.tobytes()
+
+        tmp_filename = index_filename + '.tmp.{}'.format(os.getpid())
+        with open(tmp_filename, 'wb') as fileobj:
+            fileobj.write(out)
+        os.replace(tmp_filename, index_filename)
+        return index_filename
+
+    @classmethod
+    def open(cls, index_filename) -> 'CrossDumpIndex':
+        with open(index_filename, 'rb') as fileobj:
+            mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little, page_size, num_dumps = cls.PREAMBLE.unpack_from(mapped, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise Exception("{} is not a cross dump index".format(index_filename))
+        if bool(little) != (sys.byteorder == 'little'):
+            raise Exception("{} was written on a platform with another byte order".format(index_filename))
+
+        index = cls()
+        index.filename = index_filename
+        index.page_size = page_size
+        offset = cls.PREAMBLE.size
+        for _ in range(num_dumps):
+            name_len, ref_len = cls.NAME.unpack_from(mapped, offset)
+            offset += cls.NAME.size
+            index.dumps.append(os.fsdecode(mapped[offset:offset + name_len]))
+            index.references.append(mapped[offset + name_len:offset + name_len + ref_len])
+            offset += name_len + ref_len
+
+        view = memoryview(mapped)
+        def take(count, fmt, width):
+            nonlocal offset
+            offset += -offset % 8
+            arr = view[offset:offset + count * width].cast(fmt)
+            offset += count * width
+            return arr
+
+        index.bounds = take(num_dumps + 1, 'Q', 8)
+        num_runs = index.bounds[-1]
+        index.starts = take(num_runs, 'Q', 8)
+        index.ends = take(num_runs, 'Q', 8)
+        index.kinds = take(num_runs, 'B', 1)
+        if offset != len(mapped):
+            raise Exception("{} is truncated".format(index_filename))
+        index._mmap = mapped
+        return index
+
+    def __len__(self) -> int:
+        return len(self.dumps)
+
+    def _dump_runs(self, dump, first_page, last_page, kinds=None):
+        lo = self.bounds[dump]
+        hi = self.bounds[dump + 1]
+        i = bisect_left(self.ends, first_page, lo, hi)
+        while i < hi and self.starts[i] <= last_page:
+            kind = self.kinds[i]
+            if kinds is None or kind in kinds:
+                yield max(self.starts[i], first_page), min(self.ends[i], last_page), kind
+            i += 1
+
+    def query(self, first_page, last_page=None, kinds=None) -> dict:
+        """Returns {dump filename: [(first, last, kind), ...]} for the dumps that changed any
+        page in [first_page, last_page], runs clipped to the range.  kinds limits the
+        change kinds (PageMap.DISTINCT, DIFF or SOURCE)."""
+        if last_page is None:
+            last_page = first_page
+        results = {}
+        for dump in range(len(self.dumps)):
+            runs = list(self._dump_runs(dump, first_page, last_page, kinds))
+            if len(runs) > 0:
+                results[self.dumps[dump]] = runs
+        return results
+
+    def query_address(self, address, length=1, kinds=None) -> dict:
+        return self.query(address // self.page_size, (address + max(length, 1) - 1) // self.page_size, kinds)
+
+    def dumps_touching(self, first_page, last_page=None, kinds=None) -> list:
+        return list(self.query(first_page, last_page, kinds))
+
+    def changed_runs(self, filename) -> list:
+        dump = self.dumps.index(filename)
+        return list(self._dump_runs(dump, 0, (1 << 64) - 1))
+
+    def close(self) -> None:
+        self.bounds = self.starts = self.ends = self.kinds = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
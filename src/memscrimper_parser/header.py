@@ -1,4 +1,4 @@
-from .compression import Zip7, Gzip, Bzip2, NoInnerBase
+from .compression import Zip7, Gzip, Bzip2, Zstd, Lz4, NoInnerBase, ChunkedBody, DeferredBody, HAVE_ZSTD, HAVE_LZ4
 from .util import Util
 import struct
 from typing import Any, Dict, IO, List, Optional, Union
@@ -19,6 +19,8 @@ class MemscrimperHeader(object):
     name = "MemscrimperHeader"
     # COMPRESSION_OPTIONS = [b'gzip', b'bzip2', b'zip7', b'noinner']
     OPTIONS = [b'interdedup', b'delta', b'noinner']
+    # method suffix of the chunked container written by repack.ChunkedRepacker
+    CHUNKED = b'_chunked'
 
     SUPPORTED_COMPRESSION_CLS = {
         b'zip7': Zip7,
@@ -26,6 +28,20 @@ class MemscrimperHeader(object):
         b'bzip2': Bzip2,
         b'noinner': NoInnerBase
     }
+    if HAVE_ZSTD:
+        SUPPORTED_COMPRESSION_CLS[b'zstd'] = Zstd
+    if HAVE_LZ4:
+        SUPPORTED_COMPRESSION_CLS[b'lz4'] = Lz4
+    # inner methods that need a package which is not installed
+    OPTIONAL_COMPRESSION = {
+        b'zstd': 'zstandard',
+        b'lz4': 'lz4',
+    }
+
+    @classmethod
+    def pack_header(cls, method: bytes, major: int, minor: int, page_size: int, uncompressed_size: int) -> bytes:
+        return cls.MAGIC + method + b'\x00' + struct.pack(cls.MAJOR, major) + struct.pack(cls.MINOR, minor) + \
+               struct.pack(cls.PAGESZ, page_size) + struct.pack(cls.UNCOMPRESSED, uncompressed_size)
 
     @classmethod
     def disable_debug(cls):
@@ -48,6 +64,7 @@ class MemscrimperHeader(object):
         self.method = None
         self.magic = None
         self.compression_cls = None
+        self.chunked = False
         self.body_bytes_offset = None
         self.offset = 0
         self.fileobj = fileobj
@@ -68,9 +85,9 @@ class MemscrimperHeader(object):
         # self._read_header()
         # self._load_body()
 
-    def load(self) -> object:
+    def load(self, streaming=False, deferred=False) -> object:
         self._read_header()
-        self._load_body()
+        self._load_body(streaming=streaming, deferred=deferred)
         return self
 
     def _read_header(self) -> None:
@@ -95,6 +112,7 @@ class MemscrimperHeader(object):
         self._read_page_size()
         self._read_uncompressed_size()
         self._set_compression()
+        self.chunked = self.CHUNKED in self.method
         self.body_bytes_offset = self.offset
 
     def _read_method(self):
@@ -144,6 +162,9 @@ class MemscrimperHeader(object):
 
     def _set_compression(self):
         self.compression_cls = None
+        for o, package in self.OPTIONAL_COMPRESSION.items():
+            if o in self.method and o not in self.SUPPORTED_COMPRESSION_CLS:
+                raise Exception("Method {} requires the {} package".format(self.method, package))
         for o, c in self.SUPPORTED_COMPRESSION_CLS.items():
             if o in self.method:
                 self.compression_cls = c
@@ -151,9 +172,20 @@ class MemscrimperHeader(object):
         if self.compression_cls is None:
             self.compression_cls = self.SUPPORTED_COMPRESSION_CLS[b'noinner']
 
-    def _load_body(self, decompress=True, load_bytes_only=True) -> bytes:
+    def _load_body(self, decompress=True, load_bytes_only=True, streaming=False, deferred=False) -> bytes:
         self.fileobj.seek(self.body_bytes_offset)
-        if decompress:
+        if self.chunked and decompress:
+            # only the chunk table is read here, reads inflate the chunks they touch
+            self.body_bytes = ChunkedBody(self.compression_cls, self.fileobj, offset=self.body_bytes_offset)
+        elif deferred and decompress:
+            # parse results come from a sidecar index, the body is inflated on its first read
+            self.body_bytes = DeferredBody(self.compression_cls, self.fileobj, offset=self.body_bytes_offset,
+                                           streaming=streaming)
+        elif streaming:
+            # body_bytes becomes a SeekableBody that inflates on demand
+            self.body_bytes = self.compression_cls.open_stream(self.fileobj, offset=self.body_bytes_offset)
+            decompress = True
+        elif decompress:
             self.body_bytes = self.compression_cls.decompress(self.fileobj, offset=0)
         else:
             self.body_bytes = self.fileobj.read()
@@ -166,10 +198,10 @@ class MemscrimperHeader(object):
         
 
     def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
         if isinstance(self.fileobj, BufferedReader):
-            self.fileobj = None
-
-        return self.__dict__
+            state['fileobj'] = None
+        return state
 
     def destroy(self) -> None:
         """Closes the file handle."""
@@ -2,14 +2,19 @@
 from .header import MemscrimperHeader
 from typing import Any, Dict
 from .layer import MemscrimperBody
+from .sidecar import SidecarIndex
+from .rawio import MemscrimperRawIO
 
 from io import BytesIO, BufferedReader
+from .util import Util
 
 
 class Memscrimper(object):
 
     def __init__(self, src_fileobj=None, src_filename=None, load_header_only=False, ref_filename=None, ref_bytes=None, load=False,
-                 load_ref_data=True, disable_debug=True):
+                 load_ref_data=True, disable_debug=True, streaming=False, use_mmap=True, cache_policy=None,
+                 cache_bytes=None, src_cache_bytes=None, use_index=False, index_filename=None, lazy=False,
+                 reference_store=None):
 
         if disable_debug:
             MemscrimperHeader.disable_debug()
@@ -26,24 +31,90 @@ class Memscrimper(object):
         self.ref_loaded = False
         self.ref_data_loaded = False
         self.ms_loaded = False
+        self.streaming = streaming
+        self.use_mmap = use_mmap
+        # 'unbounded' (default without a budget), 'lru' or 'clock', see cache.PageCache
+        self.cache_policy = cache_policy
+        self.cache_bytes = cache_bytes
+        self.src_cache_bytes = src_cache_bytes
+        # reuse / write the <file>.msidx sidecar instead of parsing the body on every open
+        self.use_index = use_index
+        self.index_filename = index_filename
+        self.index_loaded = False
+        self.index_fingerprint = None
+        # only locate the body sections on load, decode each one on first use
+        self.lazy = lazy
+        # a ReferenceStore shares the reference mapping and page cache with other dumps on the same base
+        self.reference_store = reference_store
+        self.ref_entry = None
+        self.ref_fileobj = None
 
         if load:
             self.load(load_header_only)
             if ref_filename is not None or ref_bytes is not None:
-                self.associate_reference_data(ref_filename,ref_bytes,load_from_file=load_ref_data)
+                self.associate_reference_data(ref_filename,ref_bytes,load_from_file=load_ref_data,
+                                              use_mmap=use_mmap)
 
 
     def load(self, load_header_only=False):
-        self.msh.load()
-        if load_header_only:
-            self.msb = MemscrimperBody(self.method, self.page_size,
-                                   self.body_bytes,
-                                   self.uncompressed_size)
-        else:
-            self.msb = MemscrimperBody(self.method, self.page_size,
+        self.msh._read_header()
+        index = self._open_index() if self.use_index and not load_header_only else None
+        # a matching index replaces the body parse, so the body is only inflated when a read needs it
+        self.msh._load_body(streaming=self.streaming, deferred=index is not None)
+        self.msb = MemscrimperBody(self.method, self.page_size,
                                    self.body_bytes,
-                                   self.uncompressed_size).load()
+                                   self.uncompressed_size,
+                                   cache_policy=self.cache_policy,
+                                   cache_bytes=self.cache_bytes,
+                                   src_cache_bytes=self.src_cache_bytes,
+                                   lazy=self.lazy)
+        if not load_header_only:
+            self._load_body(index)
             self.ms_loaded = True
+        if self.ref_loaded:
+            self._associate_body_reference()
+
+    def _associate_body_reference(self):
+        if self.ref_entry is not None:
+            self.msb.associate_reference_entry(self.ref_entry)
+        else:
+            fileobj = self.ref_fileobj if self.ref_bytes is None else None
+            self.msb.associate_reference_file(self.ref_filename, self.ref_bytes, False, fileobj=fileobj)
+
+    def _sidecar_filename(self):
+        if self.index_filename is not None:
+            return self.index_filename
+        filename = self.msh.filename or getattr(self.msh.fileobj, 'name', None)
+        if not isinstance(filename, str):
+            return None
+        return SidecarIndex.sidecar_filename(filename)
+
+    def _open_index(self):
+        """The sidecar index when it exists and matches the source, else None."""
+        index_filename = self._sidecar_filename()
+        if index_filename is None:
+            return None
+        self.index_fingerprint = SidecarIndex.fingerprint_fileobj(self.msh.fileobj)
+        index = SidecarIndex.open(index_filename, self.index_fingerprint)
+        if index is not None and index.matches(self.msh):
+            return index
+        return None
+
+    def _load_body(self, index=None):
+        if index is not None:
+            self.msb.load_index(index)
+            self.index_loaded = True
+            return
+
+        self.msb.load()
+        index_filename = self._sidecar_filename() if self.use_index else None
+        if index_filename is None:
+            return
+        try:
+            SidecarIndex.write(index_filename, self.index_fingerprint, self.msh, self.msb)
+        except OSError as e:
+            # a read-only location only costs the speed up
+            self.msb.log("Unable to write the index {}: {}".format(index_filename, e))
 
     def read_page(self, page_num=None, offset=None):
         if page_num is None and offset is None:
@@ -52,30 +123,66 @@ class Memscrimper(object):
             page_num = int((offset % self.msb.page_size) / self.msb.page_size)
         return self.msb.read_page_num(page_num)
 
-    def read_to_target(self, target_filename=None, target_fileobj=None, use_buffer=True):
+    def read_pages(self, page_nums, out=None) -> list:
+        return self.msb.read_pages(page_nums, out=out)
+
+    def read_range(self, first_page, count, out=None) -> list:
+        return self.msb.read_range(first_page, count, out=out)
+
+    def page_view(self, pagenr) -> memoryview:
+        return self.msb.page_view(pagenr)
+
+    def iter_views(self, address: int, length: int):
+        return self.msb.iter_views(address, length)
+
+    def read_view(self, address: int, length: int) -> memoryview:
+        return self.msb.read_view(address, length)
+
+    def read_to_target(self, target_filename=None, target_fileobj=None, use_buffer=True, workers=None):
+        # use_buffer only applies when no target was given
+        use_buffer = use_buffer and target_filename is None and target_fileobj is None
         return self.msb.read_to_target(target_filename=target_filename,
-                                       target_fileobj=target_fileobj, use_buffer=use_buffer)
+                                       target_fileobj=target_fileobj, use_buffer=use_buffer, workers=workers)
+
+    def open_image(self, buffering=-1):
+        """Seekable binary file over the reconstructed image, buffering=0 returns the MemscrimperRawIO."""
+        raw = MemscrimperRawIO(self)
+        if buffering == 0:
+            return raw
+        return BufferedReader(raw, buffer_size=MemscrimperRawIO.BUFFER_SIZE if buffering < 0 else buffering)
 
-    def associate_reference_data(self, filename=None, data_bytes=None, load_from_file=False):
+    def associate_reference_data(self, filename=None, data_bytes=None, load_from_file=False, use_mmap=None):
         if self.ref_loaded:
             raise Exception("Attempting to asssociate more than one reference")
+        if use_mmap is None:
+            # the same I/O path as a reference given to the constructor
+            use_mmap = self.use_mmap
 
         self.ref_loaded = True
         self.ref_filename = filename
         self.ref_bytes = data_bytes
         self.ref_data_loaded = load_from_file
 
-        if self.ref_loaded and data_bytes is None:
+        if self.reference_store is not None and data_bytes is None:
+            self.ref_entry = self.reference_store.acquire(self.ref_filename)
+            self.ref_fileobj = self.ref_entry.data
+            self.ref_bytes = self.ref_entry.data
+        elif use_mmap and data_bytes is None:
+            # pages are sliced straight out of the mapping, nothing is copied up front
+            self.ref_fileobj = Util.mmap_file(self.ref_filename)
+            self.ref_bytes = self.ref_fileobj
+        elif self.ref_data_loaded and data_bytes is None:
             self.ref_bytes = open(self.ref_filename, 'rb').read()
             self.ref_fileobj = BytesIO(self.ref_bytes)
 
-        elif self.ref_loaded:
+        elif data_bytes is not None:
             self.ref_fileobj = BytesIO(self.ref_bytes)
         else:
+            # neither mapped nor loaded, pages are read through the file
             self.ref_fileobj = open(self.ref_filename, 'rb')
 
         if self.ms_loaded:
-            self.msb.associate_reference_file(self.ref_filename, self.ref_bytes, False)
+            self._associate_body_reference()
 
     def where(self, page_num=None, offset=None) -> (str, object):
         if self.ms_loaded:
@@ -94,13 +201,27 @@ class Memscrimper(object):
                                             return_buffer=return_buffer, page_num=page_num,
                                             fail_fast=fail_fast, debug=debug)
 
+    def audit_stream(self, act_target_filename=None, act_target_fileobj=None, return_buffer=False,
+                     batch_pages=None, workers=4, digest='md5', whole_image=False, fail_fast=False, debug=False):
+        return self.msb.audit_stream(act_target_filename=act_target_filename,
+                                     act_target_fileobj=act_target_fileobj, return_buffer=return_buffer,
+                                     batch_pages=batch_pages, workers=workers, digest=digest,
+                                     whole_image=whole_image, fail_fast=fail_fast, debug=debug)
+
     def enumerate_page_num(self, page_num) -> dict:
-        return self.msb.enumerate_page(page_num)
+        return self.msb.enumerate_page_num(page_num)
+
+    def runs(self, first_page=0, last_page=None):
+        return self.msb.runs(first_page, last_page)
 
     def destroy(self) -> None:
         """Closes the file handle."""
-        if self.ref_fileobj is not None:
+        if self.ref_entry is not None:
+            self.reference_store.release(self.ref_entry)
+            self.ref_entry = None
+        elif self.ref_fileobj is not None:
             self.ref_fileobj.close()
+        self.ref_fileobj = None
         self.msh.destroy()
         self.msb.destroy()
 
@@ -132,7 +253,14 @@ class Memscrimper(object):
 
     def destroy(self) -> None:
         """Closes the file handle."""
-        self.ref_fileobj.close()
+        if self.ref_entry is not None:
+            self.reference_store.release(self.ref_entry)
+            self.ref_entry = None
+        elif self.ref_fileobj is not None:
+            self.ref_fileobj.close()
+        if self.msb is not None:
+            # releases the sidecar index mapping
+            self.msb.destroy()
 
     def __getstate__(self) -> Dict[str, Any]:
         """Do not store the open _file_ attribute, our property will ensure the
@@ -140,13 +268,22 @@ class Memscrimper(object):
 
         This is necessary for multi-processing
         """
-        self.ref_fileobj = None
-        return self.__dict__
+        state = dict(self.__dict__)
+        state['ref_fileobj'] = None
+        if not isinstance(self.ref_bytes, bytes):
+            state['ref_bytes'] = None
+        # the store and its entries hold locks and mappings, they stay with this process
+        state['reference_store'] = None
+        state['ref_entry'] = None
+        return state
 
     @property
     def changed_pages(self):
         return self.msb.changed_pages
 
+    def iter_changed_pages(self, order='address', batch=None, meta=False):
+        return self.msb.iter_changed_pages(order=order, batch=batch, meta=meta)
+
     def vol_read(self, address: int, length: int, pad: bool = False, source: bool = True, force_reload: bool = False) -> bytes:
         return self.msb.vol_read(address, length, pad, source, force_reload=force_reload)
 
@@ -198,4 +335,7 @@ class Memscrimper(object):
         return self.msb.read_from_reference(page_num=page_num, offset=offset, force_reload=force_reload)
 
     def reset_pages(self):
-        return self.msb.reset_pages()
\ No newline at end of file
+        return self.msb.reset_pages()
+
+    def cache_stats(self) -> dict:
+        return self.msb.cache_stats()
\ No newline at end of file
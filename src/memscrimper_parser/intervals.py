@@ -0,0 +1,133 @@
+from array import array
+from bisect import bisect_right
+
+
+class IntervalIndex(object):
+    """Read-only page number -> value map stored as sorted [left, right] intervals.
+
+    Memory is proportional to the number of intervals rather than the number of
+    pages, and lookups bisect the interval starts.  It answers the same
+    questions the per-page reference_pages dicts did (in, [], get, len and
+    iteration over page numbers in ascending order).
+    """
+
+    def __init__(self, lefts=None, rights=None, values=None):
+        self.lefts = lefts if lefts is not None else array('Q')
+        self.rights = rights if rights is not None else array('Q')
+        self.values = values if values is not None else array('Q')
+        self._num_pages = None
+
+    @classmethod
+    def from_intervals(cls, intervals) -> 'IntervalIndex':
+        """Builds the index from (left, right, value) tuples, merging adjacent runs."""
+        lefts = array('Q')
+        rights = array('Q')
+        values = array('Q')
+        for left, right, value in sorted(intervals):
+            if len(lefts) > 0 and left == rights[-1] + 1 and value == values[-1]:
+                rights[-1] = right
+                continue
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+        return cls(lefts, rights, values)
+
+    @classmethod
+    def from_packed(cls, packed: 'PackedIntervalLists', list_values) -> 'IntervalIndex':
+        """Builds the index from packed interval lists, list i maps to list_values[i]."""
+        values = array('Q')
+        for i in range(len(packed)):
+            values.extend(array('Q', [list_values[i]]) * (packed.bounds[i + 1] - packed.bounds[i]))
+        p_lefts = packed.lefts
+        order = sorted(range(len(p_lefts)), key=p_lefts.__getitem__)
+        lefts = array('Q')
+        rights = array('Q')
+        merged = array('Q')
+        for i in order:
+            left = p_lefts[i]
+            right = packed.rights[i]
+            value = values[i]
+            if len(lefts) > 0 and left == rights[-1] + 1 and value == merged[-1]:
+                rights[-1] = right
+                continue
+            lefts.append(left)
+            rights.append(right)
+            merged.append(value)
+        return cls(lefts, rights, merged)
+
+    def _find(self, page_num) -> int:
+        i = bisect_right(self.lefts, page_num) - 1
+        if i >= 0 and page_num <= self.rights[i]:
+            return i
+        return -1
+
+    def __contains__(self, page_num) -> bool:
+        return self._find(page_num) > -1
+
+    def __getitem__(self, page_num) -> int:
+        i = self._find(page_num)
+        if i < 0:
+            raise KeyError(page_num)
+        return self.values[i]
+
+    def get(self, page_num, default=None):
+        i = self._find(page_num)
+        if i < 0:
+            return default
+        return self.values[i]
+
+    def __len__(self) -> int:
+        if self._num_pages is None:
+            self._num_pages = sum(r - l + 1 for l, r in zip(self.lefts, self.rights))
+        return self._num_pages
+
+    def __iter__(self):
+        for left, right in zip(self.lefts, self.rights):
+            yield from range(left, right + 1)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for left, right, value in self.intervals():
+            for page_num in range(left, right + 1):
+                yield page_num, value
+
+    def intervals(self):
+        return zip(self.lefts, self.rights, self.values)
+
+    @property
+    def num_intervals(self) -> int:
+        return len(self.lefts)
+
+
+class PackedIntervalLists(object):
+    """Interval lists decoded in bulk: list i is lefts/rights[bounds[i]:bounds[i + 1]].
+
+    Indexing yields the [[left, right], ...] lists parse_interval_lists returns,
+    built on demand.
+    """
+
+    def __init__(self, lefts=None, rights=None, bounds=None):
+        self.lefts = lefts if lefts is not None else array('Q')
+        self.rights = rights if rights is not None else array('Q')
+        self.bounds = bounds if bounds is not None else array('Q', [0])
+
+    def __len__(self) -> int:
+        return len(self.bounds) - 1
+
+    def __getitem__(self, i) -> list:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("interval list index out of range")
+        lo, hi = self.bounds[i], self.bounds[i + 1]
+        return [[left, right] for left, right in zip(self.lefts[lo:hi], self.rights[lo:hi])]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def num_intervals(self) -> int:
+        return len(self.lefts)
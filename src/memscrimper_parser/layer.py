@@ -3,7 +3,16 @@ from .sections import MemscrimperInterIntraDedupSection, MemscrimperDistinctSect
                       MemscrimperDiffSection
 from typing import Any, Dict
 from io import BytesIO, BufferedReader
+from array import array
 from .util import Util
+from .compression import SeekableBody, ChunkedBody
+from .pagemap import PageMap
+from .cache import PageCache
+from .parallel import ParallelReconstructor
+from .audit import StreamingAuditor
+import io
+import mmap
+import os
 import logging
 
 mp_logger = logging.getLogger(__name__)
@@ -16,6 +25,10 @@ class MemscrimperBody(object):
     INTERDEDUPNOINTRA = b"interdedupnointra"
     INTERDEDUPDELTA = b"interdedupdelta"
     INTERDEDUP = b"interdedup"
+    # pages handled per write when reconstructing runs
+    COPY_CHUNK_PAGES = 256
+    # orders accepted by iter_changed_pages
+    CHANGED_ORDERS = ('address', 'kind')
 
     @classmethod
     def disable_debug(cls):
@@ -38,8 +51,11 @@ class MemscrimperBody(object):
         if cls.DEBUG:
             mp_logger.debug("{} {}".format(cls.name, msg))
 
-    def __init__(self, method, page_size, body_bytes, uncompressed_size):
+    def __init__(self, method, page_size, body_bytes, uncompressed_size, cache_policy=None, cache_bytes=None,
+                 src_cache_bytes=None, lazy=False):
         self.method = method
+        # lazy: load() only locates the sections, each is decoded on its first lookup
+        self.lazy = lazy
         self.body_bytes = body_bytes
         self.uncompressed_size = uncompressed_size
         self.start = 0
@@ -68,8 +84,13 @@ class MemscrimperBody(object):
         self.interdedupnointra_pages_section_end = None
         self.interdedupnointra_pages_section = None
 
-        self.src_fileobj = BytesIO(body_bytes)
+        if isinstance(body_bytes, SeekableBody):
+            self.src_fileobj = body_bytes
+        else:
+            self.src_fileobj = BytesIO(body_bytes)
         self.ref_fileobj = None
+        # set when the reference comes from a ReferenceStore
+        self.ref_entry = None
 
         self.pages = []
         self.interval_list = []
@@ -79,10 +100,16 @@ class MemscrimperBody(object):
 
         self.reference_look_up = {}
 
-        self.src_page_data = {}
-        self.page_data = {}
+        # reference pages and interdedup source pages are cached in separate pools
+        self.cache_policy = cache_policy
+        self.cache_bytes = cache_bytes
+        self.page_data = PageCache.create(cache_policy, cache_bytes)
+        self.src_page_data = PageCache.create(cache_policy, src_cache_bytes if src_cache_bytes is not None
+                                              else cache_bytes)
         self.ref_file_obj = None
         self._changed_pages = set()
+        self.page_map = None
+        self.index = None
         # self.src_file_obj = BytesIO(self.body_bytes)
 
         self.methods_handlers = [
@@ -101,15 +128,30 @@ class MemscrimperBody(object):
         if self._body_parser is None:
             raise Exception("{} is not a valid method".format(self.method))
 
-    def associate_reference_file(self, filename=None, data_bytes=None, load_from_file=False):
+    def associate_reference_file(self, filename=None, data_bytes=None, load_from_file=False, use_mmap=False,
+                                 fileobj=None):
         self.ref_filename = filename
         self.ref_bytes = data_bytes
         self.ref_loaded = filename is not None or data_bytes is not None
-        if data_bytes is None and not load_from_file:
+        if fileobj is not None:
+            # read through the caller's open file rather than opening another one
+            self.ref_fileobj = fileobj
+        elif isinstance(data_bytes, mmap.mmap):
+            # share the caller's mapping rather than copying it into a BytesIO
+            self.ref_fileobj = data_bytes
+        elif data_bytes is None and use_mmap:
+            self.ref_fileobj = Util.mmap_file(self.ref_filename)
+        elif data_bytes is None and not load_from_file:
             self.ref_fileobj = open(self.ref_filename, 'rb')
         elif data_bytes is not None:
             self.ref_fileobj = BytesIO(self.ref_bytes)
 
+    def associate_reference_entry(self, entry) -> None:
+        """Reads the reference through a ReferenceStore entry, sharing its mapping and page cache."""
+        self.associate_reference_file(entry.filename, entry.data, False)
+        self.page_data = entry.page_data
+        self.ref_entry = entry
+
         # if self.distinct_pages_section is not None:
         #     self.distinct_pages_section.associate_reference_file(filename=filename, data_bytes=data_bytes,
         #                                                          load_from_file=load_from_file)
@@ -126,6 +168,7 @@ class MemscrimperBody(object):
     def where(self, page_num=None, offset=None) -> (str, object):
         if page_num is None and offset is None:
             return None
+        self._load_sections()
         if offset is not None:
             page_num = (offset % self.page_size) / self.page_size
 
@@ -159,6 +202,7 @@ class MemscrimperBody(object):
         return (name, result)
 
     def collect_page_nums(self) -> dict:
+        self._load_sections()
         results = {}
 
         if self.distinct_pages_section is not None:
@@ -199,50 +243,120 @@ class MemscrimperBody(object):
                     and self.minimum_address <= offset + length - 1 <= self.maximum_address)
 
     def destroy(self) -> None:
-        """Closes the file handle."""
-        self.ref_fileobj.close()
+        """Closes the file handle and the sidecar index, a shared reference is released by its owner."""
+        if self.ref_entry is None and self.ref_fileobj is not None:
+            self.ref_fileobj.close()
+        if self.index is not None:
+            self.index.close()
+            self.index = None
 
     def __getstate__(self) -> Dict[str, Any]:
-        if isinstance(self.ref_fileobj, BufferedReader):
-            self.ref_fileobj = None
-        return self.__dict__
+        # the handles are dropped from a copy, the live body keeps reading through them
+        state = dict(self.__dict__)
+        if self.index is not None:
+            # memoryviews into the sidecar mapping can not be pickled
+            state['page_map'] = PageMap(self.page_map.num_pages, array('Q', self.page_map.starts),
+                                        array('Q', self.page_map.ends), array('B', self.page_map.kinds),
+                                        array('Q', self.page_map.values))
+            if self.diff_pages_section is not None:
+                state['diff_pages_section'] = MemscrimperDiffSection.from_offsets(
+                    self.body_bytes, array('Q', self.index.diff_pagenrs), array('Q', self.index.diff_offsets))
+            state['index'] = None
+        if isinstance(self.ref_fileobj, (BufferedReader, mmap.mmap)):
+            state['ref_fileobj'] = None
+            state['ref_bytes'] = None
+        if self.ref_entry is not None:
+            # the shared mapping and page cache stay with the store
+            state['ref_entry'] = None
+            state['page_data'] = PageCache.create(self.cache_policy, self.cache_bytes)
+        return state
 
     @property
     def changed_pages(self):
-        return self._changed_pages
+        return self._enumerate_changed_pages()
 
     def is_valid(self, offset: int, length: int) -> bool:
         return bool(self.minimum_address <= offset <= self.maximum_address and \
                     self.minimum_address <= offset + length - 1 <= self.maximum_address)
 
     def enumerate_page_num(self, page_num) -> dict:
+        self._load_sections()
         results = {}
+        kind, _ = self.resolve_page(page_num)
+        section = self._kind_section(kind)
+        if section is not None:
+            results[section.name] = [page_num, section]
+        return results
 
-        if self.distinct_pages_section is not None:
-            has_page = self.distinct_pages_section.has_page(page_num=page_num)
-            if has_page:
-                results[self.distinct_pages_section.name] = [page_num, self.distinct_pages_section]
-
-        if self.interdedup_pages_section is not None:
-            has_page = self.interdedup_pages_section .has_page(page_num=page_num)
-            if has_page:
-                results[self.interdedup_pages_section .name] = [page_num, self.interdedup_pages_section ]
-
-        if self.interdedupnointra_pages_section is not None:
-            has_page = self.interdedupnointra_pages_section.has_page(page_num=page_num)
-            if has_page:
-                results[self.interdedupnointra_pages_section.name] = [page_num, self.interdedupnointra_pages_section]
+    def _kind_section(self, kind):
+        if kind == PageMap.DISTINCT:
+            return self.distinct_pages_section
+        elif kind == PageMap.DIFF:
+            return self.diff_pages_section
+        elif kind == PageMap.SOURCE:
+            if self.interdedupnointra_pages_section is not None:
+                return self.interdedupnointra_pages_section
+            return self.interdedup_pages_section
+        return None
 
+    @property
+    def num_pages(self) -> int:
+        return -(-self.uncompressed_size // self.page_size)
 
+    def _build_page_map(self) -> PageMap:
+        claims = []
+        if self.distinct_pages_section is not None:
+            claims.append((PageMap.DISTINCT, self.distinct_pages_section.reference_pages.intervals()))
         if self.diff_pages_section is not None:
-            has_page = self.diff_pages_section.has_page(page_num=page_num)
-            if has_page:
-                results[self.diff_pages_section.name] = [page_num, self.diff_pages_section]
-
-        return results
+            diff_runs = []
+            for pagenr in sorted(self.diff_pages_section.reference_pages):
+                if diff_runs and diff_runs[-1][1] == pagenr - 1:
+                    diff_runs[-1][1] = pagenr
+                else:
+                    diff_runs.append([pagenr, pagenr, pagenr])
+            claims.append((PageMap.DIFF, diff_runs))
+        if self.interdedupnointra_pages_section is not None:
+            claims.append((PageMap.SOURCE, self.interdedupnointra_pages_section.reference_pages.intervals()))
+        if self.interdedup_pages_section is not None:
+            claims.append((PageMap.SOURCE, self.interdedup_pages_section.reference_pages.intervals()))
+        self.page_map = PageMap.build(self.num_pages, claims)
+        self.log("Built page map with {} runs".format(self.page_map.num_runs))
+        return self.page_map
+
+    def runs(self, first_page=0, last_page=None):
+        """Yields run-length encoded (first, last, kind, index) page sources, see PageMap."""
+        if self.page_map is None:
+            self._build_page_map()
+        return self.page_map.runs(first_page, last_page)
+
+    def resolve_page(self, pagenr) -> (int, int):
+        if self.page_map is not None:
+            return self.page_map.resolve(pagenr)
+        return self._resolve_page_sections(pagenr)
+
+    def _resolve_page_sections(self, pagenr) -> (int, int):
+        if self.distinct_pages_section is not None and \
+                self.distinct_pages_section.has_page(pagenr):
+            return PageMap.DISTINCT, self.distinct_pages_section.convert_pagenr(pagenr)
+        elif self.diff_pages_section is not None and \
+                self.diff_pages_section.has_page(pagenr):
+            return PageMap.DIFF, pagenr
+        elif self.interdedupnointra_pages_section is not None and \
+                self.interdedupnointra_pages_section.has_page(pagenr):
+            return PageMap.SOURCE, self.interdedupnointra_pages_section.convert_pagenr(pagenr)
+        elif self.interdedup_pages_section is not None and \
+                self.interdedup_pages_section.has_page(pagenr):
+            return PageMap.SOURCE, self.interdedup_pages_section.convert_pagenr(pagenr)
+        return PageMap.REFERENCE, pagenr
 
     def reset_pages(self):
-        self.page_data = {}
+        # a ReferenceStore's page cache is shared with the other dumps, it is cleared by the store
+        if self.ref_entry is None:
+            self.page_data.clear()
+        self.src_page_data.clear()
+
+    def cache_stats(self) -> dict:
+        return {'reference': self.page_data.stats(), 'source': self.src_page_data.stats()}
 
     def vol_read(self, address: int, length: int, pad: bool = False, source: bool = True, force_reload=False) -> bytes:
 
@@ -253,19 +367,28 @@ class MemscrimperBody(object):
             raise Exception(self.name, invalid_address, "Offset outside of the buffer boundaries")
         min_page_num = int(address / self.page_size)
         max_page_num = int((address+length) / self.page_size)
-        pages = []
+        data = bytearray((max_page_num - min_page_num + 1) * self.page_size)
+        view = memoryview(data)
+        cursor = 0
         for page_num in range(min_page_num, max_page_num+1):
-            page = None
+            slot = view[cursor:cursor + self.page_size]
             if source:
-                page = self.read_page_num(page_num, force_reload=force_reload)
+                consumed = self.read_page_into(page_num, slot, force_reload=force_reload)
             else:
                 page = self.read_from_reference(page_num, force_reload=force_reload)
-            pages.append(page)
+                consumed = None
+                if page is not None:
+                    slot[:len(page)] = page
+                    consumed = len(page)
+            if consumed is None:
+                raise Exception("Unable to read from page number: {}".format(page_num))
+            cursor += consumed
 
-        data = b"".join(pages)
         start = address % self.page_size
-
-        return data[ start : start + length]
+        # one copy out of the buffer, slicing the bytearray first would copy twice
+        result = bytes(view[start : min(start + length, cursor)])
+        view.release()
+        return result
 
     def read(self, offset: int, length: int, pad: bool) -> bytes:
         return self.vol_read(offset, length, pad)
@@ -275,6 +398,34 @@ class MemscrimperBody(object):
         self._body_parser()
         return self
 
+    def load_index(self, index) -> object:
+        """Takes the parse results from a SidecarIndex instead of parsing the sections."""
+        self.reference_image_name = bytes(index.reference_name)
+        self.page_data_base = index.page_data_base
+        self.page_map = index.page_map()
+        if len(index.diff_pagenrs) > 0:
+            self.diff_pages_section = MemscrimperDiffSection.from_offsets(self.body_bytes, index.diff_pagenrs,
+                                                                          index.diff_offsets)
+        self.index = index
+        self._enumerate_changed_pages()
+        return self
+
+    def _load_sections(self) -> None:
+        """Bodies opened from a SidecarIndex hold no section objects; where(),
+        collect_page_nums(), enumerate_page_num() and the check_* calls parse them
+        (lazily) on first use."""
+        if self.index is None or self.distinct_pages_section is not None:
+            return
+        lazy = self.lazy
+        self.lazy = True
+        self.offset = 0
+        self.src_fileobj.seek(0)
+        try:
+            self._read_reference_name()
+            self._body_parser()
+        finally:
+            self.lazy = lazy
+
     def read_from_reference(self, page_num=None, offset=None, force_reload=False):
         if page_num is None and offset is None:
             return None
@@ -282,12 +433,17 @@ class MemscrimperBody(object):
             offset = page_num * self.page_size
         if page_num is None:
             page_num = int((offset % self.page_size) / self.page_size)
-        if page_num in self.page_data and not force_reload:
-            return self.page_data[page_num]
+        if not force_reload:
+            page = self.page_data.get(page_num)
+            if page is not None:
+                return page
         if self.ref_fileobj is None:
             return None
-        self.ref_fileobj.seek(offset)
-        page = self.ref_fileobj.read(self.page_size)
+        if isinstance(self.ref_fileobj, mmap.mmap):
+            page = self.ref_fileobj[offset:offset + self.page_size]
+        else:
+            self.ref_fileobj.seek(offset)
+            page = self.ref_fileobj.read(self.page_size)
         self.page_data[page_num] = page
         return page
 
@@ -297,8 +453,10 @@ class MemscrimperBody(object):
         if src_page_num is not None:
             offset = src_page_num * self.page_size + self.page_data_base
 
-        if src_page_num in self.src_page_data and force_reload:
-            return self.src_page_data[src_page_num]
+        if not force_reload:
+            page = self.src_page_data.get(src_page_num)
+            if page is not None:
+                return page
 
         src_offset = self.page_size * src_page_num + self.page_data_base
         self.src_fileobj.seek(src_offset)
@@ -306,7 +464,119 @@ class MemscrimperBody(object):
         self.src_page_data[src_page_num] = page
         return page
 
-    def read_to_target(self, target_filename=None, target_fileobj=None, use_buffer=False):
+    def _reference_buffer(self):
+        if isinstance(self.ref_fileobj, mmap.mmap):
+            return self.ref_fileobj
+        if isinstance(self.ref_bytes, (bytes, bytearray, memoryview)):
+            return self.ref_bytes
+        return None
+
+    def _body_buffer(self):
+        if isinstance(self.body_bytes, SeekableBody):
+            return None
+        return self.body_bytes
+
+    def reference_view(self, page_num) -> memoryview:
+        """memoryview of reference page page_num, into the mapping when the reference is
+        mapped or in memory, else over the cached copy."""
+        buffer = self._reference_buffer()
+        if buffer is None:
+            page = self.read_from_reference(page_num=page_num)
+            return None if page is None else memoryview(page)
+        offset = page_num * self.page_size
+        return memoryview(buffer)[offset:offset + self.page_size]
+
+    def src_view(self, src_page_num) -> memoryview:
+        """memoryview of interdedup source page src_page_num, into the decompressed body
+        unless it is streamed from a SeekableBody."""
+        buffer = self._body_buffer()
+        if buffer is None:
+            return memoryview(self.read_from_src(src_page_num=src_page_num))
+        offset = src_page_num * self.page_size + self.page_data_base
+        return memoryview(buffer)[offset:offset + self.page_size]
+
+    def _diff_view(self, first_page, ref_page_num, count) -> memoryview:
+        if self.ref_fileobj is None:
+            raise Exception("Unable to read from page number: {}".format(first_page))
+        ps = self.page_size
+        view = memoryview(bytearray(count * ps))
+        filled = self._read_reference_into(ref_page_num, count, view)
+        for i in range(count):
+            self.diff_pages_section.apply_page_diff(first_page + i, None, out=view[i * ps:(i + 1) * ps])
+        return view[:filled]
+
+    def page_view(self, pagenr) -> memoryview:
+        """memoryview of page pagenr, only diff pages are copied (and patched)."""
+        kind, index = self.resolve_page(pagenr)
+        if kind == PageMap.DIFF:
+            return self._diff_view(pagenr, index, 1)
+        if kind == PageMap.SOURCE:
+            return self.src_view(index)
+        return self.reference_view(index)
+
+    def iter_views(self, address: int, length: int):
+        """Yields (address, memoryview) pieces covering [address, address + length) of the
+        image in order.
+
+        A reference run is one view into the reference, distinct and
+        interdedup source pages are one view per page into the reference or
+        the body, a diff run is a single patched copy.  The views share the
+        reference mapping: release them before destroy() closes it.
+        """
+        ps = self.page_size
+        end = min(address + length, self.num_pages * ps)
+        if address < 0 or end <= address:
+            return
+        for first, last, kind, index in self.runs(address // ps, (end - 1) // ps):
+            start = max(first * ps, address)
+            stop = min((last + 1) * ps, end)
+            if kind in PageMap.LINEAR_KINDS:
+                lo = start // ps
+                hi = (stop - 1) // ps
+                ref_page_num = index + lo - first
+                if kind == PageMap.DIFF:
+                    view = self._diff_view(lo, ref_page_num, hi - lo + 1)
+                else:
+                    buffer = self._reference_buffer()
+                    if buffer is None:
+                        view = memoryview(bytearray((hi - lo + 1) * ps))
+                        view = view[:self._read_reference_into(ref_page_num, hi - lo + 1, view)]
+                    else:
+                        view = memoryview(buffer)[ref_page_num * ps:(ref_page_num + hi - lo + 1) * ps]
+                yield start, view[start - lo * ps:stop - lo * ps]
+                continue
+            page = self.src_view(index) if kind == PageMap.SOURCE else self.reference_view(index)
+            if page is None:
+                raise Exception("Unable to read from page number: {}".format(first))
+            pos = start
+            while pos < stop:
+                skew = pos % ps
+                n = min(ps - skew, stop - pos)
+                yield pos, page[skew:skew + n]
+                pos += n
+
+    def read_view(self, address: int, length: int) -> memoryview:
+        """memoryview of [address, address + length), zero copy when the range lies in a
+        single reference run or page, else the pieces of iter_views joined once."""
+        pieces = list(self.iter_views(address, length))
+        if len(pieces) == 1:
+            return pieces[0][1]
+        return memoryview(b''.join(view for _, view in pieces))
+
+    def read_to_target(self, target_filename=None, target_fileobj=None, use_buffer=False, workers=None):
+        if workers is not None and workers > 1:
+            if target_filename is None or target_fileobj is not None or use_buffer:
+                raise Exception("Parallel reconstruction writes to target_filename only")
+            # the same 'wb' handle as the serial path, positioned at the end of the image
+            target_fileobj = open(target_filename, 'wb')
+            try:
+                ParallelReconstructor(self, workers=workers).run(target_filename, target_fileobj)
+            except BaseException:
+                target_fileobj.close()
+                raise
+            target_fileobj.seek(0, 2)
+            return target_fileobj
+
         if use_buffer:
             target_fileobj = BytesIO()
         elif target_filename is not None and target_fileobj is None:
@@ -315,26 +585,270 @@ class MemscrimperBody(object):
         if target_fileobj is None:
             raise Exception("Nothing to write too.")
 
-        num_pages = self.uncompressed_size / self.page_size
-        pagenr = 0
-        offset = 0
-        while pagenr < num_pages:
-            page = self.read_page_num(pagenr)
-
-            if page is None:
-                raise Exception("Unable to read from page number: {}".format(pagenr))
+        buf = bytearray(self.COPY_CHUNK_PAGES * self.page_size)
+        view = memoryview(buf)
+        for first, last, kind, index in self.runs():
+            count = last - first + 1
+            if kind == PageMap.REFERENCE:
+                self._copy_reference_run(target_fileobj, first, index, count)
+            elif kind == PageMap.DIFF:
+                self._write_diff_run(target_fileobj, first, index, count, view)
+            else:
+                self._write_repeated_run(target_fileobj, first, kind, index, count)
+        view.release()
+        return target_fileobj
 
-            if target_fileobj is not None:
-                target_fileobj.write(page)
+    def _copy_reference_run(self, target_fileobj, pagenr, ref_page_num, count):
+        """Copies count unchanged reference pages in large blocks, kernel side when both ends are files."""
+        if self.ref_fileobj is None:
+            raise Exception("Unable to read from page number: {}".format(pagenr))
+        offset = ref_page_num * self.page_size
+        length = count * self.page_size
+        chunk = self.COPY_CHUNK_PAGES * self.page_size
+        if isinstance(self.ref_fileobj, mmap.mmap):
+            end = offset + length
+            if end > len(self.ref_fileobj):
+                self._short_reference(pagenr, offset, max(len(self.ref_fileobj) - offset, 0), length)
+            with memoryview(self.ref_fileobj) as ref_view:
+                while offset < end:
+                    target_fileobj.write(ref_view[offset:min(offset + chunk, end)])
+                    offset += chunk
+            return
+
+        copied = self._copy_file_range(target_fileobj, offset, length)
+        pos = offset + copied
+        remaining = length - copied
+        self.ref_fileobj.seek(pos)
+        while remaining > 0:
+            data = self.ref_fileobj.read(min(chunk, remaining))
+            if not data:
+                break
+            target_fileobj.write(data)
+            remaining -= len(data)
+        if remaining > 0:
+            self._short_reference(pagenr, offset, length - remaining, length)
+
+    def _short_reference(self, pagenr, offset, copied, length):
+        raise Exception("Unable to read from page number: {}, short read from the reference at {:08x}: "
+                        "{} of {} bytes".format(pagenr, offset, copied, length))
+
+    def _copy_file_range(self, target_fileobj, offset, length) -> int:
+        """Copies with os.copy_file_range (falling back to os.sendfile) and returns the
+        bytes copied, 0 when either side is not a plain file."""
+        try:
+            src_fd = self.ref_fileobj.fileno()
+            dst_fd = target_fileobj.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return 0
+        target_fileobj.flush()
+        dst_offset = target_fileobj.tell()
+        copied = 0
+        for method in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, method):
+                continue
+            try:
+                while copied < length:
+                    if method == 'copy_file_range':
+                        n = os.copy_file_range(src_fd, dst_fd, length - copied, offset + copied, dst_offset + copied)
+                    else:
+                        os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+                        n = os.sendfile(dst_fd, src_fd, offset + copied, length - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                break
+            except OSError as e:
+                self.log("{} failed, falling back: {}".format(method, e))
+        target_fileobj.seek(dst_offset + copied)
+        return copied
+
+    def _read_reference_into(self, ref_page_num, count, out) -> int:
+        offset = ref_page_num * self.page_size
+        length = count * self.page_size
+        if isinstance(self.ref_fileobj, mmap.mmap):
+            end = min(offset + length, len(self.ref_fileobj))
+            if end <= offset:
+                return 0
+            with memoryview(self.ref_fileobj) as ref_view:
+                out[:end - offset] = ref_view[offset:end]
+            return end - offset
+        self.ref_fileobj.seek(offset)
+        if hasattr(self.ref_fileobj, 'readinto'):
+            return self.ref_fileobj.readinto(out[:length])
+        data = self.ref_fileobj.read(length)
+        out[:len(data)] = data
+        return len(data)
 
-            offset += self.page_size
-            pagenr += 1
+    def _write_diff_run(self, target_fileobj, pagenr, ref_page_num, count, view):
+        if self.ref_fileobj is None:
+            raise Exception("Unable to read from page number: {}".format(pagenr))
+        while count > 0:
+            n = min(count, self.COPY_CHUNK_PAGES)
+            consumed = self._read_reference_into(ref_page_num, n, view)
+            if consumed < n * self.page_size:
+                self._short_reference(pagenr, ref_page_num * self.page_size, consumed, n * self.page_size)
+            for i in range(n):
+                slot = view[i * self.page_size:(i + 1) * self.page_size]
+                self.diff_pages_section.apply_page_diff(pagenr + i, None, out=slot)
+            target_fileobj.write(view[:consumed])
+            pagenr += n
+            ref_page_num += n
+            count -= n
+
+    def _write_repeated_run(self, target_fileobj, pagenr, kind, index, count):
+        """Distinct and source runs map every page to the same page, read it once."""
+        if kind == PageMap.SOURCE:
+            page = self.read_from_src(src_page_num=index)
+        else:
+            page = self.read_from_reference(page_num=index)
+        if page is None:
+            raise Exception("Unable to read from page number: {}".format(pagenr))
+        block = page * min(count, self.COPY_CHUNK_PAGES)
+        while count > 0:
+            n = min(count, self.COPY_CHUNK_PAGES)
+            target_fileobj.write(block[:n * len(page)])
+            count -= n
+
+    def _fill_range(self, first_page, count, out) -> int:
+        """Reconstructs pages [first_page, first_page + count) into out run by run and
+        returns the number of bytes filled."""
+        ps = self.page_size
+        cursor = 0
+        for first, last, kind, index in self.runs(first_page, first_page + count - 1):
+            n = last - first + 1
+            slot = out[cursor:cursor + n * ps]
+            if kind in PageMap.LINEAR_KINDS:
+                if self.ref_fileobj is None:
+                    raise Exception("Unable to read from page number: {}".format(first))
+                filled = self._read_reference_into(index, n, slot)
+                if kind == PageMap.DIFF:
+                    for i in range(n):
+                        self.diff_pages_section.apply_page_diff(first + i, None, out=slot[i * ps:(i + 1) * ps])
+            else:
+                if kind == PageMap.SOURCE:
+                    page = self.read_from_src(src_page_num=index)
+                else:
+                    page = self.read_from_reference(page_num=index)
+                if page is None:
+                    raise Exception("Unable to read from page number: {}".format(first))
+                for i in range(n):
+                    slot[i * ps:i * ps + len(page)] = page
+                filled = n * len(page)
+            cursor += filled
+        return cursor
+
+    def read_range(self, first_page, count, out=None) -> list:
+        """Reconstructs pages [first_page, first_page + count) into out (or a new buffer)
+        run by run and returns one memoryview per page."""
+        ps = self.page_size
+        count = max(min(count, self.num_pages - first_page), 0)
+        view = self._pages_buffer(count, out)
+        self._fill_range(first_page, count, view)
+        return [view[i * ps:(i + 1) * ps] for i in range(count)]
+
+    def read_pages(self, page_nums, out=None) -> list:
+        """Reads page_nums into consecutive page size slots of out (or a new buffer) and
+        returns one memoryview per requested page, in request order.
+
+        Runs of consecutive page numbers are filled run by run like read_range.
+        The remaining pages are grouped by source: reference and diff pages are
+        sorted by reference page and read with one call per contiguous block,
+        distinct and interdedup source pages are read once however often they
+        occur.
+        """
+        ps = self.page_size
+        page_nums = list(page_nums)
+        view = self._pages_buffer(len(page_nums), out)
+        linear = []
+        repeated = {}
+        singles = []
+        slot = 0
+        while slot < len(page_nums):
+            end = slot + 1
+            while end < len(page_nums) and page_nums[end] == page_nums[end - 1] + 1:
+                end += 1
+            if end - slot > 1:
+                self._fill_range(page_nums[slot], end - slot, view[slot * ps:end * ps])
+            else:
+                singles.append(slot)
+            slot = end
+
+        for slot in singles:
+            pagenr = page_nums[slot]
+            kind, index = self.resolve_page(pagenr)
+            if kind in PageMap.LINEAR_KINDS:
+                linear.append((index, slot, pagenr, kind))
+            else:
+                repeated.setdefault((kind, index), []).append(slot)
 
-        return target_fileobj
+        linear.sort()
+        self._read_linear_pages(linear, view)
+        for (kind, index), slots in repeated.items():
+            if kind == PageMap.SOURCE:
+                page = self.read_from_src(src_page_num=index)
+            else:
+                page = self.read_from_reference(page_num=index)
+            if page is None:
+                raise Exception("Unable to read from page number: {}".format(index))
+            for slot in slots:
+                view[slot * ps:slot * ps + len(page)] = page
+        return [view[i * ps:(i + 1) * ps] for i in range(len(page_nums))]
+
+    def _pages_buffer(self, count, out=None) -> memoryview:
+        if out is None:
+            out = bytearray(count * self.page_size)
+        view = memoryview(out)
+        if len(view) < count * self.page_size:
+            raise Exception("Buffer of {} bytes is too small for {} pages".format(len(view), count))
+        return view
+
+    def _read_linear_pages(self, linear, view) -> None:
+        """linear holds (ref_page_num, slot, pagenr, kind) sorted by reference page."""
+        if len(linear) > 0 and self.ref_fileobj is None:
+            raise Exception("Unable to read from page number: {}".format(linear[0][2]))
+        ps = self.page_size
+        scratch = None
+        i = 0
+        while i < len(linear):
+            # a block of consecutive reference pages, read with one call
+            j = i + 1
+            while j < len(linear) and j - i < self.COPY_CHUNK_PAGES and linear[j][0] == linear[j - 1][0] + 1:
+                j += 1
+            n = j - i
+            first_slot = linear[i][1]
+            if all(linear[i + k][1] == first_slot + k for k in range(n)):
+                self._read_reference_into(linear[i][0], n, view[first_slot * ps:(first_slot + n) * ps])
+            else:
+                if scratch is None:
+                    scratch = memoryview(bytearray(self.COPY_CHUNK_PAGES * ps))
+                filled = self._read_reference_into(linear[i][0], n, scratch)
+                for k in range(n):
+                    slot = linear[i + k][1]
+                    page = scratch[k * ps:min((k + 1) * ps, filled)]
+                    view[slot * ps:slot * ps + len(page)] = page
+            for k in range(i, j):
+                _, slot, pagenr, kind = linear[k]
+                if kind == PageMap.DIFF:
+                    self.diff_pages_section.apply_page_diff(pagenr, None, out=view[slot * ps:(slot + 1) * ps])
+            i = j
+
+    def audit_stream(self, act_target_filename=None, act_target_fileobj=None, return_buffer=False,
+                     batch_pages=None, workers=4, digest='md5', whole_image=False, fail_fast=False, debug=False):
+        """Audits the whole image in batches, returns (buffer or None, AuditReport)."""
+        target_fileobj = BytesIO() if return_buffer else None
+        if act_target_filename is not None and act_target_fileobj is None:
+            with open(act_target_filename, 'rb') as act_target_fileobj:
+                return self.audit_stream(act_target_fileobj=act_target_fileobj, return_buffer=return_buffer,
+                                         batch_pages=batch_pages, workers=workers, digest=digest,
+                                         whole_image=whole_image, fail_fast=fail_fast, debug=debug)
+        if act_target_fileobj is None:
+            raise Exception("Unable to audit the file")
+        auditor = StreamingAuditor(self, batch_pages=batch_pages, workers=workers, digest=digest,
+                                   whole_image=whole_image, fail_fast=fail_fast, debug=debug)
+        return target_fileobj, auditor.run(act_target_fileobj, target_fileobj)
 
     def audit_decompression(self, act_target_filename=None, act_target_fileobj=None,
                             return_buffer=False, page_num=None, fail_fast=True, debug=False):
-
         def audit_page(pagenr, act_target, output):
             page = self.read_page_num(pagenr)
             act_page = act_target.read(self.page_size)
@@ -379,85 +893,105 @@ class MemscrimperBody(object):
 
     def read_meta_page_num(self, pagenr):
         page = None
-        if self.distinct_pages_section is not None and \
-                self.distinct_pages_section.has_page(pagenr):
-            pass
-        elif self.diff_pages_section is not None and \
-                self.diff_pages_section.has_page(pagenr):
-
+        kind, index = self.resolve_page(pagenr)
+        if kind == PageMap.DIFF:
             page = b'\x00' * self.page_size
             page = self.diff_pages_section.apply_page_diff(pagenr, page)
-        elif self.interdedupnointra_pages_section is not None and \
-                self.interdedupnointra_pages_section.has_page(pagenr):
-
-            page_num = self.interdedupnointra_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_src(src_page_num=page_num)
-        elif self.interdedup_pages_section is not None and \
-                self.interdedup_pages_section.has_page(pagenr):
-            page_num = self.interdedup_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_src(src_page_num=page_num)
+        elif kind == PageMap.SOURCE:
+            page = self.read_from_src(src_page_num=index)
         return page
 
     def read_page_num(self, pagenr, force_reload=False):
-        page = None
-        if self.distinct_pages_section is not None and \
-                self.distinct_pages_section.has_page(pagenr):
-
-            page_num = self.distinct_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_reference(page_num=page_num, force_reload=force_reload)
-        elif self.diff_pages_section is not None and \
-                self.diff_pages_section.has_page(pagenr):
-
-            page_num = self.diff_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_reference(page_num=page_num, force_reload=force_reload)
+        kind, index = self.resolve_page(pagenr)
+        if kind == PageMap.SOURCE:
+            return self.read_from_src(src_page_num=index, force_reload=force_reload)
+        page = self.read_from_reference(page_num=index, force_reload=force_reload)
+        if kind == PageMap.DIFF:
             page = self.diff_pages_section.apply_page_diff(pagenr, page)
-        elif self.interdedupnointra_pages_section is not None and \
-                self.interdedupnointra_pages_section.has_page(pagenr):
+        return page
 
-            page_num = self.interdedupnointra_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_src(src_page_num=page_num, force_reload=force_reload)
-        elif self.interdedup_pages_section is not None and \
-                self.interdedup_pages_section.has_page(pagenr):
-            page_num = self.interdedup_pages_section.convert_pagenr(pagenr)
-            page = self.read_from_src(src_page_num=page_num, force_reload=force_reload)
+    def read_page_into(self, pagenr, out, force_reload=False) -> int:
+        """Writes page pagenr into the writable buffer out and returns the bytes written,
+        diff pages are patched in place rather than copied."""
+        kind, index = self.resolve_page(pagenr)
+        if kind == PageMap.SOURCE:
+            page = self.read_from_src(src_page_num=index, force_reload=force_reload)
         else:
-            page = self.read_from_reference(page_num=pagenr, force_reload=force_reload)
-        return page
+            page = self.read_from_reference(page_num=index, force_reload=force_reload)
+        if page is None:
+            return None
+        if kind == PageMap.DIFF:
+            self.diff_pages_section.apply_page_diff(pagenr, page, out=out)
+        else:
+            out[:len(page)] = page
+        return len(page)
 
     def _did_page_change(self, pagenr) -> bool:
-        changed = False
-        if self.distinct_pages_section is not None and \
-                self.distinct_pages_section.has_page(pagenr):
-            return False
-        elif self.diff_pages_section is not None and \
-                self.diff_pages_section.has_page(pagenr):
-            return True
-        elif self.interdedupnointra_pages_section is not None and \
-                self.interdedupnointra_pages_section.has_page(pagenr):
-            return True
-        elif self.interdedup_pages_section is not None and \
-                self.interdedup_pages_section.has_page(pagenr):
-            return True
-        else:
-            return False
+        kind, _ = self.resolve_page(pagenr)
+        return kind in PageMap.CHANGED_KINDS
 
     def did_page_change(self, pagenr) -> bool:
         return pagenr in self.changed_pages
 
     def _enumerate_changed_pages(self) -> set:
 
-        if len(self.changed_pages) > 0:
-            return self.changed_pages
+        if len(self._changed_pages) > 0:
+            return self._changed_pages
 
-        pagenr = 0
-        num_pages = self.uncompressed_size / self.page_size
         self._changed_pages = set()
-        while pagenr < num_pages:
-            if self._did_page_change(pagenr):
-                self._changed_pages.add(pagenr)
-            pagenr += 1
+        for first, last, kind, _ in self.runs():
+            if kind in PageMap.CHANGED_KINDS:
+                self._changed_pages.update(range(first, last + 1))
         return self._changed_pages
 
+    def iter_changed_pages(self, order='address', batch=None, meta=False):
+        """Yields lists of up to batch (pagenr, kind, memoryview) for the diff and interdedup
+        source pages, straight from the page map runs.
+
+        order='address' yields the pages by page number, order='kind' the diff
+        pages before the source pages.  The pages of a list are consecutive
+        slots of one fresh buffer, so they can be written with one writelines.
+        meta=True patches diff pages onto zero pages like read_meta_page_num,
+        which does not need the reference.
+        """
+        if order not in self.CHANGED_ORDERS:
+            raise Exception("Unsupported order {}, expected one of {}".format(order, self.CHANGED_ORDERS))
+        batch = batch or self.COPY_CHUNK_PAGES
+        ps = self.page_size
+        runs = [run for run in self.runs() if run[2] in PageMap.CHANGED_KINDS]
+        if order == 'kind':
+            runs.sort(key=lambda run: run[2])
+        view = None
+        pages = []
+        for first, last, kind, index in runs:
+            if kind == PageMap.SOURCE:
+                page = self.src_view(index)
+            elif not meta and self.ref_fileobj is None:
+                raise Exception("Unable to read from page number: {}".format(first))
+            pagenr = first
+            while pagenr <= last:
+                if view is None:
+                    view = memoryview(bytearray(batch * ps))
+                    pages = []
+                slot = len(pages)
+                n = min(last - pagenr + 1, batch - slot)
+                out = view[slot * ps:(slot + n) * ps]
+                if kind == PageMap.SOURCE:
+                    for i in range(n):
+                        out[i * ps:i * ps + len(page)] = page
+                else:
+                    if not meta:
+                        self._read_reference_into(index + pagenr - first, n, out)
+                    for i in range(n):
+                        self.diff_pages_section.apply_page_diff(pagenr + i, None, out=out[i * ps:(i + 1) * ps])
+                pages.extend((pagenr + i, kind, out[i * ps:(i + 1) * ps]) for i in range(n))
+                pagenr += n
+                if len(pages) == batch:
+                    yield pages
+                    view = None
+        if view is not None and len(pages) > 0:
+            yield pages
+
     def _read_reference_name(self):
         cnt, self.reference_image_name = Util.read_unconstrained_null_terminated_string(self.src_fileobj)
         self.offset += cnt
@@ -466,12 +1000,20 @@ class MemscrimperBody(object):
         fo = BytesIO(self.body_bytes)
         return fo.read()
 
+    def _known_section_end(self, start: int):
+        """The end of the section at start when the body records it (chunked containers), else None."""
+        if isinstance(self.body_bytes, ChunkedBody):
+            for offset in self.body_bytes.section_offsets:
+                if offset > start:
+                    return offset
+        return None
+
     def _read_distinct_section(self, start: int):
         self.distinct_pages_section_start = start
         scn = MemscrimperDistinctSection(self.page_size, self.body_bytes, start)
         self.distinct_pages_section = scn
         try:
-            scn.load()
+            scn.load(lazy=self.lazy)
         except:
             raise
         self.distinct_pages_section_end = scn.end
@@ -480,10 +1022,10 @@ class MemscrimperBody(object):
 
     def _read_diff_section(self, start: int):
         self.diff_pages_section_start = start
-        scn = MemscrimperDiffSection(self.body_bytes, start)
+        scn = MemscrimperDiffSection(self.body_bytes, start, end=self._known_section_end(start))
         self.diff_pages_section = scn
         try:
-            scn.load()
+            scn.load(lazy=self.lazy)
         except:
             raise
         self.diff_pages_section_end = scn.end
@@ -495,7 +1037,7 @@ class MemscrimperBody(object):
         scn = MemscrimperInterDedupSection(self.body_bytes, start)
         self.interdedupnointra_pages_section = scn
         try:
-            scn.load()
+            scn.load(lazy=self.lazy)
         except:
             raise
         self.interdedupnointra_pages_section_end = scn.end
@@ -507,7 +1049,7 @@ class MemscrimperBody(object):
         scn = MemscrimperInterIntraDedupSection(self.page_size, self.body_bytes, start)
         self.interdedup_pages_section = scn
         try:
-            scn.load()
+            scn.load(lazy=self.lazy)
         except:
             raise
         self.interdedup_pages_section_end = scn.end
@@ -522,27 +1064,33 @@ class MemscrimperBody(object):
         return self._resolve_memory(page_num=page_num)
 
     def check_distict_page(self, page_num) -> bytes:
+        self._load_sections()
         if self.distinct_pages_section is not None:
             return self.diff_pages_section.recover_page(page_num=page_num)
         return None
 
     def check_interdup_page(self, page_num) -> bytes:
+        self._load_sections()
         if self.interdedup_pages_section is not None:
             return self.interdedup_pages_section.recover_page(page_num=page_num)
         return None
 
     def check_interdedupnointra_page(self, page_num) -> bytes:
+        self._load_sections()
         if self.interdedupnointra_pages_section is not None:
             return self.interdedupnointra_pages_section.recover_page(page_num=page_num)
         return None
 
     def check_diff_page(self, page_num) -> bytes:
+        self._load_sections()
         if self.diff_pages_section is not None:
             return self.diff_pages_section.recover_page(page_num=page_num)
         return None
 
     def _set_page_data_base(self):
-        self._enumerate_changed_pages()
+        if not self.lazy:
+            self._build_page_map()
+            self._enumerate_changed_pages()
         if self.interdedup_pages_section is not None:
             self.page_data_base = self.interdedup_pages_section.page_data_base
         elif self.interdedupnointra_pages_section.page_data_base is not None:
@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+from .accel import Accel
+from .util import Util
+from .writer import MemscrimperWriter, PageClassification
+import os
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+def _shard_writer(task) -> MemscrimperWriter:
+    writer = MemscrimperWriter(page_size=task['page_size'], inner=task['inner'], delta=task['delta'],
+                               diff_ratio=task['diff_ratio'])
+    # match the parent, fingerprints from both sides must be comparable
+    writer.vectorize = task['vectorize'] and Accel.ENABLED
+    return writer
+
+
+def _hash_reference_shard(task) -> list:
+    """Worker side: fingerprints of the reference pages [first, last)."""
+    writer = _shard_writer(task)
+    ref = Util.mmap_file(task['ref_filename'])
+    try:
+        return writer._fingerprints(memoryview(ref), range(task['first'], task['last']))
+    finally:
+        ref.close()
+
+
+def _hash_target_shard(task) -> tuple:
+    """Worker side: the changed target pages in [first, last) and their fingerprints."""
+    writer = _shard_writer(task)
+    ps = writer.page_size
+    first, last, ref_pages = task['first'], task['last'], task['ref_pages']
+    ref = Util.mmap_file(task['ref_filename'])
+    target = Util.mmap_file(task['target_filename'])
+    try:
+        ref_view = memoryview(ref)
+        target_view = memoryview(target)
+        common = max(min(last, ref_pages) - first, 0)
+        changed = [first + i for i in writer._changed_pages(ref_view[first * ps:], target_view[first * ps:], common)]
+        changed.extend(range(max(first, ref_pages), last))
+        fingerprints = writer._fingerprints(target_view, changed)
+        ref_view.release()
+        target_view.release()
+        return changed, fingerprints
+    finally:
+        ref.close()
+        target.close()
+
+
+def _diff_shard(task) -> dict:
+    """Worker side: pagenr -> patch record for the pages of the shard whose diff is small enough."""
+    writer = _shard_writer(task)
+    ps = writer.page_size
+    diff_limit = writer.diff_limit
+    ref = Util.mmap_file(task['ref_filename'])
+    target = Util.mmap_file(task['target_filename'])
+    patches = {}
+    try:
+        ref_view = memoryview(ref)
+        target_view = memoryview(target)
+        for pagenr in task['pagenrs']:
+            patch = writer.encode_diff(ref_view[pagenr * ps:(pagenr + 1) * ps],
+                                       target_view[pagenr * ps:(pagenr + 1) * ps], diff_limit)
+            if patch is not None and len(patch) <= diff_limit:
+                patches[pagenr] = patch
+        ref_view.release()
+        target_view.release()
+        return patches
+    finally:
+        ref.close()
+        target.close()
+
+
+class ParallelPageHasher(object):
+    """Classifies the target pages for MemscrimperWriter on a process pool.
+
+    Three stages run over page shards.  First, workers map both images and
+    fingerprint the reference, which becomes the distinct lookup.  Second,
+    workers find the target pages that differ from the reference and
+    fingerprint them; the parent verifies their distinct matches.  Third,
+    workers try diffs for the remaining pages.  The parent then merges the
+    results in page order exactly as MemscrimperWriter.classify does, so both
+    paths produce the same layout.
+    """
+    name = 'ParallelPageHasher'
+    SHARD_PAGES = 16384
+
+    def __init__(self, writer: MemscrimperWriter, workers=None, shard_pages=None):
+        self.writer = writer
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_pages = shard_pages or self.SHARD_PAGES
+
+    def _task(self, ref_filename, target_filename, ref_pages, **kwargs) -> dict:
+        w = self.writer
+        task = {
+            'ref_filename': ref_filename,
+            'target_filename': target_filename,
+            'page_size': w.page_size,
+            'inner': w.inner,
+            'delta': w.delta,
+            'diff_ratio': w.diff_ratio,
+            'vectorize': w.vectorize,
+            'ref_pages': ref_pages,
+        }
+        task.update(kwargs)
+        return task
+
+    def _range_tasks(self, ref_filename, target_filename, num_pages, ref_pages) -> list:
+        return [self._task(ref_filename, target_filename, ref_pages, first=first,
+                           last=min(first + self.shard_pages, num_pages))
+                for first in range(0, num_pages, self.shard_pages)]
+
+    def classify(self, ref_filename, target_filename) -> PageClassification:
+        w = self.writer
+        ps = w.page_size
+        num_pages, ref_pages = w._check_sizes(os.path.getsize(ref_filename), os.path.getsize(target_filename))
+        pc = PageClassification(ps, num_pages, ref_pages)
+        ref = Util.mmap_file(ref_filename)
+        target = Util.mmap_file(target_filename)
+        ref_view = memoryview(ref)
+        target_view = memoryview(target)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                ref_tasks = self._range_tasks(ref_filename, target_filename, ref_pages, ref_pages)
+                for task, fingerprints in zip(ref_tasks, executor.map(_hash_reference_shard, ref_tasks)):
+                    for pagenr, fp in zip(range(task['first'], task['last']), fingerprints):
+                        pc.ref_index.setdefault(fp, pagenr)
+
+                changed = []
+                fingerprints = []
+                distinct = {}
+                target_tasks = self._range_tasks(ref_filename, target_filename, num_pages, ref_pages)
+                for shard_changed, shard_fingerprints in executor.map(_hash_target_shard, target_tasks):
+                    for pagenr, fp in zip(shard_changed, shard_fingerprints):
+                        ref_pagenr = pc.find_distinct(ref_view, target_view, pagenr, fp)
+                        if ref_pagenr is not None:
+                            distinct[pagenr] = ref_pagenr
+                    changed.extend(shard_changed)
+                    fingerprints.extend(shard_fingerprints)
+
+                patches = {}
+                if w.delta:
+                    # a superset of the diffs classify tries, pages that turn out to repeat an
+                    # interdedup page ignore theirs
+                    candidates = [p for p in changed if p < ref_pages and p not in distinct]
+                    diff_tasks = [self._task(ref_filename, target_filename, ref_pages,
+                                             pagenrs=candidates[i:i + self.shard_pages])
+                                  for i in range(0, len(candidates), self.shard_pages)]
+                    for shard_patches in executor.map(_diff_shard, diff_tasks):
+                        patches.update(shard_patches)
+
+            for pagenr, fp in zip(changed, fingerprints):
+                if not pc.assign_shared(ref_view, target_view, pagenr, fp, distinct.get(pagenr, None)):
+                    pc.assign_new(pagenr, fp, patches.get(pagenr, None), w.diff_limit)
+        finally:
+            ref_view.release()
+            target_view.release()
+            ref.close()
+            target.close()
+        pc.identity = num_pages - len(changed)
+        w.stats = pc.stats()
+        mp_logger.debug("{} page kinds: {}".format(self.name, w.stats))
+        return pc
+
+    def compress_file(self, ref_filename, target_filename, out_filename, reference_name=None) -> dict:
+        """Classifies on the pool, then lets the writer lay out and compress the body."""
+        pc = self.classify(ref_filename, target_filename)
+        return self.writer.compress_file(ref_filename, target_filename, out_filename,
+                                         reference_name=reference_name, pc=pc)
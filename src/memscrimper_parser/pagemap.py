@@ -0,0 +1,147 @@
+from array import array
+from bisect import bisect_right
+
+
+class PageMap(object):
+    """Resolves every page of the image to a (kind, index) pair with one lookup.
+
+    The table holds the pages the sections claim as sorted, disjoint
+    [first, last] runs; pages outside every run are REFERENCE pages.  For
+    REFERENCE and DIFF runs the index advances with the page (index = value +
+    pagenr - first), DISTINCT and SOURCE runs map every page to the same
+    reference / interdedup source page.
+    """
+    REFERENCE = 0
+    DISTINCT = 1
+    DIFF = 2
+    SOURCE = 3
+    KIND_NAMES = {
+        REFERENCE: 'reference',
+        DISTINCT: 'distinct',
+        DIFF: 'diff',
+        SOURCE: 'source',
+    }
+    LINEAR_KINDS = (REFERENCE, DIFF)
+    CHANGED_KINDS = (DIFF, SOURCE)
+
+    def __init__(self, num_pages, starts=None, ends=None, kinds=None, values=None):
+        self.num_pages = num_pages
+        self.starts = starts if starts is not None else array('Q')
+        self.ends = ends if ends is not None else array('Q')
+        self.kinds = kinds if kinds is not None else array('B')
+        self.values = values if values is not None else array('Q')
+
+    @classmethod
+    def build(cls, num_pages, claims) -> 'PageMap':
+        """claims lists (kind, intervals) from the highest priority section down,
+        where intervals yields sorted, disjoint (first, last, value) tuples.  Pages
+        claimed by more than one section go to the first claim, as in read_page_num."""
+        runs = []
+        for kind, intervals in claims:
+            fragments = cls._subtract([(l, r, kind, v) for l, r, v in intervals], runs)
+            runs = cls._merge(runs, fragments)
+        starts = array('Q')
+        ends = array('Q')
+        kinds = array('B')
+        values = array('Q')
+        for first, last, kind, value in runs:
+            starts.append(first)
+            ends.append(last)
+            kinds.append(kind)
+            values.append(value)
+        return cls(num_pages, starts, ends, kinds, values)
+
+    @classmethod
+    def _subtract(cls, runs, claimed) -> list:
+        """Returns the parts of runs not covered by claimed, both sorted and disjoint."""
+        fragments = []
+        j = 0
+        for first, last, kind, value in runs:
+            cur = first
+            while j < len(claimed) and claimed[j][1] < cur:
+                j += 1
+            k = j
+            while cur <= last:
+                if k >= len(claimed) or claimed[k][0] > last:
+                    fragments.append(cls._fragment(first, cur, last, kind, value))
+                    break
+                c_first, c_last = claimed[k][0], claimed[k][1]
+                if c_first > cur:
+                    fragments.append(cls._fragment(first, cur, c_first - 1, kind, value))
+                cur = max(cur, c_last + 1)
+                k += 1
+        return fragments
+
+    @classmethod
+    def _fragment(cls, first, frag_first, frag_last, kind, value) -> tuple:
+        if kind in cls.LINEAR_KINDS:
+            value += frag_first - first
+        return (frag_first, frag_last, kind, value)
+
+    @classmethod
+    def _merge(cls, a, b) -> list:
+        merged = []
+        i = j = 0
+        while i < len(a) or j < len(b):
+            if j >= len(b) or (i < len(a) and a[i][0] < b[j][0]):
+                merged.append(a[i])
+                i += 1
+            else:
+                merged.append(b[j])
+                j += 1
+        return merged
+
+    def _find(self, pagenr) -> int:
+        i = bisect_right(self.starts, pagenr) - 1
+        if i >= 0 and pagenr <= self.ends[i]:
+            return i
+        return -1
+
+    def resolve(self, pagenr) -> (int, int):
+        i = self._find(pagenr)
+        if i < 0:
+            return self.REFERENCE, pagenr
+        kind = self.kinds[i]
+        if kind in self.LINEAR_KINDS:
+            return kind, self.values[i] + pagenr - self.starts[i]
+        return kind, self.values[i]
+
+    def kind_of(self, pagenr) -> int:
+        i = self._find(pagenr)
+        return self.REFERENCE if i < 0 else self.kinds[i]
+
+    def runs(self, first_page=0, last_page=None):
+        """Yields (first, last, kind, value) runs covering [first_page, last_page],
+        with the gaps between section runs filled in as REFERENCE runs."""
+        if last_page is None:
+            last_page = self.num_pages - 1
+        cur = first_page
+        i = max(bisect_right(self.starts, first_page) - 1, 0)
+        while cur <= last_page and i < len(self.starts):
+            first, last = self.starts[i], self.ends[i]
+            i += 1
+            if last < cur:
+                continue
+            if first > last_page:
+                break
+            if first > cur:
+                yield cur, first - 1, self.REFERENCE, cur
+                cur = first
+            kind = self.kinds[i - 1]
+            value = self.values[i - 1]
+            if kind in self.LINEAR_KINDS:
+                value += cur - first
+            end = min(last, last_page)
+            yield cur, end, kind, value
+            cur = end + 1
+        if cur <= last_page:
+            yield cur, last_page, self.REFERENCE, cur
+
+    def changed_runs(self, first_page=0, last_page=None):
+        for run in self.runs(first_page, last_page):
+            if run[2] in self.CHANGED_KINDS:
+                yield run
+
+    @property
+    def num_runs(self) -> int:
+        return len(self.starts)
@@ -0,0 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .pagemap import PageMap
+from .sections import MemscrimperDiffSection
+from .util import Util
+import mmap
+import os
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+def _pwrite_all(fd, data, offset) -> None:
+    view = memoryview(data)
+    while len(view) > 0:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+
+def _read_ref(ref, offset, length) -> bytes:
+    if isinstance(ref, mmap.mmap):
+        data = ref[offset:offset + length]
+    else:
+        ref.seek(offset)
+        data = ref.read(length)
+    if len(data) != length:
+        raise Exception("Short read from the reference at {:08x}: {} of {} bytes".format(offset, len(data), length))
+    return data
+
+
+def _reconstruct_shard(task) -> int:
+    """Worker side: writes the runs of one shard into the preallocated target with os.pwrite."""
+    page_size = task['page_size']
+    chunk_pages = task['chunk_pages']
+    patches = task['patches']
+    src_pages = task['src_pages']
+    ref = Util.mmap_file(task['ref_filename'])
+    fd = os.open(task['target_filename'], os.O_WRONLY)
+    written = 0
+    try:
+        for first, last, kind, index in task['runs']:
+            count = last - first + 1
+            while count > 0:
+                n = min(count, chunk_pages)
+                offset = first * page_size
+                if kind == PageMap.REFERENCE:
+                    data = _read_ref(ref, index * page_size, n * page_size)
+                    index += n
+                elif kind == PageMap.DIFF:
+                    data = bytearray(_read_ref(ref, index * page_size, n * page_size))
+                    view = memoryview(data)
+                    for i in range(n):
+                        slot = view[i * page_size:(i + 1) * page_size]
+                        MemscrimperDiffSection.apply_diffs(None, patches[first + i], out=slot)
+                    view.release()
+                    index += n
+                elif kind == PageMap.SOURCE:
+                    data = src_pages[index] * n
+                else:
+                    data = _read_ref(ref, index * page_size, page_size) * n
+                _pwrite_all(fd, data, offset)
+                written += len(data)
+                first += n
+                count -= n
+    finally:
+        os.close(fd)
+        ref.close()
+    return written
+
+
+class ParallelReconstructor(object):
+    """Rebuilds the full image on a process pool.
+
+    The page range is split into shards; each task carries its slice of the
+    parsed page map plus the diff patches and interdedup source pages it
+    needs, so workers never re-parse the body.  Workers map the reference and
+    write their shard into the preallocated target with os.pwrite.
+    """
+    name = 'ParallelReconstructor'
+    SHARDS_PER_WORKER = 4
+    MIN_SHARD_PAGES = 1024
+
+    def __init__(self, body, workers=None, shard_pages=None):
+        self.body = body
+        self.workers = workers or os.cpu_count() or 1
+        num_pages = body.num_pages
+        if shard_pages is None:
+            shard_pages = max(-(-num_pages // (self.workers * self.SHARDS_PER_WORKER)), self.MIN_SHARD_PAGES)
+        self.shard_pages = shard_pages
+
+    def _tasks(self, target_filename):
+        body = self.body
+        for first_page in range(0, body.num_pages, self.shard_pages):
+            last_page = min(first_page + self.shard_pages, body.num_pages) - 1
+            runs = list(body.runs(first_page, last_page))
+            patches = {}
+            src_pages = {}
+            for first, last, kind, index in runs:
+                if kind == PageMap.DIFF:
+                    for pagenr in range(first, last + 1):
+                        patches[pagenr] = body.diff_pages_section.reference_pages[pagenr]
+                elif kind == PageMap.SOURCE and index not in src_pages:
+                    src_pages[index] = body.read_from_src(src_page_num=index)
+            yield {
+                'target_filename': target_filename,
+                'ref_filename': body.ref_filename,
+                'page_size': body.page_size,
+                'chunk_pages': body.COPY_CHUNK_PAGES,
+                'runs': runs,
+                'patches': patches,
+                'src_pages': src_pages,
+            }
+
+    def run(self, target_filename, target_fileobj=None) -> int:
+        """Rebuilds the image into target_filename, target_fileobj is an already open (and
+        truncated) handle on it that is sized instead of reopening the file."""
+        if getattr(self.body, 'ref_filename', None) is None:
+            raise Exception("Parallel reconstruction needs the reference file name")
+        if target_fileobj is not None:
+            target_fileobj.truncate(self.body.uncompressed_size)
+            target_fileobj.flush()
+        else:
+            with open(target_filename, 'wb') as target:
+                target.truncate(self.body.uncompressed_size)
+
+        written = 0
+        pending = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # bound the tasks in flight, each one holds its shard's source pages
+            for task in self._tasks(target_filename):
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    written += sum(f.result() for f in done)
+                pending.add(executor.submit(_reconstruct_shard, task))
+            done, _ = wait(pending)
+            written += sum(f.result() for f in done)
+        mp_logger.debug("{} wrote {} bytes to {}".format(self.name, written, target_filename))
+        if written != self.body.uncompressed_size:
+            raise Exception("Reconstructed {} of {} bytes into {}".format(written, self.body.uncompressed_size,
+                                                                         target_filename))
+        return written
@@ -0,0 +1,97 @@
+import io
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class MemscrimperRawIO(io.RawIOBase):
+    """Read only, seekable raw file over the reconstructed image of a Memscrimper.
+
+    readinto() fills the caller's buffer in place: whole pages go through
+    MemscrimperBody._fill_range run by run (reference mmap copies, diff
+    patches applied in the buffer, interdedup source pages), partial pages at
+    the ends through one scratch page.  Nothing is joined or materialized, so
+    wrapping it in io.BufferedReader (see Memscrimper.open_image) streams the
+    image to hashers and carvers.  Like the Memscrimper it reads from, it is
+    not thread safe.
+    """
+    name = 'MemscrimperRawIO'
+    # default BufferedReader size for open_image, reads larger than it bypass the buffer
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, ms, closefd=False):
+        super(MemscrimperRawIO, self).__init__()
+        if ms.msb is None:
+            raise Exception("The Memscrimper body is not loaded")
+        self.ms = ms
+        self.body = ms.msb
+        self.page_size = ms.page_size
+        self.size = ms.uncompressed_size
+        self.position = 0
+        # closefd=True destroys the Memscrimper on close()
+        self.closefd = closefd
+        self._page = bytearray(self.page_size)
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def readable(self) -> bool:
+        self._check_open()
+        return True
+
+    def seekable(self) -> bool:
+        self._check_open()
+        return True
+
+    def writable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        self._check_open()
+        return self.position
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        self._check_open()
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        elif whence != io.SEEK_SET:
+            raise ValueError("Invalid whence {}".format(whence))
+        if offset < 0:
+            raise ValueError("negative seek position {}".format(offset))
+        self.position = offset
+        return self.position
+
+    def readinto(self, b) -> int:
+        self._check_open()
+        ps = self.page_size
+        with memoryview(b) as view, view.cast('B') as out:
+            length = min(len(out), max(self.size - self.position, 0))
+            done = 0
+            while done < length:
+                pagenr, skew = divmod(self.position + done, ps)
+                if skew == 0 and length - done >= ps:
+                    count = (length - done) // ps
+                    filled = self.body._fill_range(pagenr, count, out[done:done + count * ps])
+                    if filled != count * ps:
+                        raise Exception("Unable to read pages {}-{}".format(pagenr, pagenr + count - 1))
+                    done += filled
+                    continue
+                n = min(ps - skew, length - done)
+                consumed = self.body.read_page_into(pagenr, self._page)
+                if consumed is None or consumed < skew + n:
+                    raise Exception("Unable to read from page number: {}".format(pagenr))
+                out[done:done + n] = self._page[skew:skew + n]
+                done += n
+        self.position += done
+        return done
+
+    def readinto1(self, b) -> int:
+        return self.readinto(b)
+
+    def close(self) -> None:
+        if not self.closed and self.closefd:
+            self.ms.destroy()
+        super(MemscrimperRawIO, self).close()
@@ -0,0 +1,103 @@
+from .cache import PageCache, LockedPageCache
+from .util import Util
+import os
+import threading
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class ReferenceEntry(object):
+    """One open reference image: its mapping, its page cache and the number of users."""
+
+    def __init__(self, key, filename, data, page_data):
+        self.key = key
+        self.filename = filename
+        self.data = data
+        self.page_data = page_data
+        self.refs = 0
+
+    def close(self) -> None:
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.page_data.clear()
+
+
+class ReferenceStore(object):
+    """Shares reference images between the dumps built on them.
+
+    Entries are keyed by file identity (device and inode), so different
+    paths to the same base image share one read-only mapping and one page
+    cache.  Each Memscrimper using the store acquires the entry when its
+    reference is associated and releases it on destroy(); the mapping is
+    closed with the last user.  Reference page caches are keyed by reference
+    page number, so pages read through one dump are hits for all the others.
+    """
+    name = 'ReferenceStore'
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, cache_policy=None, cache_bytes=None):
+        self.cache_policy = cache_policy
+        self.cache_bytes = cache_bytes
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> 'ReferenceStore':
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @classmethod
+    def key_for(cls, filename) -> tuple:
+        st = os.stat(filename)
+        return (st.st_dev, st.st_ino)
+
+    def acquire(self, filename) -> ReferenceEntry:
+        key = self.key_for(filename)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                page_data = LockedPageCache(PageCache.create(self.cache_policy, self.cache_bytes))
+                entry = ReferenceEntry(key, filename, Util.mmap_file(filename), page_data)
+                self._entries[key] = entry
+                mp_logger.debug("{} opened {}".format(self.name, filename))
+            entry.refs += 1
+            return entry
+
+    def release(self, entry: ReferenceEntry) -> None:
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            if self._entries.get(entry.key, None) is entry:
+                del self._entries[entry.key]
+        entry.close()
+        mp_logger.debug("{} closed {}".format(self.name, entry.filename))
+
+    def __contains__(self, filename) -> bool:
+        try:
+            key = self.key_for(filename)
+        except OSError:
+            return False
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def reset_pages(self) -> None:
+        """Clears the shared reference page caches of every open entry."""
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            entry.page_data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {e.filename: {'refs': e.refs, 'cache': e.page_data.stats()} for e in entries}
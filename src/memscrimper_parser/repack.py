@@ -0,0 +1,100 @@
+from .compression import SeekableBody, ChunkedBody
+from .header import MemscrimperHeader
+from .layer import MemscrimperBody
+import os
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class ChunkedRepacker(object):
+    """Re-packs an MBCR file into the chunked container (see compression.ChunkedBody).
+
+    The header fields are kept, the method gets the _chunked suffix (the
+    inner method can be swapped with inner=) and the body is decompressed in
+    one streaming pass and recompressed chunk by chunk.  MemscrimperHeader
+    recognizes the suffix and opens the body as a ChunkedBody.  The section
+    offsets are recorded too, so with Memscrimper(..., lazy=True) an open
+    inflates only the chunks holding the section tables and a page read
+    only the chunks holding its data.
+    """
+    name = 'ChunkedRepacker'
+    DEBUG = False
+    CHUNK_SIZE = ChunkedBody.CHUNK_SIZE
+
+    @classmethod
+    def log(cls, msg, how='debug'):
+        if cls.DEBUG:
+            mp_logger.debug("{} {}".format(cls.name, msg))
+
+    def __init__(self, chunk_size=None, inner=None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        if inner is not None and inner not in MemscrimperHeader.SUPPORTED_COMPRESSION_CLS:
+            raise Exception("Unsupported inner compression {}, expected one of {}".format(
+                inner, sorted(MemscrimperHeader.SUPPORTED_COMPRESSION_CLS)))
+        self.inner = inner
+
+    def method_for(self, method: bytes) -> bytes:
+        method = method.replace(MemscrimperHeader.CHUNKED, b'')
+        if self.inner is not None:
+            for name in MemscrimperHeader.SUPPORTED_COMPRESSION_CLS:
+                if name in method:
+                    method = method.replace(b'_' + name, b'')
+            method += b'_' + self.inner
+        return method + MemscrimperHeader.CHUNKED
+
+    def _pieces(self, msh: MemscrimperHeader):
+        if msh.chunked:
+            body = ChunkedBody(msh.compression_cls, msh.fileobj, offset=msh.body_bytes_offset)
+            for uoffset in range(0, len(body), self.chunk_size):
+                yield uoffset, body.read_at(uoffset, self.chunk_size)
+        else:
+            body = SeekableBody(msh.compression_cls, msh.fileobj, offset=msh.body_bytes_offset,
+                                span=self.chunk_size, index=False)
+            yield from body.iter_pieces()
+
+    def _section_offsets(self, method, msh, compression_cls, fileobj, body_offset) -> list:
+        body = MemscrimperBody(method, msh.page_size, ChunkedBody(compression_cls, fileobj, offset=body_offset),
+                               msh.uncompressed_size, lazy=True)
+        body.load()
+        starts = (body.distinct_pages_section_start, body.diff_pages_section_start,
+                  body.interdedupnointra_pages_section_start, body.interdedup_pages_section_start)
+        return [start for start in starts if start is not None]
+
+    def repack(self, src_filename, out_filename) -> dict:
+        """Writes the chunked copy of src_filename to out_filename and returns its statistics."""
+        msh = MemscrimperHeader(filename=src_filename)
+        msh._read_header()
+        method = self.method_for(msh.method)
+        compression_cls = MemscrimperHeader.SUPPORTED_COMPRESSION_CLS[self.inner] if self.inner is not None \
+            else msh.compression_cls
+
+        tmp_filename = out_filename + '.tmp.{}'.format(os.getpid())
+        try:
+            with open(tmp_filename, 'w+b') as out:
+                out.write(MemscrimperHeader.pack_header(method, msh.major, msh.minor, msh.page_size,
+                                                        msh.uncompressed_size))
+                body_offset = out.tell()
+                body_size, num_chunks = ChunkedBody.write(compression_cls, self._pieces(msh), out,
+                                                          self.chunk_size)
+                size = out.tell()
+                section_offsets = self._section_offsets(method, msh, compression_cls, out, body_offset)
+                ChunkedBody.write_section_offsets(out, body_offset, section_offsets)
+            os.replace(tmp_filename, out_filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+        finally:
+            msh.destroy()
+
+        stats = {
+            'method': method,
+            'chunk_size': self.chunk_size,
+            'chunks': num_chunks,
+            'sections': section_offsets,
+            'body_size': body_size,
+            'file_size': size,
+        }
+        self.log("repacked {} -> {}: {}".format(src_filename, out_filename, stats))
+        return stats
@@ -1,6 +1,12 @@
 from io import BytesIO
+from array import array
+from bisect import bisect_left
 from .consts import *
+import mmap
+import struct
 from .util import Util
+from .intervals import IntervalIndex, PackedIntervalLists
+from .accel import Accel
 import logging
 
 mp_logger = logging.getLogger(__name__)
@@ -8,6 +14,9 @@ mp_logger = logging.getLogger(__name__)
 class MemscrimperSection(object):
     name = 'MemscrimperSection'
     DEBUG = False
+    INTERVAL_WINDOW = 1 << 16
+    _WORD = struct.Struct('<H')
+    _DWORD = struct.Struct('<I')
     def __init__(self, body_bytes: bytes, start: int = 0, page_size: int = 4096):
         self.body_bytes = body_bytes
 
@@ -27,7 +36,9 @@ class MemscrimperSection(object):
         self.patches_list_end = None
         self.patches_list = None
 
-        self.reference_pages = {}
+        self._reference_pages = {}
+        # set by locate(), the references are decoded when a lookup first needs them
+        self.references_pending = False
         self.page_data = {}
         self.page_size = page_size
         self.page_data_base = None
@@ -54,6 +65,21 @@ class MemscrimperSection(object):
     def build_references(self) -> dict:
         raise Exception("Not Implemented")
 
+    @property
+    def reference_pages(self):
+        if self.references_pending:
+            self.references_pending = False
+            try:
+                self._load_references()
+            except:
+                self.references_pending = True
+                raise
+        return self._reference_pages
+
+    @reference_pages.setter
+    def reference_pages(self, value):
+        self._reference_pages = value
+
     def _parse_page_num(self):
         end = self.start + DWORD
         self.pages_num = Util.parse_dword(self.body_bytes[self.start:end])
@@ -83,6 +109,10 @@ class MemscrimperSection(object):
         if limit < num_pagenrs:
             raise Exception("Number of Page NRs exceeds limit: {}, got {}".format(limit, num_pagenrs))
         offset += DWORD
+        if Accel.use_for(num_pagenrs):
+            consumed, pagenr_list = Accel.decode_pagenr_list(data[offset:offset + DWORD * num_pagenrs], num_pagenrs)
+            cls.log("Read the 0x%08x bytes, len(pagenr_list) = %d" % (offset + consumed, len(pagenr_list)))
+            return offset + consumed - start, pagenr_list
         # data = fo.read(DWORD*num_pagenrs)
         prev = None
         cnt = 0
@@ -163,6 +193,105 @@ class MemscrimperSection(object):
         cls.log("Completed Interval {}, consumed {} @ 0x{:08x}".format(cnt, consumed, cur_offset))
         return consumed, intervals_result
 
+    @classmethod
+    def parse_interval_lists_packed(cls, num_lists, start: int, data) -> (int, PackedIntervalLists):
+        """Decodes num_lists interval lists in one pass over the header words.
+
+        Same layout and stopping rules as parse_interval_lists, but the intervals
+        land in packed left/right arrays with per-list bounds.
+        """
+        lefts = array('Q')
+        rights = array('Q')
+        bounds = array('Q', [0])
+        total = len(data)
+        windowed = not isinstance(data, (bytes, bytearray, memoryview, mmap.mmap))
+        base = start if windowed else 0
+        view = memoryview(data[start:start + cls.INTERVAL_WINDOW] if windowed else data)
+        end = base + len(view)
+        unpack_word = cls._WORD.unpack_from
+        unpack_dword = cls._DWORD.unpack_from
+        cur_offset = start
+        cls.log("Starting packed interval_list parsing for {}, @ 0x{:08x}".format(num_lists, cur_offset))
+        for _ in range(num_lists):
+            while True:
+                if cur_offset + 2 * DWORD > end:
+                    if not windowed or end >= total:
+                        # mirrors parse_interval_list, which stops short of 8 bytes
+                        break
+                    base = cur_offset
+                    view = memoryview(data[base:base + cls.INTERVAL_WINDOW])
+                    end = base + len(view)
+                    continue
+                rel = cur_offset - base
+                left, = unpack_dword(view, rel)
+                sz = (left >> 29) & 3
+                if sz == 0:
+                    delta = 0
+                    cur_offset += DWORD
+                elif sz == 1:
+                    delta = view[rel + DWORD]
+                    cur_offset += DWORD + BYTE
+                elif sz == 2:
+                    delta, = unpack_word(view, rel + DWORD)
+                    cur_offset += DWORD + WORD
+                else:
+                    delta, = unpack_dword(view, rel + DWORD)
+                    cur_offset += DWORD + DWORD
+                value = left & ((1 << 29) - 1)
+                lefts.append(value)
+                rights.append(value + delta)
+                if left >> 31:
+                    break
+            bounds.append(len(lefts))
+        consumed = cur_offset - start
+        cls.log("Completed packed interval lists {}, consumed {} @ 0x{:08x}".format(num_lists, consumed, cur_offset))
+        return consumed, PackedIntervalLists(lefts, rights, bounds)
+
+    @classmethod
+    def _window(cls, data, offset) -> (int, memoryview):
+        """Returns (base, view) with view starting at data[base], a bounded window for a SeekableBody."""
+        if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+            return 0, memoryview(data)
+        return offset, memoryview(data[offset:offset + cls.INTERVAL_WINDOW])
+
+    @classmethod
+    def skip_pagenr_list(cls, start: int, data) -> (int, int):
+        """Returns (consumed, count) of the pagenr list at start without decoding the entries."""
+        num_pagenrs = Util.parse_dword(data[start:start + DWORD])
+        entries = data[start + DWORD:start + DWORD + DWORD * num_pagenrs]
+        if Accel.use_for(num_pagenrs, Accel.MIN_SKIP_ITEMS):
+            return DWORD + Accel.skip_pagenr_list(entries, num_pagenrs), num_pagenrs
+        offset = 0
+        for _ in range(num_pagenrs):
+            offset += BYTE if entries[offset] & 128 else DWORD
+        return DWORD + offset, num_pagenrs
+
+    @classmethod
+    def skip_interval_lists(cls, num_lists, start: int, data) -> (int, int):
+        """Returns (consumed, number of intervals) of num_lists interval lists, reading only
+        the header words; same stopping rules as parse_interval_lists_packed."""
+        total = len(data)
+        base, view = cls._window(data, start)
+        end = base + len(view)
+        unpack_dword = cls._DWORD.unpack_from
+        delta_sizes = (0, BYTE, WORD, DWORD)
+        cur_offset = start
+        num_intervals = 0
+        for _ in range(num_lists):
+            while True:
+                if cur_offset + 2 * DWORD > end:
+                    if end >= total:
+                        break
+                    base, view = cls._window(data, cur_offset)
+                    end = base + len(view)
+                    continue
+                left, = unpack_dword(view, cur_offset - base)
+                cur_offset += DWORD + delta_sizes[(left >> 29) & 3]
+                num_intervals += 1
+                if left >> 31:
+                    break
+        return cur_offset - start, num_intervals
+
     @classmethod
     def parse_interval_value(cls, data: bytes) -> (bool, int, int):
         if len(data) < DWORD:
@@ -196,8 +325,19 @@ class MemscrimperSection(object):
     def _load_section(self):
         raise Exception("Nut implemented")
 
-    def load(self):
+    def locate(self) -> int:
+        """Finds the end of the section without decoding it, see load(lazy=True)."""
+        raise Exception("Not implemented")
+
+    def _load_references(self):
         self._load_section()
+
+    def load(self, lazy=False):
+        if lazy:
+            self.locate()
+            self.references_pending = True
+        else:
+            self._load_section()
         return self
 
     @classmethod
@@ -225,12 +365,16 @@ class MemscrimperSection(object):
     def _recover_page(self, page_num):
         raise Exception("Not implemeneted")
 
-    def associate_reference_file(self, filename=None, data_bytes=None, load_from_file=False):
+    def associate_reference_file(self, filename=None, data_bytes=None, load_from_file=False, use_mmap=False):
         self.ref_filename = filename
         self.ref_bytes = data_bytes
         self.ref_loaded = load_from_file
 
-        if self.ref_loaded and data_bytes is None:
+        if isinstance(data_bytes, mmap.mmap):
+            self.ref_fileobj = data_bytes
+        elif use_mmap and data_bytes is None:
+            self.ref_fileobj = Util.mmap_file(self.ref_filename)
+        elif self.ref_loaded and data_bytes is None:
             self.ref_bytes = open(self.ref_filename, 'rb').read()
             self.ref_fileobj = BytesIO(self.ref_bytes)
             self.ref_loaded_offset = 0
@@ -247,8 +391,12 @@ class MemscrimperSection(object):
             page_num = self.offset_to_page_num(offset, self.page_size)
 
         if force_read or self.page_data.get(page_num, None) is None:
-            self.ref_fileobj.seek(page_num * self.page_size)
-            self.page_data[page_num] = self.ref_fileobj.read()
+            offset = page_num * self.page_size
+            if isinstance(self.ref_fileobj, mmap.mmap):
+                self.page_data[page_num] = self.ref_fileobj[offset:offset + self.page_size]
+            else:
+                self.ref_fileobj.seek(offset)
+                self.page_data[page_num] = self.ref_fileobj.read(self.page_size)
         return self.page_data[page_num]
 
 
@@ -270,9 +418,9 @@ class MemscrimperDistinctSection(MemscrimperSection):
         self.log("Parsing the interval_list from {:08x}".format(self.interval_list_start))
         self.pages_num = len(self.pagenr_list)
 
-        consumed, interval_lists = self.parse_interval_lists(self.pages_num,
-                                                             self.interval_list_start,
-                                                             self.body_bytes)
+        consumed, interval_lists = self.parse_interval_lists_packed(self.pages_num,
+                                                                    self.interval_list_start,
+                                                                    self.body_bytes)
 
         # consumed = self._parse_interval_list(num_pages=len(self.pagenr_list))
         self.interval_list = interval_lists
@@ -282,12 +430,19 @@ class MemscrimperDistinctSection(MemscrimperSection):
         self.build_references()
         return self.end - self.start
 
-    def build_references(self) -> dict:
-        for i in range(len(self.pagenr_list)):
-            pagenr_item = self.pagenr_list[i]
-            for left, right in self.interval_list[i]:
-                for pagenr in range(left, right + 1):
-                    self.reference_pages[pagenr] = pagenr_item
+    def locate(self) -> int:
+        self.pagenr_list_start = self.start
+        consumed, self.pages_num = self.skip_pagenr_list(self.pagenr_list_start, self.body_bytes)
+        self.pagenr_list_end = self.pagenr_list_start + consumed
+        self.interval_list_start = self.pagenr_list_end
+        consumed, _ = self.skip_interval_lists(self.pages_num, self.interval_list_start, self.body_bytes)
+        self.interval_list_end = self.interval_list_start + consumed
+        self.end = self.interval_list_end
+        self.log("Located {} interval lists ending @ {:08x}".format(self.pages_num, self.end))
+        return self.end - self.start
+
+    def build_references(self) -> IntervalIndex:
+        self.reference_pages = IntervalIndex.from_packed(self.interval_list, self.pagenr_list)
         return self.reference_pages
 
     # def _recover_page(self, page_num, force_resolve=False):
@@ -317,15 +472,15 @@ class MemscrimperInterDedupSection(MemscrimperSection):
     def _load_section(self):
         self.interval_list_start = self.start
         self.log("Parsing the interval_list from {:08x}".format(self.interval_list_start))
-        consumed, interval_list = self.parse_interval_list(self.interval_list_start, self.body_bytes)
-        self.interval_list = [interval_list]
+        consumed, interval_list = self.parse_interval_lists_packed(1, self.interval_list_start, self.body_bytes)
+        self.interval_list = interval_list
         self.interval_list_end = consumed + self.interval_list_start
         self.log("Completed parsing the interval_list @ {:08x}".format(self.interval_list_end))
 
         # consumed = self._parse_interval_list(num_pages=len(self.pagenr_list))
         # self.interval_list_end = consumed + self.interval_list_start
         self.page_data_base = self.interval_list_end
-        self.pages_num = len(self.interval_list[0])
+        self.pages_num = self.interval_list.num_intervals
         self.end = self.page_data_base + self.pages_num * self.page_size
         self.log("Start of page data @ {:08x}".format(self.page_data_base))
         self.log("End of page data @ {:08x}".format(self.end))
@@ -333,20 +488,19 @@ class MemscrimperInterDedupSection(MemscrimperSection):
         self.build_references()
         return self.end - self.start
 
-    def build_references(self) -> dict:
-        file_offset = self.page_data_base
-        src_page_num = 0
-        cur_cnt = 0
-        cnt = 0
-        for i in range(len(self.interval_list)):
-            self.log("{} Adding {} intervals page ref for @ {:08x}".format(i, len(self.interval_list[i]), file_offset))
-            for left, right in self.interval_list[i]:
-                self.log("Intervals page {} --> {} @ {:08x}".format(left, right + 1, file_offset))
-                for j in range(left, right + 1):
-                    self.reference_pages[j] = src_page_num
-            self.log("Pages inserted {}/{}, iteration {} Adding page ref @ {:08x}".format(cur_cnt, cnt, i, file_offset))
-            file_offset += self.page_size
-            src_page_num += 1
+    def locate(self) -> int:
+        self.interval_list_start = self.start
+        consumed, self.pages_num = self.skip_interval_lists(1, self.interval_list_start, self.body_bytes)
+        self.interval_list_end = self.interval_list_start + consumed
+        self.page_data_base = self.interval_list_end
+        self.end = self.page_data_base + self.pages_num * self.page_size
+        self.log("Located page data @ {:08x}".format(self.page_data_base))
+        return self.end - self.start
+
+    def build_references(self) -> IntervalIndex:
+        self.log("Adding {} intervals page refs for @ {:08x}".format(self.interval_list.num_intervals,
+                                                                   self.page_data_base))
+        self.reference_pages = IntervalIndex.from_packed(self.interval_list, range(len(self.interval_list)))
         return self.reference_pages
 
 
@@ -378,9 +532,9 @@ class MemscrimperInterIntraDedupSection(MemscrimperSection):
         self.pages_num = Util.parse_dword(self.body_bytes[self.start:self.start + DWORD])
         self.interval_list_start = self.start + DWORD
         self.log("Parsing the interval_list from {:08x}".format(self.interval_list_start))
-        consumed, interval_lists = self.parse_interval_lists(self.pages_num,
-                                                             self.interval_list_start,
-                                                             self.body_bytes)
+        consumed, interval_lists = self.parse_interval_lists_packed(self.pages_num,
+                                                                    self.interval_list_start,
+                                                                    self.body_bytes)
         self.interval_list = interval_lists
         self.interval_list_end = self.interval_list_start + consumed
         self.page_data_base = self.interval_list_end
@@ -388,23 +542,21 @@ class MemscrimperInterIntraDedupSection(MemscrimperSection):
         self.build_references()
         return self.end - self.start
 
-    def build_references(self):
-        file_offset = self.page_data_base
-        src_page_num = 0
-        cnt = 0
-        for i in range(len(self.interval_list)):
-            cur_cnt = 0
-            interval_list = self.interval_list[i]
-            self.log("{} Adding {} intervals page ref for @ {:08x}".format(i, len(interval_list), file_offset))
-            for left, right in interval_list:
-                self.log("Intervals page {} --> {} @ {:08x}".format(left, right + 1, file_offset))
-                for j in range(left, right + 1):
-                    cnt += 1
-                    cur_cnt += 1
-                    self.reference_pages[j] = src_page_num
-            self.log("Pages inserted {}/{}, iteration {} Adding page ref @ {:08x}".format(cur_cnt, cnt, i, file_offset))
-            file_offset += self.page_size
-            src_page_num += 1
+    def locate(self) -> int:
+        self.pages_num = Util.parse_dword(self.body_bytes[self.start:self.start + DWORD])
+        self.interval_list_start = self.start + DWORD
+        consumed, _ = self.skip_interval_lists(self.pages_num, self.interval_list_start, self.body_bytes)
+        self.interval_list_end = self.interval_list_start + consumed
+        self.page_data_base = self.interval_list_end
+        self.end = self.page_size * self.pages_num
+        self.log("Located page data @ {:08x}".format(self.page_data_base))
+        return self.end - self.start
+
+    def build_references(self) -> IntervalIndex:
+        self.log("Adding {} intervals page refs for {} source pages @ {:08x}".format(
+            self.interval_list.num_intervals, len(self.interval_list), self.page_data_base))
+        self.reference_pages = IntervalIndex.from_packed(self.interval_list, range(len(self.interval_list)))
+        return self.reference_pages
 
     # def _recover_page(self, page_num, force_resolve=False):
     #     if page_num in self.page_data and not force_resolve:
@@ -422,16 +574,108 @@ class MemscrimperInterIntraDedupSection(MemscrimperSection):
 class MemscrimperDiffSection(MemscrimperSection):
     name = 'MemscrimperDiffSection'
 
-    def __init__(self, body_bytes: bytes, start: int = 0):
+    def __init__(self, body_bytes: bytes, start: int = 0, end: int = None):
         super(MemscrimperDiffSection, self).__init__(body_bytes, start)
         self.diff_pages = None
         self.num_patches = None
+        self.patch_offsets = None
+        # the section end when already known (chunked containers record it), locate() then
+        # leaves the patch records alone until a diff page is read
+        self.known_end = end
+
+    @classmethod
+    def from_offsets(cls, body_bytes, pagenrs, patch_offsets) -> 'MemscrimperDiffSection':
+        """Rebuilds the section from already located patch records (e.g. a sidecar index),
+        patches are decoded per page when looked up."""
+        scn = cls(body_bytes)
+        scn.pagenr_list = pagenrs
+        scn.patch_offsets = patch_offsets
+        scn.pages_num = len(pagenrs)
+        scn.num_patches = len(pagenrs)
+        scn.reference_pages = DiffPatchIndex(scn, pagenrs, patch_offsets)
+        return scn
 
     def build_references(self) -> dict:
         for i in range(len(self.pagenr_list)):
             self.reference_pages[self.pagenr_list[i]] = self.patches_list[i]
         return self.reference_pages
 
+    def locate(self) -> int:
+        self.pagenr_list_start = self.start
+        consumed, self.pages_num = self.skip_pagenr_list(self.pagenr_list_start, self.body_bytes)
+        self.pagenr_list_end = self.pagenr_list_start + consumed
+        self.patches_list_start = self.pagenr_list_end
+        self.num_patches = self.pages_num
+        if self.known_end is not None:
+            self.patches_list_end = self.known_end
+        else:
+            self.locate_patches()
+        self.end = self.patches_list_end
+        self.log("Located {} diffs ending @ {:08x}".format(self.num_patches, self.end))
+        return self.end - self.start
+
+    def locate_patches(self) -> array:
+        """Offsets of the patch records, walked on first use when locate() had the section end."""
+        if self.patch_offsets is None:
+            consumed, self.patch_offsets = self.skip_patch_records(self.pages_num, self.patches_list_start,
+                                                                   self.body_bytes)
+            self.patches_list_end = self.patches_list_start + consumed
+        return self.patch_offsets
+
+    def _load_references(self):
+        # only the pagenrs are decoded here, each page's patches are decoded when it is read
+        self._parse_pagenr_list()
+        self.reference_pages = DiffPatchIndex(self, self.pagenr_list, self.patch_offsets)
+
+    @classmethod
+    def skip_patch_records(cls, num_pages, start: int, data) -> (int, array):
+        """Returns (consumed, record offsets) of num_pages patch records, reading only the
+        counts and the Util.decode headers of each diff."""
+        offsets = array('Q')
+        total = len(data)
+        base, view = cls._window(data, start)
+        end = base + len(view)
+        if end >= total:
+            return cls._skip_patch_records_flat(num_pages, start, view, offsets)
+        unpack_word = cls._WORD.unpack_from
+        cur_offset = start
+        for _ in range(num_pages):
+            offsets.append(cur_offset)
+            if cur_offset + WORD > end and end < total:
+                base, view = cls._window(data, cur_offset)
+                end = base + len(view)
+            num_diffs, = unpack_word(view, cur_offset - base)
+            cur_offset += WORD
+            for _ in range(num_diffs):
+                if cur_offset + 3 > end and end < total:
+                    base, view = cls._window(data, cur_offset)
+                    end = base + len(view)
+                a = view[cur_offset - base]
+                if a & 128 == 128:
+                    # 3 byte form, sz is the upper 12 bits of the 24 bit blop
+                    sz = ((a & 127) << 4) | (view[cur_offset - base + 1] >> 4)
+                    cur_offset += 3 + sz + 1
+                else:
+                    cur_offset += 2 + a + 1
+        return cur_offset - start, offsets
+
+    @classmethod
+    def _skip_patch_records_flat(cls, num_pages, start: int, view, offsets) -> (int, array):
+        # the whole body is addressable, so the walk needs no window checks
+        append = offsets.append
+        cur_offset = start
+        for _ in range(num_pages):
+            append(cur_offset)
+            num_diffs = view[cur_offset] | (view[cur_offset + 1] << 8)
+            cur_offset += WORD
+            for _ in range(num_diffs):
+                a = view[cur_offset]
+                if a & 128:
+                    cur_offset += 4 + (((a & 127) << 4) | (view[cur_offset + 1] >> 4))
+                else:
+                    cur_offset += 3 + a
+        return cur_offset - start, offsets
+
     def _load_section(self):
         # self._parse_diff()
         self.pagenr_list_start = self.start  # + DWORD
@@ -455,6 +699,7 @@ class MemscrimperDiffSection(MemscrimperSection):
 
         cur_offset = self.patches_list_start
         self.patches_list = []
+        self.patch_offsets = array('Q')
         self.diff_pages = {}
         cnt = 0
         stop = 3
@@ -466,6 +711,7 @@ class MemscrimperDiffSection(MemscrimperSection):
             # self.log("Processing diff {} at {:08x}".format(cnt, cur_offset))
             consumed, diff_interval = self.parse_diff_intreval(self.body_bytes, cur_offset)
             self.patches_list.append(diff_interval)
+            self.patch_offsets.append(cur_offset)
             # self.log("Processed diff {} at {:08x}, consumed: {}".format(cnt, cur_offset, consumed))
             cur_offset += consumed
             cnt += 1
@@ -506,19 +752,30 @@ class MemscrimperDiffSection(MemscrimperSection):
         return self.reference_pages
 
     @classmethod
-    def apply_diffs(cls, page_data, diffs) -> bytes:
-        ret = bytearray(page_data)
+    def apply_diffs(cls, page_data, diffs, out=None) -> bytes:
+        """Patches page_data with diffs.  When out (a writable buffer such as a
+        memoryview slot of a reconstruction buffer) is given, page_data is copied
+        into it, patched in place and out is returned; page_data may be None if
+        out already holds the page."""
+        if out is None:
+            ret = bytearray(page_data)
+        else:
+            ret = out
+            if page_data is not None:
+                ret[:len(page_data)] = page_data
         offset = 0
         for (rel, bs) in diffs:
             offset += rel
-            for i in range(len(bs)):
-                ret[offset + i] = bs[i]
-            offset += len(bs)
-        return bytes(ret)
-
-    def apply_page_diff(self, page_num, page_data) -> bytes:
+            end = offset + len(bs)
+            ret[offset:end] = bs
+            offset = end
+        if out is None:
+            return bytes(ret)
+        return out
+
+    def apply_page_diff(self, page_num, page_data, out=None) -> bytes:
         if page_num in self.reference_pages:
-            return self.apply_diffs(page_data, self.reference_pages[page_num])
+            return self.apply_diffs(page_data, self.reference_pages[page_num], out=out)
         return None
 
     # def _recover_page(self, page_num, force_resolve=False):
@@ -538,3 +795,43 @@ class MemscrimperDiffSection(MemscrimperSection):
     def convert_pagenr(self, pagenr):
         return pagenr
 
+
+class DiffPatchIndex(object):
+    """Sorted pagenr -> patches map that decodes a page's patch record on lookup."""
+
+    def __init__(self, section: MemscrimperDiffSection, pagenrs, patch_offsets):
+        self.section = section
+        self.pagenrs = pagenrs
+        self.patch_offsets = patch_offsets
+
+    def _find(self, pagenr) -> int:
+        i = bisect_left(self.pagenrs, pagenr)
+        if i < len(self.pagenrs) and self.pagenrs[i] == pagenr:
+            return i
+        return -1
+
+    def __contains__(self, pagenr) -> bool:
+        return self._find(pagenr) > -1
+
+    def __getitem__(self, pagenr) -> list:
+        i = self._find(pagenr)
+        if i < 0:
+            raise KeyError(pagenr)
+        if self.patch_offsets is None:
+            self.patch_offsets = self.section.locate_patches()
+        _, patches = self.section.parse_diff_intreval(self.section.body_bytes, self.patch_offsets[i])
+        return patches
+
+    def get(self, pagenr, default=None):
+        if pagenr not in self:
+            return default
+        return self[pagenr]
+
+    def __iter__(self):
+        return iter(self.pagenrs)
+
+    def keys(self):
+        return iter(self.pagenrs)
+
+    def __len__(self) -> int:
+        return len(self.pagenrs)
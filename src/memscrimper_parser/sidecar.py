@@ -0,0 +1,203 @@
+from array import array
+from hashlib import blake2b
+from .pagemap import PageMap
+import io
+import mmap
+import os
+import struct
+import sys
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class SidecarIndex(object):
+    """Persistent parse results for a .compress file, stored next to it as <file>.msidx.
+
+    Holds the header fields, the reference name, the page map runs, the diff
+    page numbers with the body offsets of their patch records and the base of
+    the interdedup page data.  The file is keyed by a fingerprint of the
+    source (its identity and content samples) and opened with mmap; the arrays are memoryviews into the
+    mapping, so an open costs a few page faults instead of a body parse.
+
+    Layout (native byte order, recorded in the header):
+        magic, version, byte order, fingerprint, fixed fields, method and
+        reference name, then 8-byte aligned arrays: run starts, ends, values,
+        kinds (bytes), diff pagenrs, diff patch offsets.
+    """
+    name = 'SidecarIndex'
+    MAGIC = b"MSIDX\x00"
+    VERSION = 1
+    SUFFIX = '.msidx'
+    PREAMBLE = struct.Struct("<6sHB32s")
+    FIELDS = struct.Struct("<HHIQQQQQII")
+    NO_BASE = (1 << 64) - 1
+    # bytes hashed into the fingerprint besides the size: both ends and evenly spaced samples
+    EDGE_SIZE = 1 << 20
+    SAMPLE_SIZE = 1 << 16
+    NUM_SAMPLES = 16
+
+    def __init__(self):
+        self.filename = None
+        self.fingerprint = None
+        self.major = None
+        self.minor = None
+        self.page_size = None
+        self.uncompressed_size = None
+        self.method = None
+        self.reference_name = None
+        self.page_data_base = None
+        self.num_pages = None
+        self.starts = None
+        self.ends = None
+        self.values = None
+        self.kinds = None
+        self.diff_pagenrs = None
+        self.diff_offsets = None
+        self._mmap = None
+        self._view = None
+
+    @classmethod
+    def sidecar_filename(cls, filename) -> str:
+        return filename + cls.SUFFIX
+
+    @classmethod
+    def _file_stat(cls, fileobj):
+        try:
+            return os.fstat(fileobj.fileno())
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            return None
+
+    @classmethod
+    def fingerprint_fileobj(cls, fileobj) -> bytes:
+        """blake2b over the device, inode, modification time and size plus both ends and
+        evenly spaced samples of the source file.  A source without a file descriptor
+        has no identity to key on, so all of it is hashed."""
+        fileobj.seek(0, 2)
+        size = fileobj.tell()
+        h = blake2b(digest_size=32)
+        h.update(struct.pack("<Q", size))
+        st = cls._file_stat(fileobj)
+        if st is not None:
+            # a same size rewrite changes the modification time (or the inode when replaced)
+            h.update(struct.pack("<QQQ", st.st_dev, st.st_ino, st.st_mtime_ns))
+            samples = [(0, cls.EDGE_SIZE), (max(size - cls.EDGE_SIZE, 0), cls.EDGE_SIZE)]
+            step = size // (cls.NUM_SAMPLES + 1)
+            samples += [(step * i, cls.SAMPLE_SIZE) for i in range(1, cls.NUM_SAMPLES + 1)]
+        else:
+            samples = [(offset, cls.EDGE_SIZE) for offset in range(0, size, cls.EDGE_SIZE)]
+        for offset, length in samples:
+            fileobj.seek(offset)
+            h.update(fileobj.read(length))
+        fileobj.seek(0)
+        return h.digest()
+
+    @classmethod
+    def write(cls, filename, fingerprint, header, body) -> str:
+        """Saves the parse results of a loaded MemscrimperBody, atomically."""
+        if body.page_map is None:
+            # lazily loaded bodies build the page map on first use
+            body.runs()
+        page_map = body.page_map
+        diff_pagenrs = array('Q')
+        diff_offsets = array('Q')
+        scn = body.diff_pages_section
+        if scn is not None:
+            diff_pagenrs = array('Q', scn.pagenr_list)
+            diff_offsets = array('Q', scn.locate_patches())
+        page_data_base = cls.NO_BASE if body.page_data_base is None else body.page_data_base
+
+        out = bytearray(cls.PREAMBLE.pack(cls.MAGIC, cls.VERSION, sys.byteorder == 'little', fingerprint))
+        out += cls.FIELDS.pack(header.major, header.minor, header.page_size, header.uncompressed_size,
+                               page_data_base, body.num_pages, page_map.num_runs, len(diff_pagenrs),
+                               len(header.method), len(body.reference_image_name))
+        out += header.method + body.reference_image_name
+        for part in (array('Q', page_map.starts), array('Q', page_map.ends), array('Q', page_map.values),
+                     array('B', page_map.kinds), diff_pagenrs, diff_offsets):
+            # the arrays are cast in place when mapped, keep them 8-byte aligned
+            out += b'\x00' * (-len(out) % 8)
+            out += part.tobytes()
+
+        tmp_filename = filename + '.tmp.{}'.format(os.getpid())
+        with open(tmp_filename, 'wb') as fileobj:
+            fileobj.write(out)
+        os.replace(tmp_filename, filename)
+        return filename
+
+    @classmethod
+    def open(cls, filename, fingerprint=None) -> 'SidecarIndex':
+        """Maps an index, returns None when it is missing, stale or from another platform."""
+        try:
+            with open(filename, 'rb') as fileobj:
+                mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            return cls._parse(mapped, filename, fingerprint)
+        except (struct.error, ValueError, TypeError) as e:
+            mp_logger.debug("{} unable to use {}: {}".format(cls.name, filename, e))
+            return None
+
+    @classmethod
+    def _parse(cls, mapped, filename, fingerprint) -> 'SidecarIndex':
+        magic, version, little, stored_fingerprint = cls.PREAMBLE.unpack_from(mapped, 0)
+        if magic != cls.MAGIC or version != cls.VERSION or bool(little) != (sys.byteorder == 'little'):
+            return None
+        if fingerprint is not None and stored_fingerprint != fingerprint:
+            return None
+
+        index = cls()
+        index.filename = filename
+        index.fingerprint = stored_fingerprint
+        offset = cls.PREAMBLE.size
+        (index.major, index.minor, index.page_size, index.uncompressed_size, page_data_base, index.num_pages,
+         num_runs, num_diffs, method_len, ref_len) = cls.FIELDS.unpack_from(mapped, offset)
+        index.page_data_base = None if page_data_base == cls.NO_BASE else page_data_base
+        offset += cls.FIELDS.size
+        index.method = mapped[offset:offset + method_len]
+        index.reference_name = mapped[offset + method_len:offset + method_len + ref_len]
+        offset += method_len + ref_len
+
+        view = memoryview(mapped)
+        def take(count, fmt, width):
+            nonlocal offset
+            offset += -offset % 8
+            arr = view[offset:offset + count * width].cast(fmt)
+            offset += count * width
+            return arr
+
+        index.starts = take(num_runs, 'Q', 8)
+        index.ends = take(num_runs, 'Q', 8)
+        index.values = take(num_runs, 'Q', 8)
+        index.kinds = take(num_runs, 'B', 1)
+        index.diff_pagenrs = take(num_diffs, 'Q', 8)
+        index.diff_offsets = take(num_diffs, 'Q', 8)
+        if offset != len(mapped):
+            raise ValueError("truncated index")
+        index._mmap = mapped
+        index._view = view
+        return index
+
+    def close(self) -> None:
+        """Releases the arrays and unmaps the index, a body loaded from it can not be read afterwards."""
+        if self._mmap is None:
+            return
+        for view in (self.starts, self.ends, self.values, self.kinds, self.diff_pagenrs, self.diff_offsets,
+                     self._view):
+            view.release()
+        self.starts = self.ends = self.values = self.kinds = self.diff_pagenrs = self.diff_offsets = None
+        self._view = None
+        try:
+            self._mmap.close()
+        except BufferError as e:
+            # views taken from the arrays elsewhere keep the mapping until they are collected
+            mp_logger.debug("{} unable to close {}: {}".format(self.name, self.filename, e))
+        self._mmap = None
+
+    def page_map(self) -> PageMap:
+        return PageMap(self.num_pages, self.starts, self.ends, self.kinds, self.values)
+
+    def matches(self, header) -> bool:
+        return self.page_size == header.page_size and self.uncompressed_size == header.uncompressed_size and \
+            self.method == header.method and self.major == header.major and self.minor == header.minor
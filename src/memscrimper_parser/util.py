@@ -1,5 +1,6 @@
 from .consts import *
 import struct
+import mmap
 from io import BytesIO
 
 class Util(object):
@@ -43,6 +44,18 @@ class Util(object):
     def parse_byte_fo(cls, fileobj) -> int:
         return cls.parse_byte(fileobj.read(BYTE))
 
+    @classmethod
+    def mmap_file(cls, filename):
+        # read-only shared mapping, processes mapping the same file share the page cache
+        fileobj = open(filename, 'rb')
+        try:
+            mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            return fileobj
+        fileobj.close()
+        return mapped
+
     @classmethod
     def read_unconstrained_null_terminated_string_data(cls, data, limit=4096):
         fileobj = BytesIO(data)
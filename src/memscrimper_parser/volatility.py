@@ -0,0 +1,197 @@
+from .header import MemscrimperHeader
+from .interface import Memscrimper
+from .refstore import ReferenceStore
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import os
+import logging
+
+try:
+    from volatility3.framework import exceptions, interfaces
+    from volatility3.framework.configuration import requirements
+    from volatility3.framework.layers import physical, resources
+except ImportError:
+    interfaces = None
+
+HAVE_VOLATILITY = interfaces is not None
+
+mp_logger = logging.getLogger(__name__)
+
+# global configuration key the stacker reads the reference location from, e.g.
+# vol -c config.json with {"memscrimper.reference_location": "file:///data/base.raw"}
+REFERENCE_CONFIG = 'memscrimper.reference_location'
+
+
+def location_to_path(location):
+    """Local path of a file: URL or plain path, None for other schemes."""
+    if location is None:
+        return None
+    parsed = urlparse(location)
+    if parsed.scheme == 'file':
+        return url2pathname(parsed.path)
+    if parsed.scheme == '' or len(parsed.scheme) == 1:
+        # plain paths, including windows drive letters
+        return location
+    return None
+
+
+if HAVE_VOLATILITY:
+    class MemscrimperLayer(interfaces.layers.DataLayerInterface):
+        """Volatility3 physical layer over a Memscrimper .compress file.
+
+        Like physical.FileLayer the layer reads its file from location, the
+        stacker passes on the location of the file layer holding the .compress
+        file, and it depends on no other layer: the image is reconstructed on
+        read from the body and the reference, which has no address range in a
+        lower layer.  The reference image comes from the reference_location
+        option, else the reference name recorded in the body, as given or next
+        to the .compress file; layers over dumps of the same base image share it
+        through ReferenceStore.default().  Reads go through
+        Memscrimper.open_image, so every read resolves its pages run by run
+        (MemscrimperBody._fill_range) and a READ_AHEAD buffer serves the small
+        sequential reads of object parsing.
+        """
+        READ_AHEAD = 1 << 20
+
+        def __init__(self, context, config_path: str, name: str, metadata=None) -> None:
+            super().__init__(context, config_path, name, metadata)
+            self._location = self.config['location']
+            self._reference_location = self.config.get('reference_location', None)
+            self._lazy = self.config.get('lazy', True)
+            self._accessor = resources.ResourceAccessor()
+            self._ms = None
+            self._image = None
+            self._open()
+
+        @classmethod
+        def get_requirements(cls):
+            return [
+                requirements.StringRequirement(name='location', optional=False),
+                requirements.URIRequirement(name='reference_location', optional=True,
+                                            description='Reference image the dump was compressed against'),
+                requirements.BooleanRequirement(name='lazy', optional=True, default=True,
+                                                description='Decode the body sections on first use'),
+            ]
+
+        @property
+        def location(self) -> str:
+            return self._location
+
+        def _find_reference(self, ms):
+            candidates = []
+            if self._reference_location is not None:
+                candidates.append(location_to_path(self._reference_location))
+            else:
+                recorded = os.fsdecode(bytes(ms.msb.reference_image_name))
+                candidates.append(recorded)
+                filename = location_to_path(self._location)
+                if filename is not None:
+                    candidates.append(os.path.join(os.path.dirname(filename), os.path.basename(recorded)))
+            for candidate in candidates:
+                if candidate is not None and os.path.isfile(candidate):
+                    return candidate
+            raise exceptions.LayerException(self.name, "Memscrimper reference image not found, tried {}, set "
+                                                       "reference_location".format(candidates))
+
+        def _open(self):
+            src_fileobj = self._accessor.open(self._location, 'rb')
+            try:
+                ms = Memscrimper(src_fileobj=src_fileobj, load=True, lazy=self._lazy,
+                                 reference_store=ReferenceStore.default())
+                ms.associate_reference_data(self._find_reference(ms))
+            except BaseException:
+                src_fileobj.close()
+                raise
+            self._ms = ms
+            self._image = ms.open_image(buffering=self.READ_AHEAD)
+
+        @property
+        def ms(self) -> Memscrimper:
+            if self._ms is None:
+                self._open()
+            return self._ms
+
+        @property
+        def minimum_address(self) -> int:
+            return 0
+
+        @property
+        def maximum_address(self) -> int:
+            return self.ms.uncompressed_size - 1
+
+        def is_valid(self, offset: int, length: int = 1) -> bool:
+            return self.minimum_address <= offset and offset + length - 1 <= self.maximum_address
+
+        def runs(self, offset: int = 0, length: int = None):
+            """(offset, length, kind) of the page map runs, kind one of the PageMap kinds."""
+            ps = self.ms.page_size
+            last_page = None if length is None else (offset + length - 1) // ps
+            for first, last, kind, _ in self.ms.runs(offset // ps, last_page):
+                yield first * ps, (last - first + 1) * ps, kind
+
+        def read(self, offset: int, length: int, pad: bool = False) -> bytes:
+            if length <= 0:
+                return b''
+            if not self.is_valid(offset, length):
+                if not pad:
+                    invalid = offset if offset < self.minimum_address else self.maximum_address + 1
+                    raise exceptions.InvalidAddressException(self.name, invalid,
+                                                             "Offset outside of the buffer boundaries")
+                start = max(offset, self.minimum_address)
+                stop = min(offset + length, self.maximum_address + 1)
+                if stop <= start:
+                    return b'\x00' * length
+                data = self.read(start, stop - start)
+                return b'\x00' * (start - offset) + data + b'\x00' * (offset + length - stop)
+            if self._image is None:
+                self._open()
+            self._image.seek(offset)
+            data = self._image.read(length)
+            if len(data) != length:
+                raise exceptions.InvalidAddressException(self.name, offset + len(data), "Short read")
+            return data
+
+        def write(self, offset: int, value: bytes) -> None:
+            raise exceptions.LayerException(self.name, "Memscrimper layers are read only")
+
+        def destroy(self) -> None:
+            if self._ms is not None:
+                self._image = None
+                self._ms.destroy()
+                self._ms = None
+
+        def __getstate__(self):
+            # reopened from location on first use after unpickling
+            state = dict(self.__dict__)
+            state['_ms'] = None
+            state['_image'] = None
+            return state
+
+    class MemscrimperStacker(interfaces.automagic.StackerLayerInterface):
+        """Stacks a MemscrimperLayer, reading the same file, on file layers starting with the MBCR magic."""
+        stack_order = 10
+
+        @classmethod
+        def stack(cls, context, layer_name: str, progress_callback=None):
+            base = context.layers[layer_name]
+            if not isinstance(base, physical.FileLayer):
+                return None
+            try:
+                magic = base.read(0, len(MemscrimperHeader.MAGIC))
+            except exceptions.InvalidAddressException:
+                return None
+            if magic != MemscrimperHeader.MAGIC:
+                return None
+
+            new_layer_name = context.layers.free_layer_name("MemscrimperLayer")
+            config_path = interfaces.configuration.path_join("automagic", "layer_stacker", "stack", new_layer_name)
+            context.config[interfaces.configuration.path_join(config_path, "location")] = base.location
+            reference_location = context.config.get(REFERENCE_CONFIG, None)
+            if reference_location is not None:
+                context.config[interfaces.configuration.path_join(config_path, "reference_location")] = \
+                    reference_location
+            try:
+                return MemscrimperLayer(context, config_path, new_layer_name)
+            except Exception as e:
+                mp_logger.warning("Unable to stack a Memscrimper layer on {}: {}".format(layer_name, e))
+                return None
@@ -0,0 +1,372 @@
+from hashlib import blake2b
+from io import BytesIO
+from .accel import Accel
+from .header import MemscrimperHeader
+from .layer import MemscrimperBody
+from .util import Util
+import struct
+import logging
+
+mp_logger = logging.getLogger(__name__)
+
+
+class MemscrimperWriter(object):
+    """Compresses a target image against a reference into an MBCR file.
+
+    Every target page becomes one of:
+        identity    equal to the reference page at the same address, not stored
+        distinct    equal to some other reference page, stored as a remap
+        diff        close to the reference page at the same address, stored as
+                    patches (interdedupdelta only)
+        interdedup  stored once in the page data, repeated pages share it
+
+    The body is laid out the way MemscrimperBody.handle_interdedup and
+    handle_interdedupdelta parse it and compressed with the inner compression
+    class named in the method.  Page comparison, fingerprints and diff runs use
+    NumPy through Accel when available.
+    """
+    name = 'MemscrimperWriter'
+    DEBUG = False
+    MAJOR = 1
+    MINOR = 0
+    # pages compared / fingerprinted per vectorized call
+    CHUNK_PAGES = 4096
+    # diffs larger than this share of the page are stored as interdedup pages
+    DIFF_RATIO = 0.5
+    # unchanged gaps shorter than a patch header are cheaper to copy than to skip
+    MERGE_GAP = 3
+    MAX_INTERVAL_LEFT = (1 << 29) - 1
+    # small sections are gathered up to this many bytes before they go to the compressor
+    WRITE_BUFFER = 1 << 20
+
+    @classmethod
+    def log(cls, msg, how='debug'):
+        if cls.DEBUG:
+            mp_logger.debug("{} {}".format(cls.name, msg))
+
+    def __init__(self, page_size=4096, inner=b'gzip', delta=True, diff_ratio=None):
+        if inner not in MemscrimperHeader.SUPPORTED_COMPRESSION_CLS:
+            raise Exception("{} is not a supported inner compression, expected one of {}".format(
+                inner, sorted(MemscrimperHeader.SUPPORTED_COMPRESSION_CLS)))
+        self.page_size = page_size
+        self.inner = inner
+        self.delta = delta
+        self.diff_ratio = self.DIFF_RATIO if diff_ratio is None else diff_ratio
+        self.compression_cls = MemscrimperHeader.SUPPORTED_COMPRESSION_CLS[inner]
+        self.vectorize = Accel.ENABLED and page_size % 8 == 0
+        self.stats = {}
+
+    @property
+    def method(self) -> bytes:
+        body_method = MemscrimperBody.INTERDEDUPDELTA if self.delta else MemscrimperBody.INTERDEDUP
+        return body_method + b'_' + self.inner
+
+    def compress_file(self, ref_filename, target_filename, out_filename, reference_name=None, pc=None) -> dict:
+        """Writes out_filename and returns the page statistics."""
+        if reference_name is None:
+            reference_name = ref_filename
+        ref = Util.mmap_file(ref_filename)
+        target = Util.mmap_file(target_filename)
+        try:
+            with open(out_filename, 'wb') as out:
+                self.write(out, ref, target, reference_name, pc=pc)
+        finally:
+            ref.close()
+            target.close()
+        return self.stats
+
+    def compress(self, ref, target, reference_name, pc=None) -> bytes:
+        """Returns the MBCR file for target, both images as bytes-like objects (e.g. mmaps).
+        pc is a PageClassification computed elsewhere, e.g. by ParallelPageHasher."""
+        out = BytesIO()
+        self.write(out, ref, target, reference_name, pc=pc)
+        return out.getvalue()
+
+    def write(self, fileobj, ref, target, reference_name, pc=None) -> int:
+        """Writes the MBCR file for target to fileobj, the body sections go through the inner
+        compressor as they are laid out.  Returns the number of bytes written."""
+        if isinstance(reference_name, str):
+            reference_name = reference_name.encode()
+        if pc is None:
+            pc = self.classify(ref, target)
+        written = fileobj.write(MemscrimperHeader.pack_header(self.method, self.MAJOR, self.MINOR,
+                                                              self.page_size, len(target)))
+        compressor = self.compression_cls.new_compressor()
+        pending = bytearray()
+        for piece in self.iter_body(pc, target, reference_name):
+            pending += piece
+            if len(pending) >= self.WRITE_BUFFER:
+                written += fileobj.write(compressor.compress(pending))
+                pending.clear()
+        written += fileobj.write(compressor.compress(pending))
+        written += fileobj.write(compressor.flush())
+        return written
+
+    def build_body(self, ref, target, reference_name: bytes) -> bytes:
+        return self.encode_body(self.classify(ref, target), target, reference_name)
+
+    def _check_sizes(self, ref_size, target_size) -> (int, int):
+        ps = self.page_size
+        if target_size % ps != 0:
+            raise Exception("Target size {} is not a multiple of the page size {}".format(target_size, ps))
+        num_pages = target_size // ps
+        if num_pages - 1 > self.MAX_INTERVAL_LEFT:
+            raise Exception("{} pages do not fit the 29 bit interval encoding".format(num_pages))
+        return num_pages, ref_size // ps
+
+    def classify(self, ref, target) -> 'PageClassification':
+        """Sorts the target pages in process, see ParallelPageHasher for the process pool version."""
+        ps = self.page_size
+        num_pages, ref_pages = self._check_sizes(len(ref), len(target))
+        ref_view = memoryview(ref)
+        target_view = memoryview(target)
+
+        changed = self._changed_pages(ref_view, target_view, min(ref_pages, num_pages))
+        changed.extend(range(ref_pages, num_pages))
+        pc = PageClassification(ps, num_pages, ref_pages)
+        pc.ref_index = self._reference_index(ref_view, ref_pages)
+        diff_limit = self.diff_limit
+        for first in range(0, len(changed), self.CHUNK_PAGES):
+            pagenrs = changed[first:first + self.CHUNK_PAGES]
+            for pagenr, fp in zip(pagenrs, self._fingerprints(target_view, pagenrs)):
+                if pc.assign_shared(ref_view, target_view, pagenr, fp):
+                    continue
+                patch = None
+                if self.delta and pagenr < ref_pages:
+                    patch = self.encode_diff(ref_view[pagenr * ps:(pagenr + 1) * ps],
+                                             target_view[pagenr * ps:(pagenr + 1) * ps], diff_limit)
+                pc.assign_new(pagenr, fp, patch, diff_limit)
+        pc.identity = num_pages - len(changed)
+        self.stats = pc.stats()
+        self.log("Page kinds: {}".format(self.stats))
+        return pc
+
+    @property
+    def diff_limit(self) -> int:
+        return int(self.page_size * self.diff_ratio)
+
+    def encode_body(self, pc: 'PageClassification', target, reference_name: bytes) -> bytes:
+        """Lays out the sections MemscrimperBody.handle_interdedup(delta) parse."""
+        return b''.join(self.iter_body(pc, target, reference_name))
+
+    def iter_body(self, pc: 'PageClassification', target, reference_name: bytes):
+        """The body of encode_body piece by piece, page data as views into target."""
+        ps = self.page_size
+        target_view = memoryview(target)
+        yield reference_name + b'\x00'
+        ref_pagenrs = sorted(pc.distinct)
+        yield self.encode_pagenr_list(ref_pagenrs)
+        for ref_pagenr in ref_pagenrs:
+            yield self.encode_interval_list(self.to_intervals(pc.distinct[ref_pagenr]))
+        if self.delta:
+            diff_pagenrs = sorted(pc.diffs)
+            yield self.encode_pagenr_list(diff_pagenrs)
+            for pagenr in diff_pagenrs:
+                yield pc.diffs[pagenr]
+        yield struct.pack("<I", len(pc.sources))
+        for pagenrs in pc.sources:
+            yield self.encode_interval_list(self.to_intervals(pagenrs))
+        for pagenrs in pc.sources:
+            yield target_view[pagenrs[0] * ps:(pagenrs[0] + 1) * ps]
+
+    def _changed_pages(self, ref_view, target_view, num_pages) -> list:
+        ps = self.page_size
+        changed = []
+        for first in range(0, num_pages, self.CHUNK_PAGES):
+            count = min(self.CHUNK_PAGES, num_pages - first)
+            a = ref_view[first * ps:(first + count) * ps]
+            b = target_view[first * ps:(first + count) * ps]
+            if a == b:
+                continue
+            if self.vectorize:
+                changed.extend(first + i for i in Accel.changed_pages(a, b, ps))
+            else:
+                changed.extend(first + i for i in range(count) if a[i * ps:(i + 1) * ps] != b[i * ps:(i + 1) * ps])
+        return changed
+
+    def _fingerprints(self, view, pagenrs) -> list:
+        ps = self.page_size
+        if not self.vectorize:
+            return [blake2b(view[p * ps:(p + 1) * ps], digest_size=8).digest() for p in pagenrs]
+        if len(pagenrs) > 0 and pagenrs[-1] - pagenrs[0] + 1 == len(pagenrs):
+            return Accel.page_fingerprints(view[pagenrs[0] * ps:(pagenrs[-1] + 1) * ps], ps)
+        return Accel.page_fingerprints(b''.join(view[p * ps:(p + 1) * ps] for p in pagenrs), ps)
+
+    def _reference_index(self, ref_view, ref_pages) -> dict:
+        """fingerprint -> first reference page with it."""
+        index = {}
+        for first in range(0, ref_pages, self.CHUNK_PAGES):
+            pagenrs = range(first, min(first + self.CHUNK_PAGES, ref_pages))
+            for pagenr, fp in zip(pagenrs, self._fingerprints(ref_view, pagenrs)):
+                index.setdefault(fp, pagenr)
+        return index
+
+    def diff_runs(self, old, new, limit=None) -> list:
+        """[start, end) runs of differing bytes, None when more than limit bytes differ."""
+        if self.vectorize:
+            return Accel.diff_runs(old, new, self.MERGE_GAP, limit)
+        runs = []
+        differing = 0
+        block = 64
+        for offset in range(0, len(old), block):
+            if old[offset:offset + block] == new[offset:offset + block]:
+                continue
+            for i in range(offset, min(offset + block, len(old))):
+                if old[i] == new[i]:
+                    continue
+                differing += 1
+                if runs and i - runs[-1][1] < self.MERGE_GAP:
+                    runs[-1][1] = i + 1
+                else:
+                    runs.append([i, i + 1])
+            if limit is not None and differing > limit:
+                return None
+        return runs
+
+    def encode_diff(self, old, new, limit=None) -> bytes:
+        """Patch record for MemscrimperDiffSection.parse_diff_intreval: a u16 count, then per
+        patch a Util.decode header (rel, sz) and the sz + 1 new bytes.  Returns None when
+        more than limit bytes differ."""
+        runs = self.diff_runs(old, new, limit)
+        if runs is None:
+            return None
+        items = bytearray()
+        count = 0
+        prev_end = 0
+        for start, end in runs:
+            # the 3 byte header holds a 12 bit rel, bridge longer gaps with unchanged bytes
+            while start - prev_end > 0xFFF:
+                items += self.encode_patch_header(0xFFF, 0) + new[prev_end + 0xFFF:prev_end + 0x1000]
+                prev_end += 0x1000
+                count += 1
+            while start < end:
+                n = min(end - start, 0x800)
+                items += self.encode_patch_header(start - prev_end, n - 1) + new[start:start + n]
+                prev_end = start + n
+                start += n
+                count += 1
+        if count > 0xFFFF:
+            raise Exception("{} patches do not fit a diff record".format(count))
+        return struct.pack("<H", count) + bytes(items)
+
+    @classmethod
+    def encode_patch_header(cls, rel, sz) -> bytes:
+        """Inverse of Util.decode: [sz, rel] when both fit a byte (sz < 128), else the 3 byte blop."""
+        if rel < 256 and sz < 128:
+            return bytes([sz, rel])
+        blop = (sz << 12) | rel
+        return bytes([0x80 | (blop >> 16), (blop >> 8) & 0xFF, blop & 0xFF])
+
+    @classmethod
+    def encode_pagenr_list(cls, pagenrs) -> bytes:
+        """Inverse of MemscrimperSection.parse_pagenr_lists, pagenrs must be sorted."""
+        out = bytearray(struct.pack("<I", len(pagenrs)))
+        prev = None
+        for pagenr in pagenrs:
+            value = pagenr if prev is None else pagenr - prev - 1
+            prev = pagenr
+            if value < 128:
+                out.append(0x80 | value)
+            else:
+                out += struct.pack(">I", value)
+        return bytes(out)
+
+    @classmethod
+    def to_intervals(cls, pagenrs) -> list:
+        intervals = []
+        for pagenr in sorted(pagenrs):
+            if intervals and intervals[-1][1] == pagenr - 1:
+                intervals[-1][1] = pagenr
+            else:
+                intervals.append([pagenr, pagenr])
+        return intervals
+
+    @classmethod
+    def encode_interval_list(cls, intervals) -> bytes:
+        """Inverse of MemscrimperSection.parse_interval_list: a u32 header per interval with the
+        left page in bits 0-28, the delta size code in bits 29-30 and the last flag in bit 31,
+        followed by the 0, 1, 2 or 4 byte delta."""
+        out = bytearray()
+        for i, (left, right) in enumerate(intervals):
+            delta = right - left
+            if delta == 0:
+                code, tail = 0, b''
+            elif delta < 1 << 8:
+                code, tail = 1, struct.pack("<B", delta)
+            elif delta < 1 << 16:
+                code, tail = 2, struct.pack("<H", delta)
+            else:
+                code, tail = 3, struct.pack("<I", delta)
+            last = 1 if i == len(intervals) - 1 else 0
+            out += struct.pack("<I", left | (code << 29) | (last << 31)) + tail
+        return bytes(out)
+
+
+class PageClassification(object):
+    """Where each changed target page goes, the input of MemscrimperWriter.encode_body.
+
+    distinct maps a reference page to the target pages equal to it, diffs maps
+    a target page to its patch record and sources lists the target pages of
+    every interdedup page, the page data is read from the first of them.
+    """
+
+    def __init__(self, page_size, num_pages, ref_pages):
+        self.page_size = page_size
+        self.num_pages = num_pages
+        self.ref_pages = ref_pages
+        self.identity = 0
+        self.ref_index = {}
+        self.distinct = {}
+        self.diffs = {}
+        self.sources = []
+        self.source_index = {}
+
+    def find_distinct(self, ref_view, target_view, pagenr, fp):
+        """The reference page holding the same data as target page pagenr, or None."""
+        ps = self.page_size
+        ref_pagenr = self.ref_index.get(fp, None)
+        if ref_pagenr is not None and \
+                ref_view[ref_pagenr * ps:(ref_pagenr + 1) * ps] == target_view[pagenr * ps:(pagenr + 1) * ps]:
+            return ref_pagenr
+        return None
+
+    def find_source(self, target_view, pagenr, fp):
+        """The interdedup page holding the same data as target page pagenr, or None."""
+        ps = self.page_size
+        page = target_view[pagenr * ps:(pagenr + 1) * ps]
+        for i in self.source_index.get(fp, ()):
+            first = self.sources[i][0]
+            if target_view[first * ps:(first + 1) * ps] == page:
+                return i
+        return None
+
+    def assign_shared(self, ref_view, target_view, pagenr, fp, ref_pagenr=None) -> bool:
+        """Assigns pagenr to a distinct remap or an existing interdedup page when one holds
+        the same data; fingerprint matches are verified byte for byte."""
+        if ref_pagenr is None:
+            ref_pagenr = self.find_distinct(ref_view, target_view, pagenr, fp)
+        if ref_pagenr is not None:
+            self.distinct.setdefault(ref_pagenr, []).append(pagenr)
+            return True
+        source = self.find_source(target_view, pagenr, fp)
+        if source is not None:
+            self.sources[source].append(pagenr)
+            return True
+        return False
+
+    def assign_new(self, pagenr, fp, patch, diff_limit) -> None:
+        if patch is not None and len(patch) <= diff_limit:
+            self.diffs[pagenr] = patch
+            return
+        self.source_index.setdefault(fp, []).append(len(self.sources))
+        self.sources.append([pagenr])
+
+    def stats(self) -> dict:
+        return {
+            'pages': self.num_pages,
+            'identity': self.identity,
+            'distinct': sum(len(v) for v in self.distinct.values()),
+            'diff': len(self.diffs),
+            'interdedup': sum(len(v) for v in self.sources),
+            'interdedup_unique': len(self.sources),
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests run against the checkout, src/ layout without an install
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
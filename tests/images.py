@@ -0,0 +1,96 @@
+from memscrimper_parser.compression import HAVE_ZSTD, HAVE_LZ4
+from memscrimper_parser.pagemap import PageMap
+from memscrimper_parser.writer import MemscrimperWriter
+import os
+import random
+
+
+INNERS = [b'gzip', b'bzip2', b'zip7', b'noinner'] + ([b'zstd'] if HAVE_ZSTD else []) + \
+         ([b'lz4'] if HAVE_LZ4 else [])
+
+
+class SyntheticImage(object):
+    """A reference and a target image holding every page kind MemscrimperWriter produces.
+
+    kinds maps each target page to its expected (kind, value) for the delta
+    method, values are the reference page for REFERENCE, DISTINCT and DIFF
+    pages and the first target page with the data for SOURCE pages.
+    """
+    PAGE_SIZE = 4096
+    REF_PAGES = 64
+    TARGET_PAGES = 80
+
+    def __init__(self, seed=0x4d42, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        ref = [self._random_page() for _ in range(self.REF_PAGES)]
+        target = []
+        self.kinds = {}
+
+        def add(page, kind, value):
+            self.kinds[len(target)] = (kind, value)
+            target.append(page)
+
+        for p in range(16):
+            add(ref[p], PageMap.REFERENCE, p)
+        for i in range(8):
+            add(ref[40 + i], PageMap.DISTINCT, 40 + i)
+        for _ in range(2):
+            add(ref[40], PageMap.DISTINCT, 40)
+        for p in range(26, 34):
+            add(self._patched(ref[p], p), PageMap.DIFF, p)
+        for p in (34, 35):
+            add(self._patched(ref[p], p, heavy=True), PageMap.SOURCE, p)
+        for _ in range(8):
+            add(self._random_page(), PageMap.SOURCE, len(target))
+        for _ in range(4):
+            add(target[36], PageMap.SOURCE, 36)
+        for p in range(48, 64):
+            add(ref[p], PageMap.REFERENCE, p)
+        for _ in range(8):
+            add(self._random_page(), PageMap.SOURCE, len(target))
+        for _ in range(4):
+            add(ref[5], PageMap.DISTINCT, 5)
+        for _ in range(4):
+            add(target[64], PageMap.SOURCE, 64)
+
+        self.ref = b''.join(ref)
+        self.target = b''.join(target)
+
+    def _random_page(self) -> bytes:
+        return self.rng.getrandbits(8 * self.page_size).to_bytes(self.page_size, 'little')
+
+    def _patched(self, page, seed, heavy=False) -> bytes:
+        """page with a short patch and one too long for the 2 byte patch header, heavy
+        changes every other byte so the diff exceeds the writer's ratio."""
+        out = bytearray(page)
+        out[seed % 64] ^= 0xFF
+        out[1000:1000 + 200 + seed] = bytes(b ^ 0x5A for b in out[1000:1000 + 200 + seed])
+        if heavy:
+            for offset in range(0, self.page_size, 2):
+                out[offset] ^= 0xA5
+        return bytes(out)
+
+    def expected_kind(self, pagenr, delta=True) -> (int, int):
+        kind, value = self.kinds[pagenr]
+        if kind == PageMap.DIFF and not delta:
+            return PageMap.SOURCE, pagenr
+        return kind, value
+
+    def page(self, pagenr) -> bytes:
+        return self.target[pagenr * self.page_size:(pagenr + 1) * self.page_size]
+
+    def write(self, directory, inner=b'gzip', delta=True, name=None) -> (str, str, str):
+        """Writes the reference, the raw target and its .compress file, returns their paths."""
+        name = name or '{}_{}'.format(inner.decode(), int(delta))
+        ref_filename = os.path.join(directory, 'image.ref')
+        raw_filename = os.path.join(directory, 'image.raw')
+        if not os.path.exists(ref_filename):
+            with open(ref_filename, 'wb') as out:
+                out.write(self.ref)
+            with open(raw_filename, 'wb') as out:
+                out.write(self.target)
+        src_filename = os.path.join(directory, name + '.compress')
+        MemscrimperWriter(page_size=self.page_size, inner=inner, delta=delta).compress_file(
+            ref_filename, raw_filename, src_filename, reference_name='image.ref')
+        return src_filename, ref_filename, raw_filename
@@ -0,0 +1,77 @@
+from memscrimper_parser.aio import AsyncMemscrimper
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import tempfile
+import unittest
+
+
+class AsyncMemscrimperTest(unittest.TestCase):
+    """AsyncMemscrimper results against the synchronous reads."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.other_filename, _, _ = cls.image.write(cls.tmp.name, b'zip7', False)
+        cls.executor = ThreadPoolExecutor(max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+        cls.tmp.cleanup()
+
+    def test_matches_sync(self):
+        ms = Memscrimper(src_filename=self.src_filename, ref_filename=self.ref_filename, load=True)
+        self.addCleanup(ms.destroy)
+
+        async def run():
+            async with AsyncMemscrimper(executor=self.executor, src_filename=self.src_filename,
+                                        ref_filename=self.ref_filename) as ams:
+                pages = await asyncio.gather(*[ams.read_page(p) for p in range(SyntheticImage.TARGET_PAGES)])
+                self.assertEqual(pages, [ms.read_page(p) for p in range(SyntheticImage.TARGET_PAGES)])
+                self.assertEqual(await ams.read_page(offset=36 * 4096 + 5), ms.read_page(36))
+                self.assertEqual(await ams.vol_read(4096 * 25 + 7, 3 * 4096), ms.vol_read(4096 * 25 + 7, 3 * 4096))
+                self.assertEqual(await ams.read_meta_page_num(26), ms.read_meta_page_num(26))
+                self.assertEqual(await ams.changed_pages(), ms.changed_pages)
+                self.assertEqual((await ams.read_to_target()).getvalue(), self.image.target)
+
+                page_nums = [70, 26, 0, 1, 2, 36, 36]
+                views = await ams.read_pages(page_nums)
+                self.assertEqual([bytes(v) for v in views], [bytes(v) for v in ms.read_pages(page_nums)])
+                views = await ams.read_range(20, 10)
+                self.assertEqual([bytes(v) for v in views], [bytes(v) for v in ms.read_range(20, 10)])
+
+        asyncio.run(run())
+
+    def test_shared_reads(self):
+        async def run():
+            ams = await AsyncMemscrimper.open(executor=self.executor, src_filename=self.src_filename,
+                                              ref_filename=self.ref_filename)
+            first, second = await asyncio.gather(ams.read_range(24, 4), ams.read_range(24, 4))
+            # one read, each caller gets read only views
+            self.assertEqual([bytes(v) for v in first], [self.image.page(p) for p in range(24, 28)])
+            self.assertEqual([bytes(v) for v in second], [bytes(v) for v in first])
+            self.assertTrue(all(v.readonly for v in first + second))
+            self.assertEqual(ams._inflight, {})
+            await ams.close()
+            self.assertIsNone(ams.ms)
+
+        asyncio.run(run())
+
+    def test_many_dumps(self):
+        async def run():
+            dumps = [AsyncMemscrimper(executor=self.executor, src_filename=filename, ref_filename=self.ref_filename)
+                     for filename in (self.src_filename, self.other_filename)]
+            for ams in dumps:
+                await ams.load()
+            reads = [ams.read_page(p) for p in range(SyntheticImage.TARGET_PAGES) for ams in dumps]
+            pages = await asyncio.gather(*reads)
+            expected = [self.image.page(p) for p in range(SyntheticImage.TARGET_PAGES) for _ in dumps]
+            self.assertEqual(pages, expected)
+            for ams in dumps:
+                await ams.close()
+
+        asyncio.run(run())
@@ -0,0 +1,70 @@
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+from io import BytesIO
+import hashlib
+import tempfile
+import unittest
+
+
+class StreamingAuditTest(unittest.TestCase):
+    """audit_stream against the raw image, clean and with corrupted pages."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        src_filename, ref_filename, cls.raw_filename = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ms.destroy()
+        cls.tmp.cleanup()
+
+    def corrupted(self, *pagenrs) -> BytesIO:
+        data = bytearray(self.image.target)
+        for pagenr in pagenrs:
+            data[pagenr * SyntheticImage.PAGE_SIZE + 100] ^= 0xFF
+        return BytesIO(bytes(data))
+
+    def test_clean(self):
+        buffer, report = self.ms.audit_stream(act_target_filename=self.raw_filename, return_buffer=True,
+                                              batch_pages=16, whole_image=True, digest='sha256')
+        self.assertTrue(report.ok)
+        self.assertEqual((report.pages, report.bytes), (SyntheticImage.TARGET_PAGES, len(self.image.target)))
+        self.assertEqual(report.results, [])
+        self.assertEqual(report.ranges, [[0, SyntheticImage.TARGET_PAGES - 1, True]])
+        self.assertEqual(report.reconstructed_digest, hashlib.sha256(self.image.target).hexdigest())
+        self.assertEqual(report.actual_digest, report.reconstructed_digest)
+        self.assertEqual(buffer.getvalue(), self.image.target)
+
+    def test_corrupted_page(self):
+        # page 36 is an interdedup source page, 26 a diff page in the same batch of 16
+        _, report = self.ms.audit_stream(act_target_fileobj=self.corrupted(26, 36), batch_pages=16,
+                                         whole_image=True)
+        self.assertFalse(report.ok)
+        self.assertEqual([r[:2] for r in report.results], [(26, 26 * 4096), (36, 36 * 4096)])
+        for pagenr, _, am, sm, ok in report.results:
+            self.assertFalse(ok)
+            self.assertEqual(sm, hashlib.md5(self.image.page(pagenr)).hexdigest())
+            self.assertNotEqual(am, sm)
+        self.assertEqual(report.ranges, [[0, 25, True], [26, 26, False], [27, 35, True], [36, 36, False],
+                                         [37, SyntheticImage.TARGET_PAGES - 1, True]])
+        self.assertNotEqual(report.actual_digest, report.reconstructed_digest)
+        self.assertEqual(report.pages, SyntheticImage.TARGET_PAGES)
+
+    def test_fail_fast(self):
+        _, report = self.ms.audit_stream(act_target_fileobj=self.corrupted(26, 36, 70), batch_pages=16,
+                                         fail_fast=True)
+        self.assertFalse(report.ok)
+        self.assertEqual([r[0] for r in report.results], [26])
+        # the audit stops in the batch holding the first mismatch
+        self.assertEqual(report.pages, 32)
+        self.assertEqual(report.ranges[-1], [26, 26, False])
+
+    def test_matches_per_page_audit(self):
+        act = self.corrupted(5, 70)
+        _, report = self.ms.audit_stream(act_target_fileobj=act, batch_pages=7, workers=1)
+        _, results = self.ms.audit_decompression(act_target_fileobj=self.corrupted(5, 70), fail_fast=False,
+                                                 debug=False)
+        self.assertEqual(report.results, [r for r in results if not r[-1]])
@@ -0,0 +1,114 @@
+from memscrimper_parser.cache import PageCache, LRUPageCache, ClockPageCache, LockedPageCache
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+import tempfile
+import threading
+import unittest
+
+
+class PageCacheTest(unittest.TestCase):
+    """Eviction order of the bounded page caches."""
+
+    def page(self, key) -> bytes:
+        return bytes([key]) * 10
+
+    def fill(self, cache, keys):
+        for key in keys:
+            cache[key] = self.page(key)
+
+    def test_create(self):
+        self.assertIsInstance(PageCache.create(), PageCache)
+        self.assertEqual(PageCache.create().POLICY, 'unbounded')
+        self.assertIsInstance(PageCache.create(max_bytes=100), LRUPageCache)
+        self.assertIsInstance(PageCache.create('clock', 100), ClockPageCache)
+        with self.assertRaises(Exception):
+            PageCache.create('fifo')
+
+    def test_unbounded(self):
+        cache = PageCache.create()
+        self.fill(cache, range(100))
+        self.assertEqual((len(cache), cache.size, cache.evictions), (100, 1000, 0))
+
+    def test_lru(self):
+        cache = PageCache.create('lru', 30)
+        self.fill(cache, (1, 2, 3))
+        # a hit makes 1 the most recently used, 2 goes first
+        self.assertEqual(cache.get(1), self.page(1))
+        self.fill(cache, (4,))
+        self.assertEqual(sorted(cache._pages), [1, 3, 4])
+        self.fill(cache, (5,))
+        self.assertEqual(list(cache._pages), [1, 4, 5])
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertEqual(cache.size, 30)
+
+    def test_clock(self):
+        cache = PageCache.create('clock', 30)
+        self.fill(cache, (1, 2, 3))
+        # 1 is referenced, the hand moves it behind 4 and evicts 2
+        self.assertEqual(cache.get(1), self.page(1))
+        self.fill(cache, (4,))
+        self.assertEqual(list(cache._pages), [3, 4, 1])
+        # the second chance cleared the bit, 1 goes in its turn
+        self.fill(cache, (5, 6))
+        self.assertEqual(list(cache._pages), [1, 5, 6])
+        self.fill(cache, (7,))
+        self.assertEqual(list(cache._pages), [5, 6, 7])
+        self.assertEqual(cache.evictions, 4)
+
+    def test_replace_and_clear(self):
+        for policy in ('unbounded', 'lru', 'clock'):
+            with self.subTest(policy=policy):
+                cache = PageCache.create(policy, 30)
+                self.fill(cache, (1, 1, 2))
+                self.assertEqual((len(cache), cache.size), (2, 20))
+                self.assertIn(1, cache)
+                with self.assertRaises(KeyError):
+                    cache[3]
+                cache.clear()
+                self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_locked(self):
+        cache = LockedPageCache(PageCache.create('lru', 1000))
+        self.assertEqual(cache.POLICY, 'lru')
+
+        def worker(base):
+            for i in range(200):
+                key = base + i % 150
+                if cache.get(key) is None:
+                    cache[key] = self.page(key % 256)
+
+        threads = [threading.Thread(target=worker, args=(base,)) for base in (0, 50, 100, 150)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertEqual(stats['bytes'], 10 * len(cache))
+        self.assertEqual(stats['hits'] + stats['misses'], 800)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class BoundedBodyCacheTest(unittest.TestCase):
+    """Pages read through a bounded cache match the image and stay within the budget."""
+
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = SyntheticImage()
+            src_filename, ref_filename, _ = image.write(tmp, b'gzip', True)
+            for policy in ('lru', 'clock'):
+                with self.subTest(policy=policy):
+                    ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True,
+                                     use_mmap=False, cache_policy=policy, cache_bytes=4 * 4096)
+                    for _ in range(2):
+                        for pagenr in range(SyntheticImage.TARGET_PAGES):
+                            self.assertEqual(ms.read_page(pagenr), image.page(pagenr))
+                    stats = ms.cache_stats()
+                    ms.destroy()
+                    for name in ('reference', 'source'):
+                        self.assertLessEqual(stats[name]['bytes'], 4 * 4096)
+                    self.assertGreater(stats['reference']['evictions'], 0)
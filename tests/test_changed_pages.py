@@ -0,0 +1,90 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.pagemap import PageMap
+from .images import SyntheticImage
+import contextlib
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+
+
+class ChangedPagesTest(unittest.TestCase):
+    """iter_changed_pages and the dump_diffs example against the per-page reads."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, delta=True, **kwargs) -> Memscrimper:
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', delta)
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def expected_kinds(self, delta) -> dict:
+        kinds = {p: self.image.expected_kind(p, delta)[0] for p in range(SyntheticImage.TARGET_PAGES)}
+        return {p: kind for p, kind in kinds.items() if kind in PageMap.CHANGED_KINDS}
+
+    def flatten(self, batches) -> list:
+        return [(pagenr, kind, bytes(view)) for pages in batches for pagenr, kind, view in pages]
+
+    def test_address_order(self):
+        for delta in (True, False):
+            for batch in (None, 1, 3, 7):
+                with self.subTest(delta=delta, batch=batch):
+                    ms = self.open(delta)
+                    batches = list(ms.iter_changed_pages(batch=batch))
+                    pages = self.flatten(batches)
+                    expected = self.expected_kinds(delta)
+                    self.assertEqual([(p, k) for p, k, _ in pages], sorted(expected.items()))
+                    self.assertEqual([p for p, _, _ in pages], sorted(ms.changed_pages))
+                    for pagenr, _, data in pages:
+                        self.assertEqual(data, self.image.page(pagenr))
+                    if batch is not None:
+                        self.assertTrue(all(len(b) == batch for b in batches[:-1]))
+
+    def test_kind_order(self):
+        ms = self.open()
+        pages = self.flatten(ms.iter_changed_pages(order='kind', batch=5))
+        self.assertEqual([k for _, k, _ in pages], sorted(k for _, k, _ in pages))
+        self.assertEqual(sorted(p for p, _, _ in pages), sorted(self.expected_kinds(True)))
+        with self.assertRaises(Exception):
+            list(ms.iter_changed_pages(order='size'))
+
+    def test_meta(self):
+        ms = self.open()
+        pages = self.flatten(ms.iter_changed_pages(meta=True, batch=4))
+        self.assertEqual([(p, k) for p, k, _ in pages], sorted(self.expected_kinds(True).items()))
+        for pagenr, kind, data in pages:
+            self.assertEqual(data, ms.read_meta_page_num(pagenr), pagenr)
+        # diff pages are patched onto zero pages
+        self.assertNotEqual(dict((p, d) for p, _, d in pages)[26], self.image.page(26))
+
+        # meta pages do not need the reference
+        src_filename, _, _ = self.image.write(self.tmp.name, b'gzip', True)
+        bare = Memscrimper(src_filename=src_filename, load=True)
+        self.addCleanup(bare.destroy)
+        self.assertEqual(self.flatten(bare.iter_changed_pages(meta=True, batch=4)), pages)
+        with self.assertRaises(Exception):
+            list(bare.iter_changed_pages())
+
+    def test_dump_diffs_example(self):
+        path = os.path.join(os.path.dirname(__file__), os.pardir, 'examples', 'dump_diffs.py')
+        spec = importlib.util.spec_from_file_location('dump_diffs', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', True)
+        out = os.path.join(self.tmp.name, 'out')
+        os.makedirs(out, exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.process_file(ref_filename, src_filename, out)
+        ms = self.open()
+        with open(os.path.join(out, os.path.basename(src_filename) + '.pages'), 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b''.join(ms.read_meta_page_num(p) for p in sorted(ms.changed_pages)))
@@ -0,0 +1,87 @@
+from memscrimper_parser.compression import ChunkedBody
+from memscrimper_parser.header import MemscrimperHeader
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.repack import ChunkedRepacker
+from .images import INNERS, SyntheticImage
+import os
+import tempfile
+import unittest
+
+
+class ChunkedRepackTest(unittest.TestCase):
+    """ChunkedRepacker output opened through ChunkedBody, eagerly and lazily."""
+    # small chunks so the sections and pages straddle chunk boundaries
+    CHUNK_SIZE = 5000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, src_filename, ref_filename, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def repack(self, inner=b'gzip', delta=True, repack_inner=None) -> (str, str, dict):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, inner, delta)
+        out_filename = os.path.join(self.tmp.name, '{}_{}_chunked.compress'.format(inner.decode(), int(delta)))
+        stats = ChunkedRepacker(chunk_size=self.CHUNK_SIZE, inner=repack_inner).repack(src_filename, out_filename)
+        return out_filename, ref_filename, stats
+
+    def test_round_trip(self):
+        for inner in INNERS:
+            for delta in (True, False):
+                for lazy in (False, True):
+                    with self.subTest(inner=inner, delta=delta, lazy=lazy):
+                        out_filename, ref_filename, stats = self.repack(inner, delta)
+                        ms = self.open(out_filename, ref_filename, lazy=lazy)
+                        self.assertTrue(ms.method.endswith(MemscrimperHeader.CHUNKED))
+                        self.assertIsInstance(ms.body_bytes, ChunkedBody)
+                        self.assertEqual(stats['chunks'], -(-stats['body_size'] // self.CHUNK_SIZE))
+                        for pagenr in range(SyntheticImage.TARGET_PAGES):
+                            self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+                        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+
+    def test_section_offsets(self):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', True)
+        out_filename, _, stats = self.repack()
+        eager = self.open(src_filename, ref_filename)
+        msb = eager.msb
+        self.assertEqual(stats['sections'], [msb.distinct_pages_section.start, msb.diff_pages_section.start,
+                                             msb.interdedup_pages_section.start])
+        chunked = self.open(out_filename, ref_filename, lazy=True)
+        self.assertEqual(chunked.body_bytes.section_offsets, stats['sections'])
+        # the recorded end spares the lazy open the patch walk
+        self.assertIsNone(chunked.msb.diff_pages_section.patch_offsets)
+        self.assertEqual(chunked.msb.diff_pages_section.end, msb.diff_pages_section.end)
+        self.assertEqual(chunked.collect_page_nums(), eager.collect_page_nums())
+
+    def test_read_at(self):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'bzip2', True)
+        out_filename, _, stats = self.repack(b'bzip2')
+        body = bytes(self.open(src_filename, ref_filename).body_bytes)
+        chunked = self.open(out_filename, ref_filename).body_bytes
+        self.assertEqual(len(chunked), len(body))
+        for offset, size in ((0, 10), (self.CHUNK_SIZE - 3, 7), (3 * self.CHUNK_SIZE - 1, 2 * self.CHUNK_SIZE + 2),
+                             (len(body) - 5, 100)):
+            self.assertEqual(chunked.read_at(offset, size), body[offset:offset + size])
+            self.assertEqual(chunked[offset:offset + size], body[offset:offset + size])
+
+    def test_inner_swap(self):
+        out_filename, ref_filename, stats = self.repack(b'gzip', True, repack_inner=b'bzip2')
+        self.assertEqual(stats['method'], b'interdedupdelta_bzip2_chunked')
+        ms = self.open(out_filename, ref_filename)
+        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+        # repacking a chunked file starts from its chunks
+        again = os.path.join(self.tmp.name, 'again.compress')
+        ChunkedRepacker(chunk_size=self.CHUNK_SIZE * 2).repack(out_filename, again)
+        self.assertEqual(self.open(again, ref_filename).read_to_target().getvalue(), self.image.target)
+
+    def test_unsupported_inner(self):
+        with self.assertRaises(Exception):
+            ChunkedRepacker(inner=b'rar')
@@ -0,0 +1,73 @@
+from memscrimper_parser.crossindex import CrossDumpIndex
+from memscrimper_parser.pagemap import PageMap
+from .images import SyntheticImage
+import os
+import tempfile
+import unittest
+
+
+class CrossDumpIndexTest(unittest.TestCase):
+    """Changed page lookups across a delta and a non delta dump of the same image."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.delta_filename, _, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.plain_filename, _, _ = cls.image.write(cls.tmp.name, b'bzip2', False)
+        cls.index_filename = os.path.join(cls.tmp.name, 'dumps' + CrossDumpIndex.SUFFIX)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def build(self, workers) -> CrossDumpIndex:
+        index = CrossDumpIndex.build([self.delta_filename, self.plain_filename], self.index_filename,
+                                     workers=workers)
+        self.addCleanup(index.close)
+        return index
+
+    def expected(self, delta) -> dict:
+        kinds = {p: self.image.expected_kind(p, delta)[0] for p in range(SyntheticImage.TARGET_PAGES)}
+        return {p: kind for p, kind in kinds.items() if kind != PageMap.REFERENCE}
+
+    def test_build(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                index = self.build(workers)
+                self.assertEqual(len(index), 2)
+                self.assertEqual(index.page_size, SyntheticImage.PAGE_SIZE)
+                self.assertEqual(index.references, [b'image.ref', b'image.ref'])
+                for filename, delta in ((self.delta_filename, True), (self.plain_filename, False)):
+                    pages = {p: kind for first, last, kind in index.changed_runs(filename)
+                             for p in range(first, last + 1)}
+                    self.assertEqual(pages, self.expected(delta))
+
+    def test_query(self):
+        index = self.build(1)
+        both = [self.delta_filename, self.plain_filename]
+        self.assertEqual(index.dumps_touching(0, 15), [])
+        self.assertEqual(index.dumps_touching(48, 63), [])
+        self.assertEqual(index.dumps_touching(36), both)
+        # only the delta dump stores pages 26 to 33 as diffs
+        self.assertEqual(index.dumps_touching(26, 33, kinds=[PageMap.DIFF]), [self.delta_filename])
+        # each unique interdedup page is a run of its own
+        self.assertEqual(index.query(30, 31)[self.plain_filename], [(30, 30, PageMap.SOURCE), (31, 31, PageMap.SOURCE)])
+
+        # runs are clipped to the range
+        results = index.query(14, 27)
+        pages = [p for first, last, _ in results[self.delta_filename] for p in range(first, last + 1)]
+        self.assertEqual(pages, list(range(16, 28)))
+        self.assertEqual(results[self.delta_filename][-1], (26, 27, PageMap.DIFF))
+        self.assertEqual(index.query_address(72 * 4096 + 10, 4096),
+                         {f: [(72, 73, PageMap.DISTINCT)] for f in both})
+
+    def test_reopen(self):
+        self.build(1).close()
+        index = CrossDumpIndex.open(self.index_filename)
+        self.addCleanup(index.close)
+        self.assertEqual(index.dumps, [self.delta_filename, self.plain_filename])
+        with open(self.index_filename, 'r+b') as fileobj:
+            fileobj.write(b'garbage')
+        with self.assertRaises(Exception):
+            CrossDumpIndex.open(self.index_filename)
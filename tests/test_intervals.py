@@ -0,0 +1,77 @@
+from memscrimper_parser.compression import Gzip, SeekableBody
+from memscrimper_parser.sections import MemscrimperSection
+from memscrimper_parser.writer import MemscrimperWriter
+from io import BytesIO
+import random
+import struct
+import unittest
+
+
+class IntervalListTest(unittest.TestCase):
+    """The per-value, packed and skipping interval list decoders agree on the same bytes."""
+    # one list per delta size code, the last flag ends each list
+    GOLDEN = struct.pack('<I', 3) + struct.pack('<IB', 10 | 1 << 29, 2) + \
+        struct.pack('<IH', 300 | 2 << 29, 300) + struct.pack('<II', 70000 | 3 << 29 | 1 << 31, 70000) + \
+        struct.pack('<I', 5 | 1 << 31)
+    GOLDEN_LISTS = [[[3, 3], [10, 12], [300, 600], [70000, 140000]], [[5, 5]]]
+    # the decoders stop short of 8 bytes, bodies always have page data after the lists
+    TAIL = b'\x00' * 8
+
+    def random_lists(self, count, seed=5) -> list:
+        rng = random.Random(seed)
+        lists = []
+        for _ in range(count):
+            intervals = []
+            left = rng.randrange(64)
+            for _ in range(rng.randrange(1, 6)):
+                right = left + rng.choice((0, rng.randrange(1, 256), rng.randrange(256, 1 << 16),
+                                           rng.randrange(1 << 16, 1 << 20)))
+                intervals.append([left, right])
+                left = right + 2 + rng.randrange(100)
+            lists.append(intervals)
+        return lists
+
+    def encode(self, lists) -> bytes:
+        return b''.join(MemscrimperWriter.encode_interval_list(intervals) for intervals in lists)
+
+    def test_golden(self):
+        data = self.GOLDEN + self.TAIL
+        consumed, intervals = MemscrimperSection.parse_interval_list(0, data)
+        self.assertEqual((consumed, intervals), (len(self.GOLDEN) - 4, self.GOLDEN_LISTS[0]))
+        self.assertEqual(MemscrimperSection.parse_interval_value(data[4:12]), (5, False, 10, 12))
+
+        consumed, lists = MemscrimperSection.parse_interval_lists(2, 0, data)
+        self.assertEqual(consumed, len(self.GOLDEN))
+        self.assertEqual([lists[0], lists[1]], self.GOLDEN_LISTS)
+
+        consumed, packed = MemscrimperSection.parse_interval_lists_packed(2, 0, data)
+        self.assertEqual(consumed, len(self.GOLDEN))
+        self.assertEqual(list(packed), self.GOLDEN_LISTS)
+        self.assertEqual(packed.num_intervals, 5)
+        self.assertEqual(MemscrimperSection.skip_interval_lists(2, 0, data), (len(self.GOLDEN), 5))
+
+    def test_packed_matches_parse(self):
+        lists = self.random_lists(500)
+        data = b'\x11' * 3 + self.encode(lists) + self.TAIL
+        consumed, parsed = MemscrimperSection.parse_interval_lists(len(lists), 3, data)
+        self.assertEqual([parsed[i] for i in range(len(lists))], lists)
+        self.assertEqual(MemscrimperSection.parse_interval_lists_packed(len(lists), 3, data)[0], consumed)
+        self.assertEqual(list(MemscrimperSection.parse_interval_lists_packed(len(lists), 3, data)[1]), lists)
+        self.assertEqual(MemscrimperSection.skip_interval_lists(len(lists), 3, data),
+                         (consumed, sum(len(intervals) for intervals in lists)))
+
+    def test_windowed(self):
+        lists = self.random_lists(500)
+        data = self.encode(lists) + self.TAIL
+        body = SeekableBody(Gzip, BytesIO(Gzip.compress_data(data)), span=1 << 12)
+        self.addCleanup(setattr, MemscrimperSection, 'INTERVAL_WINDOW', MemscrimperSection.INTERVAL_WINDOW)
+        # windows smaller than one interval list force a refill inside the lists
+        MemscrimperSection.INTERVAL_WINDOW = 37
+        consumed, packed = MemscrimperSection.parse_interval_lists_packed(len(lists), 0, body)
+        self.assertEqual((consumed, list(packed)), (len(data) - len(self.TAIL), lists))
+        self.assertEqual(MemscrimperSection.skip_interval_lists(len(lists), 0, body),
+                         (consumed, packed.num_intervals))
+
+    def test_short_value(self):
+        with self.assertRaises(Exception):
+            MemscrimperSection.parse_interval_value(b'\x00\x00')
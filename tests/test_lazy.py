@@ -0,0 +1,73 @@
+from memscrimper_parser.compression import Gzip, SeekableBody
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.sections import MemscrimperSection, MemscrimperDiffSection
+from .images import INNERS, SyntheticImage
+from io import BytesIO
+import tempfile
+import unittest
+
+
+class LazyLoadTest(unittest.TestCase):
+    """Memscrimper(lazy=True) locates the sections on load and decodes them on first use."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, src_filename, ref_filename, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def sections(self, ms) -> list:
+        msb = ms.msb
+        return [s for s in (msb.distinct_pages_section, msb.diff_pages_section, msb.interdedup_pages_section,
+                            msb.interdedupnointra_pages_section) if s is not None]
+
+    def test_round_trip(self):
+        for inner in INNERS:
+            for delta in (True, False):
+                for streaming in (False, True):
+                    with self.subTest(inner=inner, delta=delta, streaming=streaming):
+                        src_filename, ref_filename, _ = self.image.write(self.tmp.name, inner, delta)
+                        ms = self.open(src_filename, ref_filename, lazy=True, streaming=streaming)
+                        self.assertTrue(all(s.references_pending for s in self.sections(ms)))
+                        for pagenr in range(SyntheticImage.TARGET_PAGES):
+                            self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+                        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+
+    def test_matches_eager(self):
+        for delta in (True, False):
+            with self.subTest(delta=delta):
+                src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', delta)
+                eager = self.open(src_filename, ref_filename)
+                lazy = self.open(src_filename, ref_filename, lazy=True)
+                for a, b in zip(self.sections(eager), self.sections(lazy)):
+                    self.assertEqual((a.name, a.start, a.end), (b.name, b.start, b.end))
+                self.assertEqual(lazy.msb.page_data_base, eager.msb.page_data_base)
+                self.assertEqual(lazy.collect_page_nums(), eager.collect_page_nums())
+                self.assertEqual(lazy.changed_pages, eager.changed_pages)
+
+    def test_patch_offsets(self):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'noinner', True)
+        ms = self.open(src_filename, ref_filename, lazy=True)
+        section = ms.msb.diff_pages_section
+        offsets = list(section.locate_patches())
+        self.assertEqual(len(offsets), 8)
+        self.assertEqual(offsets[0], section.patches_list_start)
+
+        body = bytes(ms.body_bytes)
+        consumed, flat = MemscrimperDiffSection.skip_patch_records(8, section.patches_list_start, body)
+        self.assertEqual((section.patches_list_start + consumed, list(flat)), (section.end, offsets))
+
+        # a SeekableBody is walked through bounded windows
+        self.addCleanup(setattr, MemscrimperSection, 'INTERVAL_WINDOW', MemscrimperSection.INTERVAL_WINDOW)
+        MemscrimperSection.INTERVAL_WINDOW = 61
+        seekable = SeekableBody(Gzip, BytesIO(Gzip.compress_data(body)), span=1 << 12)
+        consumed, windowed = MemscrimperDiffSection.skip_patch_records(8, section.patches_list_start, seekable)
+        self.assertEqual((section.patches_list_start + consumed, list(windowed)), (section.end, offsets))
@@ -0,0 +1,53 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.pagehash import ParallelPageHasher
+from memscrimper_parser.writer import MemscrimperWriter
+from .images import SyntheticImage
+import os
+import tempfile
+import unittest
+
+
+class ParallelPageHasherTest(unittest.TestCase):
+    """The process pool classification against MemscrimperWriter.classify."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        _, cls.ref_filename, cls.raw_filename = cls.image.write(cls.tmp.name, b'gzip', True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def classifications(self, delta, vectorize):
+        serial = MemscrimperWriter(delta=delta)
+        serial.vectorize = vectorize and serial.vectorize
+        parallel = MemscrimperWriter(delta=delta)
+        parallel.vectorize = serial.vectorize
+        # shards of 7 pages split every run of page kinds
+        hasher = ParallelPageHasher(parallel, workers=2, shard_pages=7)
+        return serial, serial.classify(self.image.ref, self.image.target), \
+            parallel, hasher.classify(self.ref_filename, self.raw_filename)
+
+    def test_matches_serial(self):
+        for delta in (True, False):
+            for vectorize in (True, False):
+                with self.subTest(delta=delta, vectorize=vectorize):
+                    serial, spc, parallel, ppc = self.classifications(delta, vectorize)
+                    self.assertEqual(ppc.ref_index, spc.ref_index)
+                    self.assertEqual(ppc.source_index, spc.source_index)
+                    self.assertEqual((ppc.identity, ppc.distinct, ppc.diffs, ppc.sources),
+                                     (spc.identity, spc.distinct, spc.diffs, spc.sources))
+                    self.assertEqual(parallel.stats, serial.stats)
+                    self.assertEqual(serial.encode_body(ppc, self.image.target, b'image.ref'),
+                                     serial.encode_body(spc, self.image.target, b'image.ref'))
+
+    def test_compress_file(self):
+        out_filename = os.path.join(self.tmp.name, 'parallel.compress')
+        stats = ParallelPageHasher(MemscrimperWriter(), workers=2, shard_pages=16).compress_file(
+            self.ref_filename, self.raw_filename, out_filename, reference_name='image.ref')
+        self.assertEqual(stats['pages'], SyntheticImage.TARGET_PAGES)
+        ms = Memscrimper(src_filename=out_filename, ref_filename=self.ref_filename, load=True)
+        self.addCleanup(ms.destroy)
+        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
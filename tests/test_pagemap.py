@@ -0,0 +1,92 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.pagemap import PageMap
+from .images import SyntheticImage
+import tempfile
+import unittest
+
+
+class PageMapTest(unittest.TestCase):
+    """PageMap.build resolves overlapping claims the way read_page_num does."""
+
+    def build(self) -> PageMap:
+        # distinct first, then diff, then source, pages outside every run are reference pages
+        return PageMap.build(20, [
+            (PageMap.DISTINCT, [(2, 3, 40), (10, 10, 41)]),
+            (PageMap.DIFF, [(3, 6, 3)]),
+            (PageMap.SOURCE, [(6, 12, 0), (15, 15, 1)]),
+        ])
+
+    def test_golden(self):
+        page_map = self.build()
+        self.assertEqual(list(zip(page_map.starts, page_map.ends, page_map.kinds, page_map.values)), [
+            (2, 3, PageMap.DISTINCT, 40),
+            (4, 6, PageMap.DIFF, 4),
+            (7, 9, PageMap.SOURCE, 0),
+            (10, 10, PageMap.DISTINCT, 41),
+            (11, 12, PageMap.SOURCE, 0),
+            (15, 15, PageMap.SOURCE, 1),
+        ])
+
+    def test_resolve(self):
+        page_map = self.build()
+        expected = {0: (PageMap.REFERENCE, 0), 2: (PageMap.DISTINCT, 40), 3: (PageMap.DISTINCT, 40),
+                    4: (PageMap.DIFF, 4), 6: (PageMap.DIFF, 6), 7: (PageMap.SOURCE, 0), 10: (PageMap.DISTINCT, 41),
+                    12: (PageMap.SOURCE, 0), 13: (PageMap.REFERENCE, 13), 15: (PageMap.SOURCE, 1),
+                    19: (PageMap.REFERENCE, 19)}
+        for pagenr, result in expected.items():
+            self.assertEqual(page_map.resolve(pagenr), result, pagenr)
+            self.assertEqual(page_map.kind_of(pagenr), result[0], pagenr)
+
+    def test_runs(self):
+        page_map = self.build()
+        self.assertEqual(list(page_map.runs(1, 16)), [
+            (1, 1, PageMap.REFERENCE, 1),
+            (2, 3, PageMap.DISTINCT, 40),
+            (4, 6, PageMap.DIFF, 4),
+            (7, 9, PageMap.SOURCE, 0),
+            (10, 10, PageMap.DISTINCT, 41),
+            (11, 12, PageMap.SOURCE, 0),
+            (13, 14, PageMap.REFERENCE, 13),
+            (15, 15, PageMap.SOURCE, 1),
+            (16, 16, PageMap.REFERENCE, 16),
+        ])
+        # a run cut by the range keeps linear values in step
+        self.assertEqual(list(page_map.runs(5, 7)), [(5, 6, PageMap.DIFF, 5), (7, 7, PageMap.SOURCE, 0)])
+
+
+class BodyPageMapTest(unittest.TestCase):
+    """The page map of a written image against its sections and the writer's classification."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        src_filename, ref_filename, _ = cls.image.write(cls.tmp.name)
+        cls.ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ms.destroy()
+        cls.tmp.cleanup()
+
+    def test_matches_sections(self):
+        msb = self.ms.msb
+        sources = {}
+        for pagenr in range(SyntheticImage.TARGET_PAGES):
+            kind, value = msb.resolve_page(pagenr)
+            self.assertEqual((kind, value), msb._resolve_page_sections(pagenr), pagenr)
+            expected_kind, expected_value = self.image.expected_kind(pagenr)
+            self.assertEqual(kind, expected_kind, pagenr)
+            if kind == PageMap.SOURCE:
+                # pages with the same data share one interdedup page
+                self.assertEqual(sources.setdefault(expected_value, value), value, pagenr)
+            else:
+                self.assertEqual(value, expected_value, pagenr)
+        self.assertEqual(len(set(sources.values())), len(sources))
+
+    def test_runs_cover_image(self):
+        cur = 0
+        for first, last, kind, value in self.ms.runs():
+            self.assertEqual(first, cur)
+            cur = last + 1
+        self.assertEqual(cur, SyntheticImage.TARGET_PAGES)
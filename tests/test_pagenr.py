@@ -0,0 +1,74 @@
+from memscrimper_parser.accel import Accel, HAVE_NUMPY
+from memscrimper_parser.sections import MemscrimperSection
+from memscrimper_parser.writer import MemscrimperWriter
+import random
+import struct
+import unittest
+
+
+class PagenrListTest(unittest.TestCase):
+    """parse_pagenr_lists with and without the NumPy decoder."""
+    # 5, then deltas 0 (6), 256 (263, long form) and 2 (266), followed by unrelated bytes
+    GOLDEN = struct.pack('<I', 4) + b'\x85\x80\x00\x00\x01\x00\x82' + b'\xff\xff'
+    GOLDEN_PAGENRS = [5, 6, 263, 266]
+
+    def setUp(self):
+        self.addCleanup(setattr, Accel, 'ENABLED', Accel.ENABLED)
+        self.addCleanup(setattr, Accel, 'MIN_ITEMS', Accel.MIN_ITEMS)
+        self.addCleanup(setattr, Accel, 'MIN_SKIP_ITEMS', Accel.MIN_SKIP_ITEMS)
+
+    def modes(self):
+        """Yields once per decoder, NumPy for every list size when it is installed."""
+        Accel.disable()
+        yield 'python'
+        if HAVE_NUMPY:
+            Accel.enable()
+            Accel.MIN_ITEMS = 1
+            Accel.MIN_SKIP_ITEMS = 1
+            yield 'numpy'
+
+    def random_pagenrs(self, count, seed=4) -> list:
+        rng = random.Random(seed)
+        pagenrs = []
+        cur = -1
+        for _ in range(count):
+            cur += 1 + (rng.randrange(128) if rng.random() < 0.7 else rng.randrange(1 << 20))
+            pagenrs.append(cur)
+        return pagenrs
+
+    def test_golden(self):
+        for mode in self.modes():
+            with self.subTest(mode=mode):
+                consumed, pagenrs = MemscrimperSection.parse_pagenr_lists(0, self.GOLDEN)
+                self.assertEqual(pagenrs, self.GOLDEN_PAGENRS)
+                self.assertEqual(consumed, len(self.GOLDEN) - 2)
+                self.assertEqual(MemscrimperSection.skip_pagenr_list(0, self.GOLDEN), (consumed, 4))
+
+    def test_offset(self):
+        data = b'\x00' * 7 + self.GOLDEN
+        consumed, pagenrs = MemscrimperSection.parse_pagenr_lists(7, data)
+        self.assertEqual((consumed, pagenrs), (len(self.GOLDEN) - 2, self.GOLDEN_PAGENRS))
+
+    def test_round_trip(self):
+        pagenrs = self.random_pagenrs(5000)
+        data = MemscrimperWriter.encode_pagenr_list(pagenrs) + b'\x00' * 3
+        for mode in self.modes():
+            with self.subTest(mode=mode):
+                self.assertEqual(MemscrimperSection.parse_pagenr_lists(0, data), (len(data) - 3, pagenrs))
+                self.assertEqual(MemscrimperSection.skip_pagenr_list(0, data), (len(data) - 3, len(pagenrs)))
+
+    def test_empty(self):
+        self.assertEqual(MemscrimperSection.parse_pagenr_lists(0, b'\x00' * 4), (4, []))
+        self.assertEqual(MemscrimperSection.skip_pagenr_list(0, b'\x00' * 4), (4, 0))
+
+    def test_limit(self):
+        with self.assertRaises(Exception):
+            MemscrimperSection.parse_pagenr_lists(0, self.GOLDEN, limit=3)
+
+    @unittest.skipUnless(HAVE_NUMPY, 'numpy is not installed')
+    def test_accel_truncated(self):
+        data = MemscrimperWriter.encode_pagenr_list([0, 1000, 2000])[4:]
+        with self.assertRaises(Exception):
+            Accel.decode_pagenr_list(data[:-1], 3)
+        self.assertEqual(Accel.decode_pagenr_list(data, 3), (len(data), [0, 1000, 2000]))
+        self.assertEqual(Accel.skip_pagenr_list(data, 3), len(data))
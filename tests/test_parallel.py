@@ -0,0 +1,67 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.parallel import ParallelReconstructor
+from .images import SyntheticImage
+from unittest import mock
+import os
+import tempfile
+import unittest
+
+
+class ParallelReconstructTest(unittest.TestCase):
+    """read_to_target(workers=n) against the serial reconstruction."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, src_filename, ref_filename) -> Memscrimper:
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def reconstruct(self, ms, name, shard_pages=7) -> bytes:
+        target_filename = os.path.join(self.tmp.name, name)
+        # small shards so runs of every kind straddle them
+        with mock.patch.object(ParallelReconstructor, 'MIN_SHARD_PAGES', shard_pages):
+            ms.read_to_target(target_filename=target_filename, workers=2).close()
+        with open(target_filename, 'rb') as fileobj:
+            return fileobj.read()
+
+    def test_matches_serial(self):
+        for delta in (True, False):
+            with self.subTest(delta=delta):
+                src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', delta)
+                ms = self.open(src_filename, ref_filename)
+                serial = ms.read_to_target().getvalue()
+                self.assertEqual(self.reconstruct(ms, 'parallel_{}.raw'.format(int(delta))), serial)
+                self.assertEqual(serial, self.image.target)
+
+    def test_short_reference(self):
+        src_filename, _, _ = self.image.write(self.tmp.name, b'gzip', True)
+        short_filename = os.path.join(self.tmp.name, 'short.ref')
+        with open(short_filename, 'wb') as out:
+            out.write(self.image.ref[:10 * SyntheticImage.PAGE_SIZE])
+        ms = self.open(src_filename, short_filename)
+        with self.assertRaisesRegex(Exception, 'Short read from the reference'):
+            self.reconstruct(ms, 'short.raw')
+
+    def test_size_check(self):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', True)
+        ms = self.open(src_filename, ref_filename)
+        target_filename = os.path.join(self.tmp.name, 'partial.raw')
+        # a shard that writes nothing leaves a hole of the right size behind
+        tasks = ParallelReconstructor._tasks
+        with mock.patch.object(ParallelReconstructor, '_tasks', lambda self, t: list(tasks(self, t))[1:]):
+            with self.assertRaisesRegex(Exception, 'Reconstructed'):
+                ParallelReconstructor(ms.msb, workers=2, shard_pages=16).run(target_filename)
+
+    def test_needs_target_filename(self):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, b'gzip', True)
+        ms = self.open(src_filename, ref_filename)
+        with self.assertRaises(Exception):
+            ms.read_to_target(workers=2)
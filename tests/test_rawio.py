@@ -0,0 +1,68 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.rawio import MemscrimperRawIO
+from .images import SyntheticImage
+import hashlib
+import io
+import random
+import shutil
+import tempfile
+import unittest
+
+
+class RawIOTest(unittest.TestCase):
+    """MemscrimperRawIO and open_image against read_to_target."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        src_filename, ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True)
+        cls.target = cls.ms.read_to_target().getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ms.destroy()
+        cls.tmp.cleanup()
+
+    def test_readinto(self):
+        raw = self.ms.open_image(buffering=0)
+        self.assertIsInstance(raw, MemscrimperRawIO)
+        rng = random.Random(3)
+        for _ in range(100):
+            # unaligned starts and sizes from a few bytes to many pages
+            offset = rng.randrange(len(self.target))
+            size = rng.choice([rng.randrange(1, 64), rng.randrange(1, 4096), rng.randrange(1, 12 * 4096)])
+            self.assertEqual(raw.seek(offset), offset)
+            buf = bytearray(size)
+            n = raw.readinto(buf)
+            self.assertEqual(n, min(size, len(self.target) - offset))
+            self.assertEqual(bytes(buf[:n]), self.target[offset:offset + n])
+            self.assertEqual(raw.tell(), offset + n)
+
+    def test_seek(self):
+        raw = self.ms.open_image(buffering=0)
+        self.assertEqual(raw.seek(-10, io.SEEK_END), len(self.target) - 10)
+        self.assertEqual(raw.read(), self.target[-10:])
+        self.assertEqual(raw.read(5), b'')
+        raw.seek(4096 * 26 + 3)
+        self.assertEqual(raw.seek(100, io.SEEK_CUR), 4096 * 26 + 103)
+        self.assertEqual(raw.read(4096), self.target[4096 * 26 + 103:4096 * 27 + 103])
+        with self.assertRaises(ValueError):
+            raw.seek(-1)
+        raw.close()
+        with self.assertRaises(ValueError):
+            raw.read(1)
+        # the Memscrimper is only destroyed with closefd
+        self.assertEqual(self.ms.read_page(0), self.image.page(0))
+
+    def test_buffered(self):
+        with self.ms.open_image() as fileobj:
+            self.assertIsInstance(fileobj, io.BufferedReader)
+            self.assertEqual(hashlib.md5(fileobj.read()).digest(), hashlib.md5(self.target).digest())
+            fileobj.seek(4096 * 36 - 5)
+            self.assertEqual(fileobj.read(10), self.target[4096 * 36 - 5:4096 * 36 + 5])
+            out = io.BytesIO()
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, out, 3000)
+            self.assertEqual(out.getvalue(), self.target)
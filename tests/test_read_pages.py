@@ -0,0 +1,62 @@
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+import random
+import tempfile
+import unittest
+
+
+class ReadPagesTest(unittest.TestCase):
+    """read_pages and read_range against the image, across run boundaries and backends."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def backends(self):
+        for name, kwargs in (('mmap', {}), ('file', {'use_mmap': False, 'load_ref_data': False}),
+                             ('streaming', {'streaming': True})):
+            ms = Memscrimper(src_filename=self.src_filename, ref_filename=self.ref_filename, load=True, **kwargs)
+            self.addCleanup(ms.destroy)
+            yield name, ms
+
+    def test_read_range(self):
+        for name, ms in self.backends():
+            # 14-29 crosses reference, distinct, repeated distinct and diff runs
+            for first, count in ((0, 80), (14, 16), (25, 3), (33, 5), (70, 20), (80, 4)):
+                with self.subTest(backend=name, first=first, count=count):
+                    views = ms.read_range(first, count)
+                    expected = [self.image.page(p) for p in range(first, min(first + count, 80))]
+                    self.assertEqual([bytes(v) for v in views], expected)
+
+    def test_read_pages(self):
+        rng = random.Random(5)
+        requests = [
+            list(range(80)),
+            [26, 27, 28, 5, 6, 7, 40, 41],
+            [36, 44, 45, 36, 72, 72, 0],
+            [33, 26, 48, 16, 24, 25, 79],
+            [rng.randrange(80) for _ in range(60)],
+            [],
+        ]
+        for name, ms in self.backends():
+            for page_nums in requests:
+                with self.subTest(backend=name, page_nums=page_nums[:8]):
+                    views = ms.read_pages(page_nums)
+                    self.assertEqual([bytes(v) for v in views], [self.image.page(p) for p in page_nums])
+
+    def test_caller_buffer(self):
+        ms = next(self.backends())[1]
+        out = bytearray(6 * 4096)
+        views = ms.read_pages([30, 31, 32, 64, 72, 2], out=out)
+        self.assertEqual(bytes(out), b''.join(self.image.page(p) for p in (30, 31, 32, 64, 72, 2)))
+        self.assertTrue(all(v.obj is out for v in views))
+        ms.read_range(20, 6, out=out)
+        self.assertEqual(bytes(out), self.image.target[20 * 4096:26 * 4096])
+        with self.assertRaises(Exception):
+            ms.read_pages(range(7), out=out)
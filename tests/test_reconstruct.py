@@ -0,0 +1,52 @@
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+import os
+import tempfile
+import unittest
+
+
+class ReconstructTest(unittest.TestCase):
+    """read_to_target copies runs in blocks through every reference backend."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        # the first 10 pages of the reference, every later reference and diff run is cut short
+        cls.short_filename = os.path.join(cls.tmp.name, 'short.ref')
+        with open(cls.short_filename, 'wb') as out:
+            out.write(cls.image.ref[:10 * SyntheticImage.PAGE_SIZE])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, ref_filename, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=self.src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def backends(self, ref_filename):
+        yield 'mmap', self.open(ref_filename)
+        yield 'file', self.open(ref_filename, use_mmap=False, load_ref_data=False)
+        yield 'bytes', self.open(ref_filename, use_mmap=False, load_ref_data=True)
+
+    def test_round_trip(self):
+        for backend, ms in self.backends(self.ref_filename):
+            with self.subTest(backend=backend):
+                self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+                target_filename = os.path.join(self.tmp.name, 'target_{}.raw'.format(backend))
+                ms.read_to_target(target_filename=target_filename).close()
+                with open(target_filename, 'rb') as fileobj:
+                    self.assertEqual(fileobj.read(), self.image.target)
+
+    def test_short_reference(self):
+        for backend, ms in self.backends(self.short_filename):
+            with self.subTest(backend=backend):
+                with self.assertRaisesRegex(Exception, 'Unable to read from page number'):
+                    ms.read_to_target()
+                target_filename = os.path.join(self.tmp.name, 'short_{}.raw'.format(backend))
+                with open(target_filename, 'wb') as fileobj:
+                    with self.assertRaisesRegex(Exception, 'short read from the reference'):
+                        ms.read_to_target(target_fileobj=fileobj)
@@ -0,0 +1,58 @@
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+import mmap
+import pickle
+import tempfile
+import unittest
+
+
+class MappedReferenceTest(unittest.TestCase):
+    """The reference is mapped by default and stays usable when the dump is pickled."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=self.src_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def check_pages(self, ms):
+        for pagenr in range(SyntheticImage.TARGET_PAGES):
+            self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr), pagenr)
+
+    def test_mapped(self):
+        ms = self.open(ref_filename=self.ref_filename)
+        self.assertIsInstance(ms.msb.ref_fileobj, mmap.mmap)
+        self.check_pages(ms)
+
+    def test_pickle_keeps_live_body(self):
+        ms = self.open(ref_filename=self.ref_filename)
+        state = pickle.loads(pickle.dumps(ms.msb))
+        self.assertIsNone(state.ref_fileobj)
+        self.assertIsInstance(ms.msb.ref_fileobj, mmap.mmap)
+        ms.reset_pages()
+        self.check_pages(ms)
+
+        copy = pickle.loads(pickle.dumps(ms))
+        self.assertIsNone(copy.ref_fileobj)
+        self.assertIsInstance(ms.ref_fileobj, mmap.mmap)
+        ms.reset_pages()
+        self.check_pages(ms)
+        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+
+    def test_associate_later(self):
+        # a reference attached after the open takes the same path as one given to the constructor
+        for use_mmap in (True, False):
+            with self.subTest(use_mmap=use_mmap):
+                ms = self.open(use_mmap=use_mmap)
+                ms.associate_reference_data(self.ref_filename, load_from_file=False)
+                self.assertEqual(isinstance(ms.msb.ref_fileobj, mmap.mmap), use_mmap)
+                self.check_pages(ms)
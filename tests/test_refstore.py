@@ -0,0 +1,81 @@
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.refstore import ReferenceStore
+from .images import SyntheticImage
+import os
+import pickle
+import tempfile
+import unittest
+
+
+class ReferenceStoreTest(unittest.TestCase):
+    """Dumps on the same base image share one mapping and page cache through a ReferenceStore."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.other_filename, _, _ = cls.image.write(cls.tmp.name, b'bzip2', False)
+        # another path to the same file shares its entry
+        cls.link_filename = os.path.join(cls.tmp.name, 'link.ref')
+        os.symlink(cls.ref_filename, cls.link_filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, store, src_filename, ref_filename) -> Memscrimper:
+        return Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, reference_store=store)
+
+    def test_shared(self):
+        store = ReferenceStore()
+        first = self.open(store, self.src_filename, self.ref_filename)
+        second = self.open(store, self.other_filename, self.link_filename)
+        self.assertEqual(len(store), 1)
+        self.assertIn(self.ref_filename, store)
+        entry = first.ref_entry
+        self.assertIs(second.ref_entry, entry)
+        self.assertEqual(entry.refs, 2)
+        self.assertIs(first.msb.ref_fileobj, second.msb.ref_fileobj)
+        self.assertIs(first.msb.page_data, second.msb.page_data)
+
+        # pages read through one dump are hits for the other
+        self.assertEqual(first.read_page(0), self.image.page(0))
+        hits = entry.page_data.stats()['hits']
+        self.assertEqual(second.read_page(0), self.image.page(0))
+        self.assertGreater(entry.page_data.stats()['hits'], hits)
+
+        # the mapping stays open until the last user is destroyed
+        first.destroy()
+        self.assertEqual(entry.refs, 1)
+        self.assertIsNotNone(entry.data)
+        second.reset_pages()
+        self.assertEqual(second.read_to_target().getvalue(), self.image.target)
+        second.destroy()
+        self.assertIsNone(entry.data)
+        self.assertEqual(len(store), 0)
+        self.assertNotIn(self.ref_filename, store)
+
+    def test_reacquire(self):
+        store = ReferenceStore()
+        ms = self.open(store, self.src_filename, self.ref_filename)
+        entry = ms.ref_entry
+        ms.destroy()
+        ms = self.open(store, self.src_filename, self.ref_filename)
+        self.addCleanup(ms.destroy)
+        self.assertIsNot(ms.ref_entry, entry)
+        self.assertEqual(ms.read_page(48), self.image.page(48))
+
+    def test_pickle_keeps_entry(self):
+        store = ReferenceStore()
+        ms = self.open(store, self.src_filename, self.ref_filename)
+        self.addCleanup(ms.destroy)
+        copy = pickle.loads(pickle.dumps(ms.msb))
+        self.assertIsNone(copy.ref_entry)
+        self.assertIsNot(copy.page_data, ms.msb.page_data)
+        # the live body stays attached to the store, destroy() leaves the shared mapping alone
+        self.assertIs(ms.msb.ref_entry, ms.ref_entry)
+        self.assertIs(ms.msb.page_data, ms.ref_entry.page_data)
+        ms.msb.destroy()
+        self.assertFalse(ms.ref_entry.data.closed)
+        self.assertEqual(ms.read_page(48), self.image.page(48))
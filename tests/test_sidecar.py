@@ -0,0 +1,153 @@
+from memscrimper_parser.compression import DeferredBody
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.pagemap import PageMap
+from memscrimper_parser.sidecar import SidecarIndex
+from .images import INNERS, SyntheticImage
+from io import BytesIO
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+
+class SidecarIndexTest(unittest.TestCase):
+    """Reopens served from the .msidx sidecar match a full parse and skip the body."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, src_filename, ref_filename, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def write(self, inner=b'gzip', delta=True) -> (str, str):
+        src_filename, ref_filename, _ = self.image.write(self.tmp.name, inner, delta)
+        index_filename = SidecarIndex.sidecar_filename(src_filename)
+        if os.path.exists(index_filename):
+            os.unlink(index_filename)
+        return src_filename, ref_filename
+
+    def test_reopen(self):
+        for inner in INNERS:
+            for delta in (True, False):
+                with self.subTest(inner=inner, delta=delta):
+                    src_filename, ref_filename = self.write(inner, delta)
+                    first = self.open(src_filename, ref_filename, use_index=True)
+                    self.assertFalse(first.index_loaded)
+                    self.assertTrue(os.path.exists(SidecarIndex.sidecar_filename(src_filename)))
+
+                    ms = self.open(src_filename, ref_filename, use_index=True)
+                    self.assertTrue(ms.index_loaded)
+                    self.assertIsInstance(ms.body_bytes, DeferredBody)
+                    for pagenr in range(SyntheticImage.TARGET_PAGES):
+                        self.assertEqual(ms.msb.resolve_page(pagenr), first.msb.resolve_page(pagenr))
+                        self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+                    self.assertEqual(ms.changed_pages, first.changed_pages)
+
+    def test_body_deferred(self):
+        src_filename, ref_filename = self.write()
+        self.open(src_filename, ref_filename, use_index=True)
+        ms = self.open(src_filename, ref_filename, use_index=True)
+        # reference and distinct pages never touch the body
+        for pagenr in range(SyntheticImage.TARGET_PAGES):
+            if self.image.expected_kind(pagenr)[0] in (PageMap.REFERENCE, PageMap.DISTINCT):
+                self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+        self.assertIsNone(ms.body_bytes.body)
+        self.assertEqual(ms.read_page(36), self.image.page(36))
+        self.assertIsNotNone(ms.body_bytes.body)
+
+    def test_introspection(self):
+        src_filename, ref_filename = self.write()
+        parsed = self.open(src_filename, ref_filename)
+        self.open(src_filename, ref_filename, use_index=True)
+        ms = self.open(src_filename, ref_filename, use_index=True)
+        self.assertTrue(ms.index_loaded)
+        self.assertEqual(ms.collect_page_nums(), parsed.collect_page_nums())
+        for pagenr in (0, 16, 26, 36):
+            self.assertEqual(list(ms.enumerate_page_num(pagenr)), list(parsed.enumerate_page_num(pagenr)))
+
+    def test_body_members(self):
+        src_filename, ref_filename = self.write()
+        body = bytes(self.open(src_filename, ref_filename).body_bytes)
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                self.open(src_filename, ref_filename, use_index=True)
+                ms = self.open(src_filename, ref_filename, use_index=True, streaming=streaming)
+                self.assertIsInstance(ms.body_bytes, DeferredBody)
+                self.assertTrue(ms.body_bytes.random_access)
+                self.assertEqual(b''.join(data for _, data in ms.body_bytes.iter_pieces()), body)
+
+    def test_pickle_keeps_index(self):
+        src_filename, ref_filename = self.write()
+        self.open(src_filename, ref_filename, use_index=True)
+        ms = self.open(src_filename, ref_filename, use_index=True)
+        index = ms.msb.index
+        copy = pickle.loads(pickle.dumps(ms.msb))
+        self.assertIsNone(copy.index)
+        self.assertEqual(list(copy.runs()), list(ms.msb.runs()))
+        # the copy reopens the source for the body, interdedup pages need no reference
+        self.assertEqual(copy.read_page_num(36), self.image.page(36))
+        copy.body_bytes.fileobj.close()
+        # the running instance still reads through the mapped index
+        self.assertIs(ms.msb.index, index)
+        self.assertIsInstance(ms.msb.page_map.starts, memoryview)
+        for pagenr in range(SyntheticImage.TARGET_PAGES):
+            self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+
+    def test_close(self):
+        src_filename, ref_filename = self.write()
+        self.open(src_filename, ref_filename, use_index=True)
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, use_index=True)
+        mapped = ms.msb.index._mmap
+        self.assertEqual(ms.read_page(36), self.image.page(36))
+        ms.destroy()
+        self.assertIsNone(ms.msb.index)
+        self.assertTrue(mapped.closed)
+
+    def test_stale(self):
+        src_filename, ref_filename = self.write()
+        self.open(src_filename, ref_filename, use_index=True)
+        st = os.stat(src_filename)
+        os.utime(src_filename, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        ms = self.open(src_filename, ref_filename, use_index=True)
+        self.assertFalse(ms.index_loaded)
+        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+        # the rewritten index serves the next open
+        self.assertTrue(self.open(src_filename, ref_filename, use_index=True).index_loaded)
+
+    def test_moved_sidecar(self):
+        src_filename, ref_filename = self.write()
+        self.open(src_filename, ref_filename, use_index=True)
+        copy_filename = os.path.join(self.tmp.name, 'copy.compress')
+        shutil.copyfile(src_filename, copy_filename)
+        shutil.copyfile(SidecarIndex.sidecar_filename(src_filename), SidecarIndex.sidecar_filename(copy_filename))
+        # same bytes, another file: the identity in the fingerprint does not match
+        self.assertFalse(self.open(copy_filename, ref_filename, use_index=True).index_loaded)
+
+    def test_garbage(self):
+        src_filename, ref_filename = self.write()
+        with open(SidecarIndex.sidecar_filename(src_filename), 'wb') as out:
+            out.write(b'\x00' * 17)
+        ms = self.open(src_filename, ref_filename, use_index=True)
+        self.assertFalse(ms.index_loaded)
+        self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+
+    def test_fileobj_fingerprint(self):
+        src_filename, _ = self.write()
+        with open(src_filename, 'rb') as fileobj:
+            data = fileobj.read()
+        changed = bytearray(data)
+        changed[len(data) // 3] ^= 1
+        # without a file descriptor every byte counts
+        self.assertNotEqual(SidecarIndex.fingerprint_fileobj(BytesIO(data)),
+                            SidecarIndex.fingerprint_fileobj(BytesIO(bytes(changed))))
+        self.assertEqual(SidecarIndex.fingerprint_fileobj(BytesIO(data)),
+                         SidecarIndex.fingerprint_fileobj(BytesIO(data)))
@@ -0,0 +1,84 @@
+from memscrimper_parser.compression import Bzip2, Gzip, NoInnerBase, SeekableBody
+from memscrimper_parser.interface import Memscrimper
+from .images import INNERS, SyntheticImage
+from io import BytesIO
+import random
+import tempfile
+import unittest
+
+
+class SeekableBodyTest(unittest.TestCase):
+    """Checkpointed reads against the fully inflated body."""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(1)
+        # compressible but not trivially so, about 300 KiB
+        cls.data = b''.join(bytes([rng.randrange(16)]) * rng.randrange(1, 64) for _ in range(10000))
+
+    def check_reads(self, body):
+        rng = random.Random(2)
+        self.assertEqual(len(body), len(self.data))
+        for _ in range(50):
+            offset = rng.randrange(len(self.data))
+            size = rng.randrange(1, 3 * body.span)
+            self.assertEqual(body.read_at(offset, size), self.data[offset:offset + size])
+        body.seek(100)
+        self.assertEqual(body.read(10), self.data[100:110])
+        self.assertEqual(body.tell(), 110)
+
+    def test_gzip(self):
+        body = SeekableBody(Gzip, BytesIO(Gzip.compress_data(self.data)), span=1 << 12)
+        self.assertTrue(body.random_access)
+        self.assertGreater(body.num_states, 1)
+        self.check_reads(body)
+
+    def test_thinned_checkpoints(self):
+        body = SeekableBody(Gzip, BytesIO(Gzip.compress_data(self.data)), span=1 << 12, max_checkpoints=4)
+        self.assertLessEqual(body.num_states, 4)
+        self.assertGreater(body.checkpoint_span, body.span)
+        self.assertTrue(all(c[0] % body.checkpoint_span == 0 for c in body.checkpoints))
+        self.check_reads(body)
+
+    def test_single_stream(self):
+        with self.assertLogs('memscrimper_parser.compression', level='WARNING'):
+            body = SeekableBody(Bzip2, BytesIO(Bzip2.compress_data(self.data)), span=1 << 12)
+        self.assertFalse(body.random_access)
+        self.check_reads(body)
+
+    def test_stream_starts(self):
+        # every member of a multi-member body is a checkpoint
+        half = len(self.data) // 2
+        data = Bzip2.compress_data(self.data[:half]) + Bzip2.compress_data(self.data[half:])
+        body = SeekableBody(Bzip2, BytesIO(data), span=1 << 12)
+        self.assertEqual(body.checkpoint_offsets, [0, half])
+        self.check_reads(body)
+
+    def test_stored(self):
+        body = SeekableBody(NoInnerBase, BytesIO(b'\x00' * 7 + self.data), offset=7, span=1 << 12)
+        self.assertTrue(body.direct and body.random_access)
+        self.check_reads(body)
+
+
+class StreamingLoadTest(unittest.TestCase):
+    """Memscrimper(streaming=True) reads pages through a SeekableBody."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_round_trip(self):
+        for inner in INNERS:
+            with self.subTest(inner=inner):
+                src_filename, ref_filename, _ = self.image.write(self.tmp.name, inner, True)
+                ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, streaming=True)
+                self.addCleanup(ms.destroy)
+                self.assertIsInstance(ms.body_bytes, SeekableBody)
+                for pagenr in reversed(range(SyntheticImage.TARGET_PAGES)):
+                    self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+                self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
@@ -0,0 +1,70 @@
+from memscrimper_parser.interface import Memscrimper
+from .images import SyntheticImage
+import random
+import tempfile
+import unittest
+
+
+class PageViewTest(unittest.TestCase):
+    """page_view, iter_views and read_view against the image."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def backends(self):
+        for name, kwargs in (('mmap', {}), ('file', {'use_mmap': False, 'load_ref_data': False}),
+                             ('streaming', {'streaming': True})):
+            ms = Memscrimper(src_filename=self.src_filename, ref_filename=self.ref_filename, load=True, **kwargs)
+            self.addCleanup(ms.destroy)
+            yield name, ms
+
+    def test_page_view(self):
+        for name, ms in self.backends():
+            with self.subTest(backend=name):
+                for pagenr in range(SyntheticImage.TARGET_PAGES):
+                    self.assertEqual(bytes(ms.page_view(pagenr)), self.image.page(pagenr), pagenr)
+
+    def test_zero_copy(self):
+        ms = next(self.backends())[1]
+        # reference pages view the mapping, interdedup pages the decompressed body
+        self.assertIs(ms.page_view(48).obj, ms.msb.ref_fileobj)
+        self.assertIs(ms.page_view(72).obj, ms.msb.ref_fileobj)
+        self.assertIs(ms.page_view(36).obj, ms.body_bytes)
+        self.assertIsNot(ms.page_view(26).obj, ms.msb.ref_fileobj)
+        view = ms.read_view(48 * 4096 + 10, 8 * 4096)
+        self.assertIs(view.obj, ms.msb.ref_fileobj)
+        self.assertEqual(bytes(view), self.image.target[48 * 4096 + 10:56 * 4096 + 10])
+
+    def test_iter_views(self):
+        target = self.image.target
+        rng = random.Random(6)
+        ranges = [(0, len(target)), (15 * 4096 + 100, 12 * 4096), (25 * 4096 - 1, 2), (26 * 4096 + 5, 4096),
+                  (36 * 4096 + 4000, 200), (len(target) - 10, 100)]
+        ranges += [(rng.randrange(len(target)), rng.randrange(1, 20 * 4096)) for _ in range(30)]
+        for name, ms in self.backends():
+            for address, length in ranges:
+                with self.subTest(backend=name, address=address, length=length):
+                    expected = target[address:address + length]
+                    pieces = list(ms.iter_views(address, length))
+                    pos = address
+                    for piece_address, view in pieces:
+                        self.assertEqual(piece_address, pos)
+                        pos += len(view)
+                    self.assertEqual(b''.join(view for _, view in pieces), expected)
+                    self.assertEqual(bytes(ms.read_view(address, length)), expected)
+
+    def test_run_pieces(self):
+        ms = next(self.backends())[1]
+        # a reference run is one piece, the repeated distinct pages one per page, a diff run one copy
+        pieces = list(ms.iter_views(10 * 4096, 24 * 4096))
+        self.assertEqual([(a // 4096, len(v) // 4096) for a, v in pieces],
+                         [(10, 6)] + [(p, 1) for p in range(16, 26)] + [(26, 8)])
+        self.assertEqual(list(ms.iter_views(len(self.image.target), 10)), [])
+        self.assertEqual(list(ms.iter_views(-1, 10)), [])
@@ -0,0 +1,261 @@
+# imported before the stubs are installed, modules first imported under them would be dropped with them
+from memscrimper_parser import header, interface, refstore, volatility
+from memscrimper_parser.pagemap import PageMap
+from .images import SyntheticImage
+from unittest import mock
+import importlib.util
+import os
+import pathlib
+import sys
+import tempfile
+import types
+import unittest
+
+
+class StubExceptions(object):
+
+    class VolatilityException(Exception):
+        pass
+
+    class LayerException(VolatilityException):
+        def __init__(self, layer_name, *args):
+            super().__init__(layer_name, *args)
+            self.layer_name = layer_name
+
+    class InvalidAddressException(LayerException):
+        def __init__(self, layer_name, invalid_address, *args):
+            super().__init__(layer_name, invalid_address, *args)
+            self.invalid_address = invalid_address
+
+
+class StubDataLayerInterface(object):
+    """The parts of volatility3's DataLayerInterface the layer relies on."""
+
+    def __init__(self, context, config_path, name, metadata=None):
+        self._context = context
+        self._name = name
+        prefix = config_path + '.'
+        self.config = {k[len(prefix):]: v for k, v in context.config.items() if k.startswith(prefix)}
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def context(self):
+        return self._context
+
+    @property
+    def dependencies(self) -> list:
+        # data layers never define other layers
+        return []
+
+
+class StubFileLayer(StubDataLayerInterface):
+
+    def __init__(self, context, config_path, name, metadata=None):
+        super().__init__(context, config_path, name, metadata)
+        self.location = self.config['location']
+
+    def read(self, offset, length, pad=False) -> bytes:
+        with open(volatility.location_to_path(self.location), 'rb') as fileobj:
+            fileobj.seek(offset)
+            data = fileobj.read(length)
+        if len(data) < length:
+            raise StubExceptions.InvalidAddressException(self.name, offset + len(data))
+        return data
+
+
+class StubResourceAccessor(object):
+
+    def open(self, location, mode='rb'):
+        return open(volatility.location_to_path(location), mode)
+
+
+class StubRequirement(object):
+
+    def __init__(self, name, optional=False, **kwargs):
+        self.name = name
+        self.optional = optional
+
+
+class StubLayers(dict):
+
+    def add_layer(self, layer) -> None:
+        self[layer.name] = layer
+
+    def free_layer_name(self, prefix) -> str:
+        count = 1
+        while '{}{}'.format(prefix, count) in self:
+            count += 1
+        return '{}{}'.format(prefix, count)
+
+
+class StubContext(object):
+
+    def __init__(self):
+        self.config = {}
+        self.layers = StubLayers()
+
+
+class StubVolatility(object):
+    """Minimal volatility3.framework modules for importing memscrimper_parser.volatility without volatility3."""
+
+    @classmethod
+    def modules(cls) -> dict:
+        names = ['volatility3', 'volatility3.framework', 'volatility3.framework.configuration',
+                 'volatility3.framework.configuration.requirements', 'volatility3.framework.layers',
+                 'volatility3.framework.layers.physical', 'volatility3.framework.layers.resources']
+        modules = {name: types.ModuleType(name) for name in names}
+        for name in names[1:]:
+            parent, _, child = name.rpartition('.')
+            setattr(modules[parent], child, modules[name])
+        framework = modules['volatility3.framework']
+        framework.exceptions = StubExceptions
+        framework.interfaces = types.SimpleNamespace(
+            layers=types.SimpleNamespace(DataLayerInterface=StubDataLayerInterface),
+            automagic=types.SimpleNamespace(StackerLayerInterface=object),
+            configuration=types.SimpleNamespace(path_join=lambda *parts: '.'.join(parts)))
+        reqs = modules['volatility3.framework.configuration.requirements']
+        reqs.StringRequirement = reqs.URIRequirement = reqs.BooleanRequirement = StubRequirement
+        modules['volatility3.framework.layers.physical'].FileLayer = StubFileLayer
+        modules['volatility3.framework.layers.resources'].ResourceAccessor = StubResourceAccessor
+        return modules
+
+    @classmethod
+    def load(cls):
+        """memscrimper_parser.volatility executed against the stubs, as a private module."""
+        spec = importlib.util.spec_from_file_location('memscrimper_parser._volatility_stubbed', volatility.__file__)
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(sys.modules, cls.modules()):
+            spec.loader.exec_module(module)
+        return module
+
+
+class VolatilityLayerTest(unittest.TestCase):
+    """MemscrimperLayer and MemscrimperStacker against stub Volatility interfaces."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+        cls.src_filename, cls.ref_filename, _ = cls.image.write(cls.tmp.name, b'gzip', True)
+        cls.vol = StubVolatility.load()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def file_layer(self, context, filename, name='base') -> StubFileLayer:
+        context.config['{}.location'.format(name)] = pathlib.Path(filename).as_uri()
+        layer = StubFileLayer(context, name, name)
+        context.layers.add_layer(layer)
+        return layer
+
+    def stack(self, context=None, filename=None):
+        context = context or StubContext()
+        self.file_layer(context, filename or self.src_filename)
+        layer = self.vol.MemscrimperStacker.stack(context, 'base')
+        if layer is not None:
+            self.addCleanup(layer.destroy)
+        return layer
+
+    def test_physical_layer(self):
+        self.assertTrue(self.vol.HAVE_VOLATILITY)
+        layer = self.stack()
+        self.assertIsInstance(layer, StubDataLayerInterface)
+        self.assertEqual(layer.dependencies, [])
+        self.assertFalse(hasattr(layer, 'mapping'))
+        self.assertEqual(layer.location, pathlib.Path(self.src_filename).as_uri())
+        self.assertEqual(layer.config['location'], layer.location)
+
+    def test_read(self):
+        layer = self.stack()
+        target = self.image.target
+        self.assertEqual((layer.minimum_address, layer.maximum_address), (0, len(target) - 1))
+        self.assertEqual(layer.read(0, len(target)), target)
+        self.assertEqual(layer.read(4096 * 25 + 7, 3 * 4096), target[4096 * 25 + 7:4096 * 28 + 7])
+        self.assertEqual(layer.read(len(target) - 10, 20, pad=True), target[-10:] + bytes(10))
+        self.assertEqual(layer.read(len(target) + 5, 4, pad=True), bytes(4))
+        with self.assertRaises(StubExceptions.InvalidAddressException):
+            layer.read(len(target) - 10, 20)
+        self.assertTrue(layer.is_valid(0, len(target)))
+        self.assertFalse(layer.is_valid(1, len(target)))
+        with self.assertRaises(StubExceptions.LayerException):
+            layer.write(0, b'\x00')
+
+    def test_runs(self):
+        layer = self.stack()
+        runs = list(layer.runs())
+        self.assertEqual(sum(length for _, length, _ in runs), len(self.image.target))
+        self.assertEqual(runs[0], (0, 16 * 4096, PageMap.REFERENCE))
+        self.assertEqual(list(layer.runs(26 * 4096, 4096)), [(26 * 4096, 4096, PageMap.DIFF)])
+
+    def test_reference_next_to_dump(self):
+        # the recorded name is relative and the working directory is elsewhere
+        self.assertFalse(os.path.exists(os.path.join(os.getcwd(), 'image.ref')))
+        layer = self.stack()
+        self.assertEqual(os.path.realpath(layer.ms.ref_filename), os.path.realpath(self.ref_filename))
+
+    def test_reference_location(self):
+        with tempfile.TemporaryDirectory() as other:
+            src_filename = os.path.join(other, 'moved.compress')
+            with open(self.src_filename, 'rb') as src, open(src_filename, 'wb') as out:
+                out.write(src.read())
+            context = StubContext()
+            self.assertIsNone(self.stack(context, src_filename))
+
+            context = StubContext()
+            context.config[volatility.REFERENCE_CONFIG] = pathlib.Path(self.ref_filename).as_uri()
+            layer = self.stack(context, src_filename)
+            self.assertEqual(layer.read(0, len(self.image.target)), self.image.target)
+            layer.destroy()
+
+    def test_missing_reference(self):
+        with tempfile.TemporaryDirectory() as other:
+            src_filename = os.path.join(other, 'moved.compress')
+            with open(self.src_filename, 'rb') as src, open(src_filename, 'wb') as out:
+                out.write(src.read())
+            context = StubContext()
+            context.config['layer.location'] = pathlib.Path(src_filename).as_uri()
+            with self.assertRaises(StubExceptions.LayerException):
+                self.vol.MemscrimperLayer(context, 'layer', 'layer')
+
+    def test_stacker_ignores(self):
+        self.assertIsNone(self.stack(filename=os.path.join(self.tmp.name, 'image.raw')))
+        context = StubContext()
+        context.layers.add_layer(StubDataLayerInterface(context, 'other', 'base'))
+        self.assertIsNone(self.vol.MemscrimperStacker.stack(context, 'base'))
+
+    def test_reopen(self):
+        layer = self.stack()
+        state = layer.__getstate__()
+        self.assertIsNone(state['_ms'])
+        self.assertIsNone(state['_image'])
+        copy = layer.__class__.__new__(layer.__class__)
+        copy.__dict__.update(state)
+        self.addCleanup(copy.destroy)
+        self.assertEqual(copy.read(4096 * 36, 4096), self.image.page(36))
+
+
+@unittest.skipUnless(volatility.HAVE_VOLATILITY, 'volatility3 is not installed')
+class RealVolatilityTest(unittest.TestCase):
+    """The layer stacked by the installed volatility3 on its own FileLayer."""
+
+    def test_stack(self):
+        from volatility3.framework import contexts
+        from volatility3.framework import interfaces as vol_interfaces
+        from volatility3.framework.layers import physical
+        with tempfile.TemporaryDirectory() as tmp:
+            image = SyntheticImage()
+            src_filename, _, _ = image.write(tmp, b'zip7', True)
+            context = contexts.Context()
+            context.config['base.location'] = pathlib.Path(src_filename).as_uri()
+            context.layers.add_layer(physical.FileLayer(context, 'base', 'base'))
+            layer = volatility.MemscrimperStacker.stack(context, 'base')
+            self.assertIsNotNone(layer)
+            context.layers.add_layer(layer)
+            self.assertIsInstance(layer, vol_interfaces.layers.DataLayerInterface)
+            self.assertEqual(layer.dependencies, [])
+            self.assertEqual(layer.read(0, len(image.target)), image.target)
+            layer.destroy()
@@ -0,0 +1,129 @@
+from memscrimper_parser.compression import NoInnerBase
+from memscrimper_parser.header import MemscrimperHeader
+from memscrimper_parser.interface import Memscrimper
+from memscrimper_parser.util import Util
+from memscrimper_parser.writer import MemscrimperWriter
+from .images import INNERS, SyntheticImage
+import os
+import struct
+import tempfile
+import unittest
+
+
+class WriterRoundTripTest(unittest.TestCase):
+    """MemscrimperWriter output read back by Memscrimper for every inner codec."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.image = SyntheticImage()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, src_filename, ref_filename, **kwargs) -> Memscrimper:
+        ms = Memscrimper(src_filename=src_filename, ref_filename=ref_filename, load=True, **kwargs)
+        self.addCleanup(ms.destroy)
+        return ms
+
+    def test_round_trip(self):
+        for inner in INNERS:
+            for delta in (True, False):
+                with self.subTest(inner=inner, delta=delta):
+                    src_filename, ref_filename, _ = self.image.write(self.tmp.name, inner, delta)
+                    ms = self.open(src_filename, ref_filename)
+                    self.assertEqual(ms.method, MemscrimperWriter(inner=inner, delta=delta).method)
+                    self.assertEqual(ms.uncompressed_size, len(self.image.target))
+                    self.assertEqual(ms.reference, b'image.ref')
+                    self.assertEqual(ms.read_to_target().getvalue(), self.image.target)
+                    for pagenr in range(SyntheticImage.TARGET_PAGES):
+                        self.assertEqual(ms.read_page(pagenr), self.image.page(pagenr))
+                        self.assertEqual(ms.msb.resolve_page(pagenr)[0], self.image.expected_kind(pagenr, delta)[0])
+
+    def test_stats(self):
+        writer = MemscrimperWriter()
+        writer.classify(self.image.ref, self.image.target)
+        self.assertEqual(writer.stats, {'pages': 80, 'identity': 32, 'distinct': 14, 'diff': 8,
+                                        'interdedup': 26, 'interdedup_unique': 18})
+        writer = MemscrimperWriter(delta=False)
+        writer.classify(self.image.ref, self.image.target)
+        self.assertEqual(writer.stats['diff'], 0)
+        self.assertEqual(writer.stats['interdedup'], 34)
+
+    def test_compress_matches_file(self):
+        src_filename, ref_filename, raw_filename = self.image.write(self.tmp.name, b'gzip', True)
+        writer = MemscrimperWriter(inner=b'noinner')
+        data = writer.compress(self.image.ref, self.image.target, 'image.ref')
+        out_filename = os.path.join(self.tmp.name, 'compress.compress')
+        writer.compress_file(ref_filename, raw_filename, out_filename, reference_name='image.ref')
+        with open(out_filename, 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), data)
+
+        # noinner stores the body as is, right after the header
+        header = MemscrimperHeader.pack_header(writer.method, 1, 0, SyntheticImage.PAGE_SIZE, len(self.image.target))
+        body = writer.build_body(self.image.ref, self.image.target, b'image.ref')
+        self.assertEqual(data, header + body)
+
+    def test_streamed_body(self):
+        writer = MemscrimperWriter()
+        pc = writer.classify(self.image.ref, self.image.target)
+        body = writer.encode_body(pc, self.image.target, b'image.ref')
+        for inner in INNERS:
+            with self.subTest(inner=inner):
+                writer = MemscrimperWriter(inner=inner)
+                writer.WRITE_BUFFER = 1000
+                data = writer.compress(self.image.ref, self.image.target, 'image.ref', pc=pc)
+                compression_cls = MemscrimperHeader.SUPPORTED_COMPRESSION_CLS[inner]
+                offset = len(MemscrimperHeader.pack_header(writer.method, 1, 0, 4096, 0))
+                self.assertEqual(compression_cls.decompress_data(data[offset:]), body)
+
+    def test_size_checks(self):
+        writer = MemscrimperWriter()
+        with self.assertRaises(Exception):
+            writer.classify(self.image.ref, self.image.target[:-1])
+        with self.assertRaises(Exception):
+            MemscrimperWriter(inner=b'rar')
+
+
+class WriterEncodingTest(unittest.TestCase):
+    """Golden encodings, the inverses of the section decoders."""
+
+    def test_pagenr_list(self):
+        self.assertEqual(MemscrimperWriter.encode_pagenr_list([5, 6, 263, 266]),
+                         struct.pack('<I', 4) + b'\x85\x80\x00\x00\x01\x00\x82')
+        self.assertEqual(MemscrimperWriter.encode_pagenr_list([]), b'\x00\x00\x00\x00')
+
+    def test_interval_list(self):
+        intervals = [[3, 3], [10, 12], [300, 600], [70000, 140000]]
+        self.assertEqual(MemscrimperWriter.encode_interval_list(intervals),
+                         struct.pack('<I', 3) +
+                         struct.pack('<IB', 10 | 1 << 29, 2) +
+                         struct.pack('<IH', 300 | 2 << 29, 300) +
+                         struct.pack('<II', 70000 | 3 << 29 | 1 << 31, 70000))
+        self.assertEqual(MemscrimperWriter.to_intervals([7, 3, 4, 5, 9]), [[3, 5], [7, 7], [9, 9]])
+
+    def test_patch_header(self):
+        self.assertEqual(MemscrimperWriter.encode_patch_header(6, 0), b'\x00\x06')
+        # sz 200, rel 0x123 as the 24 bit blop sz << 12 | rel with the high bit set
+        self.assertEqual(MemscrimperWriter.encode_patch_header(0x123, 200), b'\x8c\x81\x23')
+        for rel, sz in ((6, 0), (255, 127), (256, 0), (0x123, 200), (0xFFF, 0x7FF)):
+            self.assertEqual(Util.decode(MemscrimperWriter.encode_patch_header(rel, sz))[1:], (rel, sz))
+
+    def test_diff(self):
+        old = bytes(16)
+        new = bytearray(old)
+        new[2:4] = b'\x01\x02'
+        new[10] = 7
+        for vectorize in (True, False):
+            with self.subTest(vectorize=vectorize):
+                writer = MemscrimperWriter(page_size=16)
+                writer.vectorize = vectorize and writer.vectorize
+                self.assertEqual(writer.encode_diff(old, bytes(new)),
+                                 b'\x02\x00' + b'\x01\x02\x01\x02' + b'\x00\x06\x07')
+                self.assertIsNone(writer.encode_diff(old, bytes(new), limit=2))
+                self.assertEqual(writer.encode_diff(old, old), b'\x00\x00')
+
+    def test_stored_compressor(self):
+        compressor = NoInnerBase.new_compressor()
+        self.assertEqual(compressor.compress(bytearray(b'abc')) + compressor.flush(), b'abc')